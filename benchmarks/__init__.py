@@ -0,0 +1,187 @@
+"""Micro-benchmarks of the SDK hot paths.
+
+Run all benchmarks and save machine-readable results:
+
+    python -m benchmarks -o before.json
+
+Compare results of two runs (e.g. two commits):
+
+    python -m benchmarks --compare before.json after.json
+
+Measure the memory allocated per call with tracemalloc instead of the time
+(Python 3.4+, results are compared the same way):
+
+    python -m benchmarks --memory -k api.validate_response -o before.json
+
+A benchmark is a function decorated with @benchmark returning the callable to time;
+setup done in the function body is not timed.
+"""
+import gc
+import sys
+import json
+import time
+import platform
+import subprocess
+import timeit
+
+"""Registered benchmarks: name -> setup function."""
+BENCHMARKS = {}
+
+"""Minimum time of a single repeat in seconds."""
+MIN_REPEAT_TIME = 0.2
+
+"""Calls of the benchmarked callable traced by measure_allocations()."""
+MEMORY_CALLS = 50
+
+
+def benchmark(name):
+    """Register a benchmark setup function under given name."""
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def load_benchmarks():
+    """Import all benchmark modules so they register themselves."""
+    from benchmarks import bench_signature, bench_api, bench_html  # noqa: F401
+
+
+def run_benchmark(setup, repeat=5):
+    """Time the callable returned by setup, return per-call statistics in microseconds."""
+    func = setup()
+    timer = timeit.Timer(func)
+    loops = 1
+    while timer.timeit(loops) < MIN_REPEAT_TIME:
+        loops *= 2
+
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        timings = [timer.timeit(loops) / loops * 1e6 for _ in range(repeat)]
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    if hasattr(func, 'close'):
+        func.close()
+
+    mean = sum(timings) / len(timings)
+    return {
+        'loops': loops,
+        'min_us': min(timings),
+        'mean_us': mean,
+        'stdev_us': (sum((t - mean) ** 2 for t in timings) / len(timings)) ** 0.5,
+    }
+
+
+def measure_allocations(setup, calls=MEMORY_CALLS):
+    """Trace the memory allocated by the callable returned by setup, return per-call statistics in bytes.
+
+    peak_bytes is the most memory held at once during a call above the memory held before it,
+    net_bytes what the call leaves allocated (e.g. cache entries); both are medians of the calls."""
+    import tracemalloc
+
+    func = setup()
+    # The first calls fill caches and import modules, they aren't traced.
+    for _ in range(3):
+        func()
+
+    peaks = []
+    nets = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        for _ in range(calls):
+            before = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.clear_traces()
+                before = 0
+            func()
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            nets.append(current - before)
+    finally:
+        tracemalloc.stop()
+        if gc_enabled:
+            gc.enable()
+
+    if hasattr(func, 'close'):
+        func.close()
+
+    peaks.sort()
+    nets.sort()
+    return {
+        'calls': calls,
+        'peak_bytes': peaks[len(peaks) // 2],
+        'net_bytes': nets[len(nets) // 2],
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(pattern=None, repeat=5, output=sys.stdout, memory=False):
+    """Run benchmarks whose names contain the pattern and return the results document.
+
+    The allocations of the benchmarks are measured instead of the time if memory is set."""
+    load_benchmarks()
+    results = {}
+    for name in sorted(BENCHMARKS):
+        if pattern and pattern not in name:
+            continue
+        if memory:
+            result = results[name] = measure_allocations(BENCHMARKS[name])
+            output.write('{0:<40} {1:>12} B peak  {2:>8} B net\n'.format(
+                name, result['peak_bytes'], result['net_bytes']))
+            continue
+        result = results[name] = run_benchmark(BENCHMARKS[name], repeat)
+        output.write('{0:<40} {1:>12.2f} us  (+- {2:.2f})\n'.format(name, result['min_us'], result['stdev_us']))
+
+    return {
+        'mode': 'memory' if memory else 'time',
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'time': int(time.time()),
+        'benchmarks': results,
+    }
+
+
+def compare(before, after, threshold=0.05, output=sys.stdout):
+    """Print the per-benchmark speed (or peak memory) change between two results documents."""
+    if before.get('mode') == 'memory':
+        key, unit, fmt = 'peak_bytes', '[B]', '{0:.0f}'
+    else:
+        key, unit, fmt = 'min_us', '[us]', '{0:.2f}'
+    output.write('{0:<40} {1:>12} {2:>12} {3:>9}\n'.format('benchmark', 'before ' + unit, 'after ' + unit, 'change'))
+    for name in sorted(set(before['benchmarks']) | set(after['benchmarks'])):
+        old = before['benchmarks'].get(name)
+        new = after['benchmarks'].get(name)
+        if old is None or new is None or not old[key]:
+            output.write('{0:<40} {1:>12} {2:>12}\n'.format(
+                name, '-' if old is None else fmt.format(old[key]),
+                '-' if new is None else fmt.format(new[key])))
+            continue
+
+        change = float(new[key]) / old[key] - 1
+        mark = ''
+        if change > threshold:
+            mark = ' slower' if key == 'min_us' else ' larger'
+        elif change < -threshold:
+            mark = ' faster' if key == 'min_us' else ' smaller'
+        output.write('{0:<40} {1:>12} {2:>12} {3:>+8.1%}{4}\n'.format(
+            name, fmt.format(old[key]), fmt.format(new[key]), change, mark))
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
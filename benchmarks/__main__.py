@@ -0,0 +1,31 @@
+import sys
+import json
+import argparse
+
+from benchmarks import run, compare, load_results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Rublon SDK micro-benchmarks.')
+    parser.add_argument('-k', dest='pattern', help='run only benchmarks with names containing PATTERN')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='number of timed repeats (default 5)')
+    parser.add_argument('--memory', action='store_true',
+                        help='measure the memory allocated per call with tracemalloc instead of the time')
+    parser.add_argument('-o', '--output', help='save results as JSON to OUTPUT')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='compare two saved results instead of running benchmarks')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(load_results(args.compare[0]), load_results(args.compare[1]))
+        return 0
+
+    results = run(args.pattern, args.repeat, memory=args.memory)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import json
+
+from benchmarks import benchmark
+from benchmarks.stub_server import RublonStubServer
+from rublon import Rublon2Factor
+from rublon.core.api.credentials import RublonApiCredentials
+from rublon.core.api.transport import RublonHTTPTransport, RublonMemoryTransport
+from rublon.core.api.circuit_breaker import RublonCircuitBreaker
+from rublon.core.api.metrics import RublonMetrics
+from rublon.core.api.tracing import RublonTracer, RublonSpan
+from rublon.core.api.exceptions import CircuitOpen_RublonClientException
+from rublon.core.cache import RublonMemoryCache
+from rublon.core.signature_wrapper import RublonSignatureWrapper
+
+SYSTEM_TOKEN = 'BENCHMARK'
+SECRET_KEY = 'benchmark-secret-key'
+ACCESS_TOKEN = 'a' * 100
+
+RESULT = {'userId': '42', 'profileId': 1234, 'email': 'john.doe@example.com', 'deviceId': 12345}
+RESPONSE_BODY = json.dumps({'status': 'OK', 'result': RESULT}).encode('utf-8')
+RESPONSE_HEADER = [
+    b'HTTP/1.1 200 OK\r\n',
+    b'Server: nginx\r\n',
+    b'Content-Type: application/json\r\n',
+    b'Connection: keep-alive\r\n',
+    'X-Rublon-Signature: {0}\r\n'.format(
+        RublonSignatureWrapper.sign_data(RESPONSE_BODY.decode('utf-8'), SECRET_KEY)).encode('latin-1'),
+    b'X-Rublon-API-Version: 3.7.0\r\n',
+]
+
+
+def create_client(api_server=None, transport=None):
+    consumer = Rublon2Factor(SYSTEM_TOKEN, SECRET_KEY, api_server)
+    if transport is not None:
+        consumer.set_transport(transport)
+    return RublonApiCredentials(consumer, ACCESS_TOKEN)
+
+
+@benchmark('api.sign_message')
+def bench_sign_message():
+    client = create_client()
+    client._prepare_request()
+    return lambda: client._sign_message(client.raw_post_body)
+
+
+@benchmark('api.perform_request')
+def bench_perform_request():
+    """Request building, signing and response parsing without the network."""
+    def perform_request():
+        client = create_client()
+        client._request = lambda: [RESPONSE_HEADER, RESPONSE_BODY]
+        client._perform_request()
+    return perform_request
+
+
+@benchmark('api.validate_response')
+def bench_validate_response():
+    client = create_client()
+    client._process_response([RESPONSE_HEADER, RESPONSE_BODY])
+    return client._validate_response
+
+
+@benchmark('api.process_response')
+def bench_process_response():
+    """Parsing and validating a response, e.g. for the allocations: python -m benchmarks --memory."""
+    client = create_client()
+
+    def process_response():
+        client._process_response([RESPONSE_HEADER, RESPONSE_BODY])
+        client._validate_response()
+    return process_response
+
+
+@benchmark('api.perform_memory_transport')
+def bench_perform_memory_transport():
+    """Full perform() through the transport layer, without sockets."""
+    transport = RublonMemoryTransport(SECRET_KEY).set_result(RublonApiCredentials.url_path, RESULT)
+    return lambda: create_client(transport=transport).perform()
+
+
+@benchmark('api.perform_metrics')
+def bench_perform_metrics():
+    """perform_memory_transport with the metrics recorded."""
+    transport = RublonMemoryTransport(SECRET_KEY).set_result(RublonApiCredentials.url_path, RESULT)
+    consumer = Rublon2Factor(SYSTEM_TOKEN, SECRET_KEY).set_transport(transport).set_metrics(RublonMetrics())
+    return lambda: RublonApiCredentials(consumer, ACCESS_TOKEN).perform()
+
+
+class DiscardingTracer(RublonTracer):
+    """Tracer dropping the spans, to time the tracing hooks alone."""
+
+    def start_span(self, name, parent=None, attributes=None, start_time=None):
+        return RublonSpan(name, parent, attributes, start_time)
+
+
+@benchmark('api.perform_tracing')
+def bench_perform_tracing():
+    """perform_memory_transport with the request spans started."""
+    transport = RublonMemoryTransport(SECRET_KEY).set_result(RublonApiCredentials.url_path, RESULT)
+    consumer = Rublon2Factor(SYSTEM_TOKEN, SECRET_KEY).set_transport(transport).set_tracer(DiscardingTracer())
+    return lambda: RublonApiCredentials(consumer, ACCESS_TOKEN).perform()
+
+
+class PerformRoundTrip(object):
+    """Full perform() against the local stub server."""
+
+    def __init__(self, transport=None):
+        self.server = RublonStubServer(SECRET_KEY, {RublonApiCredentials.url_path: RESULT}).start()
+        self.transport = transport
+
+    def __call__(self):
+        create_client(self.server.get_url(), self.transport).perform()
+
+    def close(self):
+        self.server.stop()
+
+
+@benchmark('api.perform_round_trip')
+def bench_perform_round_trip():
+    return PerformRoundTrip()
+
+
+@benchmark('api.perform_round_trip_http')
+def bench_perform_round_trip_http():
+    return PerformRoundTrip(RublonHTTPTransport())
+
+
+@benchmark('api.get_features_cached')
+def bench_get_features_cached():
+    """Features lookup on the page-render path, after warm-up."""
+    transport = RublonMemoryTransport(SECRET_KEY).set_result('/api/v3/getAvailableFeatures', {'features': {}})
+    consumer = Rublon2Factor(SYSTEM_TOKEN, SECRET_KEY).set_transport(transport)
+    consumer.get_features()
+    return consumer.get_features
+
+
+@benchmark('api.auth_unprotected_cached')
+def bench_auth_unprotected_cached():
+    """auth() of a user remembered as not protected by Rublon."""
+    consumer = Rublon2Factor(SYSTEM_TOKEN, SECRET_KEY).set_transport(RublonMemoryTransport(SECRET_KEY))
+    consumer.set_unprotected_users_cache(RublonMemoryCache())
+    consumer.auth('https://example.com/callback', '42', 'john.doe@example.com')
+    return lambda: consumer.auth('https://example.com/callback', '42', 'john.doe@example.com')
+
+
+@benchmark('api.perform_circuit_open')
+def bench_perform_circuit_open():
+    """perform() failing fast while the circuit breaker of the API domain is open."""
+    breaker = RublonCircuitBreaker(failure_threshold=1)
+    consumer = Rublon2Factor(SYSTEM_TOKEN, SECRET_KEY).set_transport(RublonMemoryTransport(SECRET_KEY))
+    consumer.set_circuit_breaker(breaker)
+    breaker.record(consumer.get_api_domain(), False)
+
+    def perform():
+        try:
+            RublonApiCredentials(consumer, ACCESS_TOKEN).perform()
+        except CircuitOpen_RublonClientException:
+            pass
+    return perform
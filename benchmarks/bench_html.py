@@ -0,0 +1,43 @@
+import itertools
+
+from benchmarks import benchmark
+from rublon import Rublon2Factor, Rublon2FactorGUI
+from rublon.core.html.consumer_script import RublonConsumerScript
+from rublon.core.html.button import RublonButton
+from rublon.core.html.device_widget import RublonDeviceWidget
+from rublon.core.html.share_access_widget import RublonShareAccessWidget
+
+SYSTEM_TOKEN = 'BENCHMARK'
+SECRET_KEY = 'benchmark-secret-key'
+
+
+@benchmark('html.consumer_script')
+def bench_consumer_script():
+    consumer = Rublon2Factor(SYSTEM_TOKEN, SECRET_KEY)
+    return lambda: str(RublonConsumerScript(consumer, 42, 'john.doe@example.com'))
+
+
+@benchmark('html.consumer_script_cold')
+def bench_consumer_script_cold():
+    """First render for a user: the signed parameters are not cached yet."""
+    consumer = Rublon2Factor(SYSTEM_TOKEN, SECRET_KEY)
+    user_ids = itertools.count()
+    return lambda: str(RublonConsumerScript(consumer, next(user_ids), 'john.doe@example.com'))
+
+
+@benchmark('html.user_box')
+def bench_user_box():
+    consumer = Rublon2Factor(SYSTEM_TOKEN, SECRET_KEY)
+    return lambda: Rublon2FactorGUI(consumer, user_id=42, user_email='john.doe@example.com').user_box()
+
+
+@benchmark('html.button')
+def bench_button():
+    button = RublonButton(Rublon2Factor(SYSTEM_TOKEN, SECRET_KEY)).set_attribute('class', 'login').set_label('Log in')
+    return button.__str__
+
+
+@benchmark('html.widgets')
+def bench_widgets():
+    """The iframes of the user box."""
+    return lambda: str(RublonDeviceWidget()) + str(RublonShareAccessWidget())
@@ -0,0 +1,24 @@
+import json
+
+from benchmarks import benchmark
+from rublon.functions import hash_data
+from rublon.core.signature_wrapper import RublonSignatureWrapper
+
+SECRET_KEY = 'benchmark-secret-key'
+LOGOUT_BODY = {'accessToken': 'a' * 100, 'userId': '42', 'deviceId': 12345}
+
+
+@benchmark('signature.wrap')
+def bench_wrap():
+    return lambda: RublonSignatureWrapper.wrap(SECRET_KEY, LOGOUT_BODY)
+
+
+@benchmark('signature.parse_message')
+def bench_parse_message():
+    message = json.dumps(RublonSignatureWrapper.wrap(SECRET_KEY, LOGOUT_BODY))
+    return lambda: RublonSignatureWrapper.parse_message(message, SECRET_KEY)
+
+
+@benchmark('functions.hash_data')
+def bench_hash_data():
+    return lambda: hash_data('John.Doe@Example.com', 'sha256')
@@ -0,0 +1,126 @@
+"""Concurrency benchmark: many threads performing API requests at once.
+
+Compares the HTTP/1.1 curl transport (one connection per concurrent request)
+with the multiplexing HTTP/2 transport (one connection per domain), reporting
+the connections opened by the stub server and the latency percentiles:
+
+    python -m benchmarks.concurrency -t 32 -n 50 --latency 20
+
+The HTTP/2 stub requires the `h2` package.
+"""
+import sys
+import json
+import time
+import argparse
+import itertools
+import threading
+
+from benchmarks import get_commit
+from benchmarks.stub_server import RublonStubServer
+from rublon import Rublon2Factor
+from rublon.core.api.begin_transaction import RublonAPIBeginTransaction
+from rublon.core.api.credentials import RublonApiCredentials
+from rublon.core.api.pool import RublonCurlPool
+from rublon.core.api.curl_transport import RublonCurlTransport, RublonCurlHTTP2Transport
+
+SYSTEM_TOKEN = 'BENCHMARK'
+SECRET_KEY = 'benchmark-secret-key'
+RESULTS = {
+    RublonAPIBeginTransaction.URL_PATH: {'webURI': 'https://code.rublon.com/api/v3/web/abc'},
+    RublonApiCredentials.url_path: {'userId': '42', 'profileId': 1234, 'email': 'john.doe@example.com'},
+}
+
+
+"""Numbers of the access tokens: identical credentials requests in flight would share one response."""
+_tokens = itertools.count()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def perform(consumer, i):
+    """Alternate beginTransaction and credentials requests, as during logins."""
+    if i % 2:
+        RublonApiCredentials(consumer, '{0:0>100}'.format(next(_tokens))).perform()
+    else:
+        RublonAPIBeginTransaction(consumer, 'https://example.com/callback', 'john.doe@example.com', '42', {}).perform()
+
+
+def run_scenario(server, transport, threads, requests):
+    """Perform `requests` requests in each of `threads` threads, return the statistics."""
+    consumer = Rublon2Factor(SYSTEM_TOKEN, SECRET_KEY, server.get_url()).set_transport(transport)
+    latencies = []
+    errors = []
+
+    def worker():
+        for i in range(requests):
+            start = time.time()
+            try:
+                perform(consumer, i)
+            except Exception as e:
+                errors.append(e)
+            latencies.append(time.time() - start)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.time() - start
+
+    latencies.sort()
+    return {
+        'connections': server.connections,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1e3,
+        'p99_ms': percentile(latencies, 0.99) * 1e3,
+    }
+
+
+def get_scenarios(threads, latency):
+    """Yield (name, server, transport) of each transport to compare."""
+    yield 'http1.1', RublonStubServer(SECRET_KEY, RESULTS, latency), \
+        RublonCurlTransport(pool=RublonCurlPool(max_size=threads))
+    try:
+        from benchmarks.h2_stub_server import RublonH2StubServer
+    except ImportError:
+        sys.stderr.write('h2 package not installed, skipping the HTTP/2 scenario\n')
+        return
+    yield 'http2', RublonH2StubServer(SECRET_KEY, RESULTS, latency), RublonCurlHTTP2Transport(prior_knowledge=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.concurrency', description=__doc__.split('\n')[0])
+    parser.add_argument('-t', '--threads', type=int, default=32, help='number of concurrent threads (default 32)')
+    parser.add_argument('-n', '--requests', type=int, default=50, help='requests per thread (default 50)')
+    parser.add_argument('--latency', type=float, default=20, help='stub server latency in ms (default 20)')
+    parser.add_argument('-o', '--output', help='save results as JSON to OUTPUT')
+    args = parser.parse_args(argv)
+
+    results = {}
+    sys.stdout.write('{0:<10} {1:>11} {2:>9} {3:>10} {4:>10} {5:>10}\n'.format(
+        'transport', 'connections', 'errors', 'req/s', 'p50 [ms]', 'p99 [ms]'))
+    for name, server, transport in get_scenarios(args.threads, args.latency / 1e3):
+        server.start()
+        try:
+            result = results[name] = run_scenario(server, transport, args.threads, args.requests)
+        finally:
+            transport.close()
+            server.stop()
+        sys.stdout.write('{0:<10} {1:>11} {2:>9} {3:>10.0f} {4:>10.2f} {5:>10.2f}\n'.format(
+            name, result['connections'], result['errors'], result['throughput_rps'], result['p50_ms'],
+            result['p99_ms']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'commit': get_commit(), 'threads': args.threads, 'requests': args.requests,
+                       'latency_ms': args.latency, 'scenarios': results}, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""HTTP/2 (h2c, prior knowledge) stand-in for the Rublon API. Requires the `h2` package."""
+import socket
+import threading
+
+import h2.config
+import h2.connection
+import h2.events
+
+from benchmarks.stub_server import RublonStubServer
+
+
+class RublonH2StubServer(RublonStubServer):
+    """HTTP/2 server answering every API request with a signed OK response.
+
+    Each connection is served by its own thread; responses are sent after
+    `latency` seconds without blocking the other streams of the connection."""
+
+    def __init__(self, secret_key, results=None, latency=0):
+        self.secret_key = secret_key
+        self.results = results or {}
+        self.latency = latency
+        self.connections = 0
+        self._bodies = {}
+        self._running = False
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(128)
+
+    def get_url(self):
+        return 'http://127.0.0.1:{0}'.format(self.sock.getsockname()[1])
+
+    def start(self):
+        self._running = True
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self.sock.close()
+
+    def _accept(self):
+        while self._running:
+            try:
+                client, _ = self.sock.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            thread = threading.Thread(target=self._serve, args=(client,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, client):
+        connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+        lock = threading.Lock()
+        paths = {}
+
+        def send(stream_id, path):
+            body = self.get_body(path)
+            with lock:
+                connection.send_headers(stream_id, [
+                    (':status', '200'),
+                    ('content-type', 'application/json'),
+                    ('content-length', str(len(body))),
+                    ('x-rublon-signature', self.get_signature(path)),
+                ])
+                connection.send_data(stream_id, body, end_stream=True)
+                try:
+                    client.sendall(connection.data_to_send())
+                except socket.error:
+                    pass
+
+        with lock:
+            connection.initiate_connection()
+            client.sendall(connection.data_to_send())
+
+        while self._running:
+            try:
+                data = client.recv(65536)
+            except socket.error:
+                break
+            if not data:
+                break
+
+            with lock:
+                events = connection.receive_data(data)
+                for event in events:
+                    if isinstance(event, h2.events.RequestReceived):
+                        paths[event.stream_id] = dict(event.headers)[b':path'].decode('ascii')
+                    elif isinstance(event, h2.events.DataReceived):
+                        connection.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                client.sendall(connection.data_to_send())
+
+            for event in events:
+                if isinstance(event, h2.events.StreamEnded):
+                    path = paths.pop(event.stream_id)
+                    if self.latency:
+                        threading.Timer(self.latency, send, (event.stream_id, path)).start()
+                    else:
+                        send(event.stream_id, path)
+        client.close()
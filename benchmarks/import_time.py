@@ -0,0 +1,69 @@
+"""Import time benchmark: cost of `import rublon` in a new interpreter.
+
+Runs `python -X importtime -c "import rublon"` several times and reports the median
+cumulative import time of the package and its slowest imports. Fails (exit code 1)
+if the median exceeds the budget or a module which must be loaded lazily was imported:
+
+    python -m benchmarks.import_time -n 10 --budget 60
+
+Requires Python 3.7+ for -X importtime.
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+from benchmarks import get_commit
+
+"""Default budget of the median import time in milliseconds."""
+BUDGET_MS = 60
+
+"""Modules not imported by `import rublon`, only by the first API request or widget."""
+LAZY_MODULES = ('http.client', 'ssl', 'pycurl', 'rublon.core.api.transport', 'rublon.core.api.curl_transport',
+                'rublon.core.api.policy', 'rublon.core.html')
+
+
+def measure(module='rublon'):
+    """Import the module in a new interpreter, return {imported module: cumulative time in us}."""
+    output = subprocess.check_output([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                                     stderr=subprocess.STDOUT).decode('utf-8')
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.import_time', description=__doc__.split('\n')[0])
+    parser.add_argument('-n', '--runs', type=int, default=10, help='number of imports (default 10)')
+    parser.add_argument('--budget', type=float, default=BUDGET_MS,
+                        help='maximum median import time in ms (default {0})'.format(BUDGET_MS))
+    parser.add_argument('-o', '--output', help='save results as JSON to OUTPUT')
+    args = parser.parse_args(argv)
+
+    runs = [measure() for _ in range(args.runs)]
+    totals = sorted(times['rublon'] / 1000.0 for times in runs)
+    median = totals[len(totals) // 2]
+    slowest = sorted(runs[-1].items(), key=lambda item: -item[1])[1:11]
+    lazy = sorted(name for name in runs[-1] if name in LAZY_MODULES)
+
+    sys.stdout.write('{0:<40} {1:>10.2f} ms (min {2:.2f}, budget {3:.0f})\n'.format(
+        'import rublon', median, totals[0], args.budget))
+    for name, cumulative in slowest:
+        sys.stdout.write('  {0:<38} {1:>10.2f} ms\n'.format(name, cumulative / 1000.0))
+    if lazy:
+        sys.stdout.write('imported modules which must be lazy: {0}\n'.format(', '.join(lazy)))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'commit': get_commit(), 'python': sys.version.split()[0], 'median_ms': median,
+                       'min_ms': totals[0], 'budget_ms': args.budget, 'lazy_imported': lazy}, f,
+                      indent=2, sort_keys=True)
+    return 1 if median > args.budget or lazy else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
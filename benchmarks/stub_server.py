@@ -0,0 +1,14 @@
+"""RublonStubServer of the tests (tests/stub_server.py), the local stand-in for the Rublon API.
+
+The module is loaded from its file: importing it through the tests package would
+require the RUBLON_TEST_* environment variables of the tests."""
+import os
+import importlib.util
+
+PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'stub_server.py')
+
+_spec = importlib.util.spec_from_file_location('rublon_tests_stub_server', PATH)
+_stub_server = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_stub_server)
+
+RublonStubServer = _stub_server.RublonStubServer
@@ -0,0 +1,107 @@
+"""TLS benchmark: cost of the API requests which need a new TLS connection.
+
+Every request below opens a new connection to a local HTTPS stub (as after an idle
+timeout, or when the pool has no idle connection), with and without resumption of
+shared TLS sessions; the pooled keep-alive transport is the steady-state reference.
+The stub is verified against the SDK's CA bundle plus its own certificate, so the
+cost of loading the bundle is included:
+
+    python -m benchmarks.tls -n 200
+
+Requires the openssl command to generate the stub's certificate.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks import get_commit
+from benchmarks.stub_server import RublonStubServer
+from rublon import Rublon2Factor
+from rublon.core.api.credentials import RublonApiCredentials
+from rublon.core.api.pool import RublonCurlPool
+from rublon.core.api.transport import RublonHTTPTransport, PATH_CERT
+from rublon.core.api.curl_transport import RublonCurlTransport
+
+SYSTEM_TOKEN = 'BENCHMARK'
+SECRET_KEY = 'benchmark-secret-key'
+RESULTS = {RublonApiCredentials.url_path: {'userId': '42', 'profileId': 1234, 'email': 'john.doe@example.com'}}
+
+
+def create_certificate(directory):
+    """Generate the stub's self-signed certificate, return (certificate, key, CA bundle) paths."""
+    certfile = os.path.join(directory, 'cert.pem')
+    keyfile = os.path.join(directory, 'key.pem')
+    bundle = os.path.join(directory, 'bundle.pem')
+    subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                           '-keyout', keyfile, '-out', certfile, '-subj', '/CN=127.0.0.1',
+                           '-addext', 'subjectAltName=IP:127.0.0.1'], stderr=subprocess.DEVNULL)
+    with open(bundle, 'wb') as f:
+        for path in (PATH_CERT, certfile):
+            with open(path, 'rb') as part:
+                f.write(part.read())
+    return certfile, keyfile, bundle
+
+
+def get_scenarios(bundle):
+    """Yield (name, transport) of each configuration to compare."""
+    yield 'curl new connection', RublonCurlTransport(bundle, RublonCurlPool(max_size=0, share_tls_sessions=False))
+    yield 'curl new connection, shared sessions', RublonCurlTransport(bundle, RublonCurlPool(max_size=0))
+    yield 'curl pooled connection', RublonCurlTransport(bundle, RublonCurlPool())
+    yield 'http.client new connection', RublonHTTPTransport(bundle, max_size=0, share_tls_sessions=False)
+    yield 'http.client new connection, shared sessions', RublonHTTPTransport(bundle, max_size=0)
+    yield 'http.client pooled connection', RublonHTTPTransport(bundle)
+
+
+def run_scenario(server, transport, requests):
+    consumer = Rublon2Factor(SYSTEM_TOKEN, SECRET_KEY, server.get_url()).set_transport(transport)
+    # The first request loads the CA bundle and gets the first TLS session.
+    RublonApiCredentials(consumer, 'a' * 100).perform()
+    connections, resumed = server.connections, server.resumed
+    start = time.time()
+    for _ in range(requests):
+        RublonApiCredentials(consumer, 'a' * 100).perform()
+    elapsed = time.time() - start
+    return {
+        'mean_ms': elapsed / requests * 1e3,
+        'handshakes': server.connections - connections,
+        'resumed': server.resumed - resumed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.tls', description=__doc__.split('\n')[0])
+    parser.add_argument('-n', '--requests', type=int, default=200, help='requests per scenario (default 200)')
+    parser.add_argument('-o', '--output', help='save results as JSON to OUTPUT')
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    try:
+        certfile, keyfile, bundle = create_certificate(directory)
+        results = {}
+        sys.stdout.write('{0:<45} {1:>10} {2:>11} {3:>8}\n'.format('scenario', 'mean [ms]', 'handshakes', 'resumed'))
+        for name, transport in get_scenarios(bundle):
+            server = RublonStubServer(SECRET_KEY, RESULTS, certfile=certfile, keyfile=keyfile).start()
+            try:
+                result = results[name] = run_scenario(server, transport, args.requests)
+            finally:
+                transport.close()
+                server.stop()
+            sys.stdout.write('{0:<45} {1:>10.2f} {2:>11} {3:>8}\n'.format(
+                name, result['mean_ms'], result['handshakes'], result['resumed']))
+    finally:
+        shutil.rmtree(directory)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'commit': get_commit(), 'requests': args.requests, 'scenarios': results}, f,
+                      indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
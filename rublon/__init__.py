@@ -1,18 +1,27 @@
 import six
 import json
 from abc import abstractmethod
-from rublon.functions import empty
+from rublon.functions import empty, hash_data
 from rublon.core import RublonConsumer, RublonGUI
 from rublon.core.auth_params import RublonAuthParams
 from rublon.core.signature_wrapper import RublonSignatureWrapper
 from rublon.core.api.begin_transaction import RublonAPIBeginTransaction
 from rublon.core.api.credentials import RublonApiCredentials
-from rublon.core.api.exceptions import UserNotFound_RublonAPIException
+from rublon.core.api.exceptions import UserNotFound_RublonAPIException, CircuitOpen_RublonClientException
 from rublon.exceptions import RublonException, RublonConfigurationError, RublonCallbackException
 import logging
 
-logging.basicConfig()
+
+class _RublonNullHandler(logging.Handler):
+    """logging.NullHandler for Python 2.6."""
+
+    def emit(self, record):
+        pass
+
+
 logger = logging.getLogger('rublon')
+# Logging is configured by the application, don't warn about records without handlers.
+logger.addHandler(getattr(logging, 'NullHandler', _RublonNullHandler)())
 
 
 class Rublon2Factor(RublonConsumer):
@@ -24,9 +33,15 @@ class Rublon2Factor(RublonConsumer):
     """Cached credentials."""
     cache_credentials = None
 
+    """Cache of the users known not to be protected by Rublon (RublonCache instance), disabled if None.
+
+    Use a bounded cache with a TTL, e.g. RublonMemoryCache(max_size=100000, ttl=300):
+    a user who enables Rublon is asked for the second factor after the TTL at the latest,
+    or at once if the application calls invalidate_unprotected_user()."""
+    cache_unprotected_users = None
+
     def __init__(self, *args, **kwargs):
         super(Rublon2Factor, self).__init__(*args, **kwargs)
-        self.cache_credentials = {}
         self.service_name = '2factor'
 
     def auth(self, callback_url, user_id, user_email, extra_params=None):
@@ -40,29 +55,79 @@ class Rublon2Factor(RublonConsumer):
 
         If Rublon user has deleted his Rublon account or Rublon API is not available at this time,
         method returns false. If so, just bypass Rublon and sign in the user.
+        With a circuit breaker set with bypass (see set_circuit_breaker()), None is returned
+        at once while the circuit of the API domain is open.
 
         Notice: to use this method the configurations values (system token and secret key)
         must be provided to the constructor. If not, function will raise RublonConfigurationError."""
 
-        if extra_params is None:
-            extra_params = {}
-
         if not self.is_configured():
             raise RublonConfigurationError(self.TEMPLATE_CONFIG_ERROR)
 
-        if self.get_lang():
-            extra_params['lang'] = self.get_lang()
+        if self.is_unprotected_user(user_id, user_email):
+            return None
 
         try:
-            api = RublonAPIBeginTransaction(self, callback_url, user_email, user_id, extra_params)
+            api = self._begin_transaction(callback_url, user_id, user_email, extra_params)
             api.perform()
             return api.get_web_uri()
         except UserNotFound_RublonAPIException:
             # bypass Rublon
+            self.store_unprotected_user(user_id, user_email)
+            return None
+        except CircuitOpen_RublonClientException:
+            if not self.bypass_open_circuit:
+                raise
+            # Rublon API is not available, bypass Rublon
             return None
         except RublonException:
             raise
 
+    def _begin_transaction(self, callback_url, user_id, user_email, extra_params=None):
+        """Create the BeginTransaction API request for auth(), of a configured consumer."""
+        if extra_params is None:
+            extra_params = {}
+
+        if self.get_lang():
+            extra_params['lang'] = self.get_lang()
+
+        return RublonAPIBeginTransaction(self, callback_url, user_email, user_id, extra_params)
+
+    def set_unprotected_users_cache(self, cache):
+        """Set the RublonCache instance to remember users not protected by Rublon, None to disable."""
+        self.cache_unprotected_users = cache
+        return self
+
+    def get_unprotected_user_cache_key(self, user_id, user_email):
+        return '{0}/{1}/{2}'.format(self.get_system_token(), user_id,
+                                    hash_data(user_email, RublonAPIBeginTransaction.HASH_ALG))
+
+    def is_unprotected_user(self, user_id, user_email):
+        """Check if the user is remembered as not protected by Rublon."""
+        if self.cache_unprotected_users is None or not user_email:
+            return False
+        return bool(self.cache_unprotected_users.get(self.get_unprotected_user_cache_key(user_id, user_email)))
+
+    def store_unprotected_user(self, user_id, user_email):
+        """Remember that the user is not protected by Rublon."""
+        if self.cache_unprotected_users is not None and user_email:
+            self.cache_unprotected_users.set(self.get_unprotected_user_cache_key(user_id, user_email), True)
+
+    def invalidate_unprotected_user(self, user_id, user_email):
+        """Forget that the user is not protected, call it when the user enables Rublon."""
+        if self.cache_unprotected_users is not None and user_email:
+            self.cache_unprotected_users.delete(self.get_unprotected_user_cache_key(user_id, user_email))
+
+    def get_unprotected_users_stats(self):
+        """Get statistics of the unprotected users cache, including the hit rate."""
+        if self.cache_unprotected_users is None:
+            return {}
+        stats = dict(self.cache_unprotected_users.get_stats())
+        if 'hit_rate' not in stats:
+            lookups = stats.get('hits', 0) + stats.get('misses', 0)
+            stats['hit_rate'] = float(stats.get('hits', 0)) / lookups if lookups else 0.0
+        return stats
+
     def confirm(self, callback_url, user_id, user_email, confirm_message, consumer_params=None):
         """Authenticate user and perform an additional confirmation of the transaction.
 
@@ -99,19 +164,12 @@ class Rublon2Factor(RublonConsumer):
         One-time use access token is a session identifier which will be deleted after first usage.
         This method can be called only once in authentication process."""
 
-        if self.cache_credentials.get(access_token):
-            # Log
-            return self.cache_credentials[access_token]
-        else:
-            credentials = RublonApiCredentials(self, access_token)
+        credentials = RublonApiCredentials(self, access_token)
+        if not self.load_cached_credentials(credentials, access_token):
             credentials.perform()
-            self.cache_credentials[access_token] = credentials
-            return credentials
-
-
+            self.store_cached_credentials(credentials, access_token)
+        return credentials
 
-from rublon.core.html.share_access_widget import RublonShareAccessWidget
-from rublon.core.html.device_widget import RublonDeviceWidget
 
 
 class Rublon2FactorGUI(RublonGUI):
@@ -134,6 +192,8 @@ class Rublon2FactorGUI(RublonGUI):
 
     def get_user_box_container(self, content=''):
         """Get container of the user box."""
+        from rublon.core.html.share_access_widget import RublonShareAccessWidget
+        from rublon.core.html.device_widget import RublonDeviceWidget
         return self.TEMPLATE_BOX_CONTAINER.format(
             int(self.get_rublon().is_configured()),
             int(self.get_rublon().can_user_activate()),
@@ -298,6 +358,23 @@ class RublonLogin(RublonConsumer):
 
     def auth(self, callback_url, consumer_params=None):
         """Get authentication URL."""
+        begin_login_transaction = self._begin_login_transaction(callback_url, consumer_params)
+        try:
+            begin_login_transaction.perform()
+            return begin_login_transaction.get_web_uri()
+        except UserNotFound_RublonAPIException:
+            # bypass Rublon
+            return None
+        except CircuitOpen_RublonClientException:
+            if not self.bypass_open_circuit:
+                raise
+            # Rublon API is not available, bypass Rublon
+            return None
+        except RublonException:
+            raise
+
+    def _begin_login_transaction(self, callback_url, consumer_params=None):
+        """Create the BeginLoginTransaction API request for auth()."""
         if not self.is_configured():
             raise RublonConfigurationError(self.TEMPLATE_CONFIG_ERROR)
 
@@ -307,17 +384,11 @@ class RublonLogin(RublonConsumer):
         if self.get_lang():
             consumer_params[RublonAuthParams.FIELD_LANG] = self.get_lang()
 
-        try:
-            begin_login_transaction = RublonAPIBeginLoginTransaction(self, callback_url, consumer_params)
-            begin_login_transaction.perform()
-            return begin_login_transaction.get_web_uri()
-        except UserNotFound_RublonAPIException:
-            # bypass Rublon
-            return None
-        except RublonException:
-            raise
+        return RublonAPIBeginLoginTransaction(self, callback_url, consumer_params)
 
     def get_credentials(self, access_token):
         credentials = RublonAPILoginCredentials(self, access_token)
-        credentials.perform()
+        if not self.load_cached_credentials(credentials, access_token):
+            credentials.perform()
+            self.store_cached_credentials(credentials, access_token)
         return credentials
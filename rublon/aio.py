@@ -0,0 +1,94 @@
+"""Asyncio variants of the Rublon services (Python 3.5+ only).
+
+    rublon = AsyncRublon2Factor(system_token, secret_key)
+    url = await rublon.auth(callback_url, user_id, user_email)
+"""
+from rublon import Rublon2Factor, RublonLogin
+from rublon.exceptions import RublonConfigurationError
+from rublon.core.api.aio import perform_async
+from rublon.core.api.credentials import RublonApiCredentials
+from rublon.core.api.login_credentials import RublonAPILoginCredentials
+from rublon.core.api.exceptions import UserNotFound_RublonAPIException, CircuitOpen_RublonClientException
+
+
+class AsyncRublon2Factor(Rublon2Factor):
+    """Rublon2Factor with coroutine versions of the methods calling the Rublon API.
+
+    Accepts an additional `async_transport` keyword argument, the default
+    asynchronous transport is used if not given."""
+
+    def __init__(self, *args, **kwargs):
+        self.async_transport = kwargs.pop('async_transport', None)
+        super(AsyncRublon2Factor, self).__init__(*args, **kwargs)
+
+    async def auth(self, callback_url, user_id, user_email, extra_params=None):
+        """Asynchronous version of Rublon2Factor.auth()."""
+        if not self.is_configured():
+            raise RublonConfigurationError(self.TEMPLATE_CONFIG_ERROR)
+
+        if self.is_unprotected_user(user_id, user_email):
+            return None
+
+        api = self._begin_transaction(callback_url, user_id, user_email, extra_params)
+        try:
+            await perform_async(api, self.async_transport)
+            return api.get_web_uri()
+        except UserNotFound_RublonAPIException:
+            # bypass Rublon
+            self.store_unprotected_user(user_id, user_email)
+            return None
+        except CircuitOpen_RublonClientException:
+            if not self.bypass_open_circuit:
+                raise
+            # Rublon API is not available, bypass Rublon
+            return None
+
+    async def confirm(self, callback_url, user_id, user_email, confirm_message, consumer_params=None):
+        """Asynchronous version of Rublon2Factor.confirm()."""
+        return await super(AsyncRublon2Factor, self).confirm(
+            callback_url, user_id, user_email, confirm_message, consumer_params)
+
+    async def confirm_with_buffer(self, callback_url, user_id, user_email, confirm_message, time_buffer,
+                                  consumer_params=None):
+        """Asynchronous version of Rublon2Factor.confirm_with_buffer()."""
+        return await super(AsyncRublon2Factor, self).confirm_with_buffer(
+            callback_url, user_id, user_email, confirm_message, time_buffer, consumer_params)
+
+    async def get_credentials(self, access_token):
+        """Asynchronous version of Rublon2Factor.get_credentials()."""
+        credentials = RublonApiCredentials(self, access_token)
+        if not self.load_cached_credentials(credentials, access_token):
+            await perform_async(credentials, self.async_transport)
+            self.store_cached_credentials(credentials, access_token)
+        return credentials
+
+
+class AsyncRublonLogin(RublonLogin):
+    """RublonLogin with coroutine versions of the methods calling the Rublon API."""
+
+    def __init__(self, *args, **kwargs):
+        self.async_transport = kwargs.pop('async_transport', None)
+        super(AsyncRublonLogin, self).__init__(*args, **kwargs)
+
+    async def auth(self, callback_url, consumer_params=None):
+        """Asynchronous version of RublonLogin.auth()."""
+        begin_login_transaction = self._begin_login_transaction(callback_url, consumer_params)
+        try:
+            await perform_async(begin_login_transaction, self.async_transport)
+            return begin_login_transaction.get_web_uri()
+        except UserNotFound_RublonAPIException:
+            # bypass Rublon
+            return None
+        except CircuitOpen_RublonClientException:
+            if not self.bypass_open_circuit:
+                raise
+            # Rublon API is not available, bypass Rublon
+            return None
+
+    async def get_credentials(self, access_token):
+        """Asynchronous version of RublonLogin.get_credentials()."""
+        credentials = RublonAPILoginCredentials(self, access_token)
+        if not self.load_cached_credentials(credentials, access_token):
+            await perform_async(credentials, self.async_transport)
+            self.store_cached_credentials(credentials, access_token)
+        return credentials
@@ -1,4 +1,10 @@
 from rublon.functions import empty
+from rublon.core.cache import get_shared_cache, get_or_refresh
+from rublon.core.signer import get_signer
+from rublon.core.api import RublonAPIClient
+from rublon.core.api.metrics import get_default_metrics
+from rublon.core.api.tracing import get_default_tracer
+from rublon.core.signature_wrapper import RublonSignatureWrapper
 
 
 class RublonConsumer(object):
@@ -19,6 +25,69 @@ class RublonConsumer(object):
     TEMPLATE_CONFIG_ERROR = 'Before calling Rublon authentication you have to pass the consumer\'s ' \
                             + 'system token and secret key to the Rublon class constructor.'
 
+    """Maximum number of credentials in the default credentials cache."""
+    CREDENTIALS_CACHE_SIZE = 1000
+
+    """Credentials cache time to live in seconds.
+
+    The access token is one-time use, so credentials are cached only to serve
+    repeated callback requests of the same authentication transaction."""
+    CREDENTIALS_CACHE_TTL = RublonSignatureWrapper.MESSAGE_LIFETIME
+
+    """Cache of the credentials responses (RublonCache instance).
+    The process-wide memory cache is used if not set."""
+    cache_credentials = None
+
+    """Time in seconds after which the available features are refreshed."""
+    FEATURES_CACHE_TTL = 3600
+
+    """Time in seconds for which expired features are still served while being refreshed in the background."""
+    FEATURES_STALE_TTL = 86400
+
+    """Cache of the available features (RublonCache instance).
+    The process-wide memory cache is used if not set."""
+    cache_features = None
+
+    """Maximum number of signed consumer script parameters in the default script cache."""
+    CONSUMER_SCRIPT_CACHE_SIZE = 10000
+
+    """Time in seconds for which the signed consumer script parameters are reused.
+
+    A small slice of the message lifetime: a reused message has to stay valid
+    until the browser loads the consumer script."""
+    CONSUMER_SCRIPT_CACHE_TTL = RublonSignatureWrapper.MESSAGE_LIFETIME // 10
+
+    """Cache of the signed consumer script parameters (RublonCache instance).
+    The process-wide memory cache is used if not set."""
+    cache_consumer_script = None
+
+    """Interval in seconds of the background keep-alive of the API connections,
+    shorter than the idle timeouts of the connection pools and the API server."""
+    KEEP_ALIVE_INTERVAL = 30
+
+    """HTTP transport of the API clients (RublonTransport instance).
+    The process-wide default transport is used if not set."""
+    transport = None
+
+    """Timeouts, retries and hedging of the API requests (RublonRequestPolicy instance).
+    The process-wide default policy is used if not set."""
+    policy = None
+
+    """Circuit breaker of the API domains (RublonCircuitBreaker instance), disabled if None."""
+    circuit_breaker = None
+
+    """Bypass Rublon in auth() while the circuit breaker is open, as if the user was not protected,
+    instead of raising CircuitOpen_RublonClientException."""
+    bypass_open_circuit = False
+
+    """Metrics registry of the API requests (RublonMetrics instance).
+    The process-wide default registry is used if not set, metrics are off if neither is set."""
+    metrics = None
+
+    """Tracer of the API requests (RublonTracer instance).
+    The process-wide default tracer is used if not set, tracing is off if neither is set."""
+    tracer = None
+
     def __init__(self, system_token=None, secret_key=None, api_server=None):
         self.system_token = system_token
         self.secret_key = secret_key
@@ -34,6 +103,10 @@ class RublonConsumer(object):
     def get_secret_key(self):
         return self.secret_key
 
+    def get_signer(self, hash_alg=None):
+        """Get the RublonSigner for the consumer's secret key."""
+        return get_signer(self.secret_key, hash_alg)
+
     def get_system_token(self):
         return self.system_token
 
@@ -43,6 +116,162 @@ class RublonConsumer(object):
     def is_configured(self):
         return not empty(self.system_token) and not empty(self.secret_key)
 
+    def get_transport(self):
+        """Get the RublonTransport to perform the API requests."""
+        if self.transport is None:
+            from rublon.core.api.transport import get_default_transport
+            return get_default_transport()
+        return self.transport
+
+    def set_transport(self, transport):
+        """Set the RublonTransport to perform the API requests, e.g. RublonHTTPTransport where pycurl is not available."""
+        self.transport = transport
+        return self
+
+    def get_policy(self):
+        """Get the RublonRequestPolicy of the API requests."""
+        if self.policy is None:
+            from rublon.core.api.policy import get_default_policy
+            return get_default_policy()
+        return self.policy
+
+    def set_policy(self, policy):
+        """Set the RublonRequestPolicy of the API requests, e.g. to retry failed requests."""
+        self.policy = policy
+        return self
+
+    def get_circuit_breaker(self):
+        """Get the RublonCircuitBreaker of the API requests, None if disabled."""
+        return self.circuit_breaker
+
+    def set_circuit_breaker(self, circuit_breaker, bypass=False):
+        """Set the RublonCircuitBreaker of the API requests, shared by the consumers of the same API domain.
+
+        With bypass, auth() returns None while the circuit is open, so users sign in without Rublon."""
+        self.circuit_breaker = circuit_breaker
+        self.bypass_open_circuit = bypass
+        return self
+
+    def get_metrics(self):
+        """Get the RublonMetrics registry of the API requests, None if metrics are off."""
+        if self.metrics is None:
+            return get_default_metrics()
+        return self.metrics
+
+    def set_metrics(self, metrics):
+        """Set the RublonMetrics registry of the API requests, shared by any number of consumers."""
+        self.metrics = metrics
+        return self
+
+    def get_tracer(self):
+        """Get the RublonTracer of the API requests, None if tracing is off."""
+        if self.tracer is None:
+            return get_default_tracer()
+        return self.tracer
+
+    def set_tracer(self, tracer):
+        """Set the RublonTracer receiving the spans of the API requests, e.g. RublonOpenTelemetryTracer."""
+        self.tracer = tracer
+        return self
+
+    def warm_up(self, connections=1, keep_alive=False):
+        """Prepare the worker for the first API request, e.g. at startup.
+
+        Resolves the API domain, opens (and keeps) the given number of TLS connections
+        to it with the CA bundle loaded, and prepares the request signer. With keep_alive,
+        the connections are refreshed in the background so they are never closed as idle.
+        Raises RublonTransportError if the API is not reachable."""
+        import socket
+        from six.moves.urllib.parse import urlsplit
+        from rublon.core.api.exceptions import RublonTransportError
+        self.get_signer(RublonAPIClient.HASH_ALG)
+        url = self.get_api_domain()
+        try:
+            socket.getaddrinfo(urlsplit(url).hostname, None)
+        except socket.error as e:
+            raise RublonTransportError(str(e))
+        self.get_transport().warm_up(url, RublonAPIClient.TIMEOUT, connections)
+        if keep_alive:
+            self.start_keep_alive(connections)
+        return self
+
+    def start_keep_alive(self, connections=1):
+        """Refresh the API connections in the background, once per process for a transport and API domain."""
+        from rublon.core.api.transport import start_keep_alive
+        return start_keep_alive(self.get_transport(), self.get_api_domain(), self.KEEP_ALIVE_INTERVAL,
+                                RublonAPIClient.TIMEOUT, connections)
+
+    def get_credentials_cache(self):
+        """Get the RublonCache instance to cache credentials responses."""
+        if self.cache_credentials is None:
+            self.cache_credentials = get_shared_cache('credentials', self.CREDENTIALS_CACHE_SIZE,
+                                                      self.CREDENTIALS_CACHE_TTL)
+        return self.cache_credentials
+
+    def set_credentials_cache(self, cache):
+        """Set the RublonCache instance to cache credentials responses, e.g. shared by all workers."""
+        self.cache_credentials = cache
+        return self
+
+    def get_credentials_cache_key(self, access_token):
+        return '{0}/{1}/{2}'.format(self.service_name, self.get_system_token(), access_token)
+
+    def load_cached_credentials(self, credentials, access_token):
+        """Restore the credentials API client from the cache. Returns False on a cache miss."""
+        payload = self.get_credentials_cache().get(self.get_credentials_cache_key(access_token))
+        if payload:
+            credentials.set_cache_payload(payload)
+            return True
+        return False
+
+    def store_cached_credentials(self, credentials, access_token):
+        """Store the performed credentials API client in the cache."""
+        self.get_credentials_cache().set(self.get_credentials_cache_key(access_token),
+                                         credentials.get_cache_payload())
+
+    def get_consumer_script_cache(self):
+        """Get the RublonCache instance to reuse the signed consumer script parameters."""
+        if self.cache_consumer_script is None:
+            self.cache_consumer_script = get_shared_cache('consumer_script', self.CONSUMER_SCRIPT_CACHE_SIZE,
+                                                          self.CONSUMER_SCRIPT_CACHE_TTL)
+        return self.cache_consumer_script
+
+    def set_consumer_script_cache(self, cache):
+        """Set the RublonCache instance to reuse the signed consumer script parameters."""
+        self.cache_consumer_script = cache
+        return self
+
+    def get_features_cache(self):
+        """Get the RublonCache instance to cache the available features."""
+        if self.cache_features is None:
+            self.cache_features = get_shared_cache('features', ttl=self.FEATURES_CACHE_TTL + self.FEATURES_STALE_TTL)
+        return self.cache_features
+
+    def set_features_cache(self, cache):
+        """Set the RublonCache instance to cache the available features, e.g. shared by all workers."""
+        self.cache_features = cache
+        return self
+
+    def get_features_cache_key(self):
+        return 'features/{0}/{1}'.format(self.get_system_token(), self.get_api_domain())
+
+    def get_features(self):
+        """Get the features available for the consumer, from the cache if possible.
+
+        Only the first call waits for the API; expired features are returned
+        while being refreshed in the background."""
+        return get_or_refresh(self.get_features_cache(), self.get_features_cache_key(), self.fetch_features,
+                              self.FEATURES_CACHE_TTL, self.FEATURES_STALE_TTL)
+
+    def fetch_features(self):
+        """Get the available features from the API, bypassing the cache."""
+        from rublon.core.api.features import RublonAPIGetAvailableFeatures
+        return RublonAPIGetAvailableFeatures(self).perform().get_features()
+
+    def invalidate_features(self):
+        """Remove the cached features, e.g. after the subscription has changed."""
+        self.get_features_cache().delete(self.get_features_cache_key())
+
     def can_user_activate(self):
         return False
 
@@ -55,9 +284,6 @@ class RublonConsumer(object):
         return ''
 
 
-from rublon.core.html.consumer_script import RublonConsumerScript
-
-
 class RublonGUI(object):
 
     def __init__(self, rublon_consumer, user_id=None, user_email=None, logout_listener=False):
@@ -68,6 +294,7 @@ class RublonGUI(object):
         self.logout_listener = logout_listener
 
     def get_consumer_script(self):
+        from rublon.core.html.consumer_script import RublonConsumerScript
         return str(RublonConsumerScript(self.rublon_consumer, self.user_id, self.user_email, self.logout_listener))
 
     def get_rublon(self):
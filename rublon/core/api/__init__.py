@@ -1,34 +1,46 @@
-import re
 import os
-import os.path
 import six
-import hmac
 import json
-import pycurl
+import time
 import hashlib
-if six.PY3:
-    from io import BytesIO as StringIO
-else:
-    from StringIO import StringIO
 
-from rublon.exceptions import RublonException
+from rublon.functions import json_loads
+from rublon.core.signer import get_signer
 
 import rublon.core.api.exceptions
 from rublon.core.api.exceptions import InvalidResponse_RublonClientException, EmptyResponse_RublonClientException, \
     InvalidJSON_RublonClientException, MissingField_RublonClientException, ErrorResponse_RublonClientException, \
     InvalidSignature_RublonClientException, MissingHeader_RublonClientException, RublonAPIException, \
-    RublonClientException
+    RublonClientException, CircuitOpen_RublonClientException, RublonTransportError
+from rublon.core.api.single_flight import get_default_single_flight
+from rublon.core.api.tracing import RublonRequestTrace
+
+"""Path to the pem certificates."""
+PATH_CERT = os.path.join(os.path.dirname(__file__), '..', '..', 'cert/cacert.pem')
 
 
 def make_http_header(name, value):
     return '{0}: {1}'.format(name, value)
 
 
+def to_native_string(value, encoding='utf-8'):
+    """Decode bytes into str on Python 3."""
+    if six.PY3 and isinstance(value, bytes):
+        return value.decode(encoding)
+    return value
+
+
 class RublonAPIClient(object):
 
     """Connection timeout in seconds."""
     TIMEOUT = 30
 
+    """The request only reads data, so it's safe to send it again (retries, hedged requests)."""
+    IDEMPOTENT = False
+
+    """Identical requests in flight at the same time are sent once, the other callers share its response."""
+    SINGLE_FLIGHT = False
+
     """Hash algorithm name to compute the user's email hash."""
     HASH_ALG = 'sha256'
 
@@ -64,7 +76,7 @@ class RublonAPIClient(object):
     STATUS_ERROR = 'ERROR'
 
     """Path to the pem certificates."""
-    PATH_CERT = os.path.join(os.path.dirname(__file__), '..', '..', 'cert/cacert.pem')
+    PATH_CERT = PATH_CERT
 
     def __init__(self, rublon_consumer):
         self.rublon_consumer = rublon_consumer
@@ -76,16 +88,81 @@ class RublonAPIClient(object):
         self.response_http_status = None
         self.response_http_status_code = None
         self.response_headers = {}
+        self.response_header_lines = []
+        self.raw_response_body = None
+        self.transfer_info = None
+        self.trace = None
 
     def perform(self):
-        self._perform_request()
-        try:
+        if self.SINGLE_FLIGHT:
+            self._perform_shared()
+        else:
+            self._perform_validated()
+        return self
+
+    def _perform_shared(self):
+        """Perform the request, or take the response of an identical request in flight."""
+        self._prepare_request()
+        leader = get_default_single_flight().do(self.get_request_key(), self._perform_validated)
+        if leader is not self:
+            self.set_cache_payload(leader.get_cache_payload())
+
+    def _perform_validated(self):
+        metrics = self.get_metrics()
+        tracer = self.get_tracer()
+        if metrics is None and tracer is None:
+            self._perform_request()
             self._validate_response()
-        except RublonException:
-            raise
+            return self
 
+        self.transfer_info = {}
+        if tracer is not None:
+            self.trace = RublonRequestTrace(tracer, self.url)
+        error = None
+        start = time.time()
+        try:
+            if self.trace is None:
+                self._perform_request()
+                self._validate_response()
+            else:
+                self._perform_traced()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if metrics is not None:
+                metrics.record(self.url, time.time() - start, len(self.raw_response_body or b''), error,
+                               self.transfer_info.get('reused'))
+            if self.trace is not None:
+                self.trace.finish(self, error)
+                self.trace = None
         return self
 
+    def _perform_traced(self):
+        with self.trace.phase('rublon.build_request'):
+            self._prepare_request()
+        try:
+            self._perform_request()
+        finally:
+            self.trace.add_transfer(self.transfer_info)
+        with self.trace.phase('rublon.validate_response'):
+            self._validate_response()
+
+    def get_metrics(self):
+        """Get the RublonMetrics registry of the request, None if metrics are off."""
+        return self.rublon_consumer.get_metrics()
+
+    def get_tracer(self):
+        """Get the RublonTracer of the request, None if tracing is off."""
+        return self.rublon_consumer.get_tracer()
+
+    def get_request_key(self):
+        """Get the key of identical requests: the URL and a hash of the canonical request params."""
+        params = json.dumps(self.request_params, sort_keys=True, separators=(',', ':'))
+        if six.PY3:
+            params = params.encode('utf-8')
+        return self.url + '#' + hashlib.sha256(params).hexdigest()
+
     def _validate_response(self):
         if str(self.response_http_status_code) != '200':
             raise InvalidResponse_RublonClientException(self,
@@ -93,15 +170,17 @@ class RublonAPIClient(object):
         if not self.raw_response_body:
             raise EmptyResponse_RublonClientException(self, 'Empty response body.')
         try:
-            self.response = json.loads(self.raw_response_body)
+            self.response = json_loads(self.raw_response_body)
         except ValueError:
             raise InvalidJSON_RublonClientException(self)
+        if not isinstance(self.response, dict):
+            raise InvalidJSON_RublonClientException(self)
 
         if not self.response.get(self.FIELD_STATUS):
             raise MissingField_RublonClientException(self, self.FIELD_STATUS)
 
         if self.response[self.FIELD_STATUS] == self.STATUS_OK:
-            signature = self.response_headers.get(self.HEADER_SIGNATURE)
+            signature = self.get_response_header(self.HEADER_SIGNATURE)
             if signature:
                 if self._validate_signature(signature, self.raw_response_body):
                     return True
@@ -153,84 +232,151 @@ class RublonAPIClient(object):
     def get_response(self):
         return self.response
 
+    def get_response_header(self, name):
+        """Get the value of a response header, names are case-insensitive (HTTP/2 sends them lower-case)."""
+        value = self.response_headers.get(name)
+        if value is None:
+            name = name.lower()
+            for header, header_value in self.response_headers.items():
+                if header.lower() == name:
+                    return header_value
+        return value
+
     def get_raw_response(self):
         return self.raw_response
 
+    @property
+    def raw_response_header(self):
+        """Raw header of the response, built only on demand (e.g. for debugging)."""
+        return '\r\n'.join(to_native_string(line, 'latin-1').rstrip() for line in self.response_header_lines)
+
+    @property
+    def raw_response(self):
+        """Raw response - header and body, built only on demand (e.g. for debugging)."""
+        return self.raw_response_header + '\r\n\r\n' + to_native_string(self.raw_response_body or '')
+
+    def get_cache_payload(self):
+        """Get JSON-serializable state of the validated response to store in a cache."""
+        return {
+            'status': self.response_http_status,
+            'code': self.response_http_status_code,
+            'headers': self.response_headers,
+            'body': to_native_string(self.raw_response_body),
+            'response': self.response,
+        }
+
+    def set_cache_payload(self, payload):
+        """Restore the response from a cache payload.
+
+        The payload comes from an already validated response, so it's not validated again."""
+        self.response_http_status = payload['status']
+        self.response_http_status_code = payload['code']
+        self.response_headers = payload['headers']
+        self.raw_response_body = payload['body']
+        self.response = payload['response']
+        return self
+
     def _perform_request(self):
         """Perform a request and set rawResponse field."""
+        self._prepare_request()
+        breaker = self._enter_circuit()
+        if breaker is None:
+            self._process_response(self._request())
+            return
+
+        success = False
+        start = time.time()
+        try:
+            self._process_response(self._request())
+            success = self._is_api_available()
+        finally:
+            breaker.record(self.rublon_consumer.get_api_domain(), success, time.time() - start)
+
+    def get_circuit_breaker(self):
+        """Get the RublonCircuitBreaker of the API domain, None if disabled."""
+        return self.rublon_consumer.get_circuit_breaker()
+
+    def _enter_circuit(self):
+        """Get the circuit breaker, raise CircuitOpen_RublonClientException if the request must not be sent."""
+        breaker = self.get_circuit_breaker()
+        if breaker is not None and not breaker.allow(self.rublon_consumer.get_api_domain()):
+            raise CircuitOpen_RublonClientException(
+                self, 'Rublon API at {0} is not available.'.format(self.rublon_consumer.get_api_domain()))
+        return breaker
+
+    def _is_api_available(self):
+        """Check if the received response shows the API is working (not a 5xx status code)."""
+        return not str(self.response_http_status_code).startswith('5')
+
+    def _prepare_request(self):
+        """Build the raw POST body of the request.
+
+        Override to add request params which have to be set just before sending the request."""
         if not self.raw_post_body and self.request_params is not None:
             self.raw_post_body = json.dumps(self.request_params)
 
-        response = self._request()
-        self.raw_response = ''.join(response)
-
-        self.raw_response_header = response.pop(0).strip()
-        self.raw_response_body = response.pop(0).strip()
-
-        headers = self.raw_response_header.split('\n')
-        self.response_http_status = headers.pop(0)
-        match = re.match(r'^HTTP/\d\.\d (\d+)', self.response_http_status)
-        if match is not None:
-            self.response_http_status_code = match.group(1)
-
-        for header in [h for h in headers if ':' in h]:
-            name, value = header.split(':', 1)
-            self.response_headers[name.strip()] = value.strip()
-
-    def _request(self):
-        response_buffer = StringIO()
-
-        curl = pycurl.Curl()
-        curl.setopt(pycurl.URL, self.url)
-        headers = [
+    def get_request_headers(self):
+        """Get HTTP headers of the prepared request."""
+        return [
             self.HEADER_CONTENT_TYPE,
             self.HEADER_ACCEPT,
             self.HEADER_EXPECT,
             make_http_header(self.HEADER_SIGNATURE, self._sign_message(self.raw_post_body)),
             make_http_header(self.HEADER_TECHNOLOGY, self.rublon_consumer.get_technology()),
             make_http_header(self.HEADER_API_VERSION, self.rublon_consumer.VERSION),
-            make_http_header(self.HEADER_API_VERSION_DATE, self.rublon_consumer.VERSION_DATE)
+            make_http_header(self.HEADER_API_VERSION_DATE, self.rublon_consumer.VERSION_DATE),
+            make_http_header('User-Agent', self.USER_AGENT)
         ]
-        curl.setopt(pycurl.HTTPHEADER, headers)
-        curl.setopt(pycurl.TIMEOUT, self.TIMEOUT)
-        curl.setopt(pycurl.CONNECTTIMEOUT, self.TIMEOUT)
-        curl.setopt(pycurl.HEADER, True)
-        curl.setopt(pycurl.WRITEFUNCTION, response_buffer.write)
-        curl.setopt(pycurl.USERAGENT, self.USER_AGENT)
-
-        if self.raw_post_body:
-            curl.setopt(pycurl.POST, True)
-            curl.setopt(pycurl.POSTFIELDS, self.raw_post_body)
-
-        curl.setopt(pycurl.SSL_VERIFYPEER, True)
-        curl.setopt(pycurl.SSL_VERIFYHOST, 2)
-        curl.setopt(pycurl.CAINFO, self.PATH_CERT)
-        curl.perform()
-
-        response = response_buffer.getvalue()
-        if six.PY3:
-            response = response.decode('utf-8')
 
-        error = curl.errstr()
-        if error:
-            curl.close()
-            raise RublonClientException(self, error)
-        else:
-            header_size = curl.getinfo(pycurl.HEADER_SIZE)
-            header = response[:header_size]
-            body = response[header_size:]
-            curl.close()
-            return [header, body]
+    def _process_response(self, response):
+        """Parse the [header, body] response and set response fields.
 
-    def _sign_message(self, data, secret=None):
+        Header is a list of header lines (or the raw header string), body is kept
+        as returned by the transport until it's decoded as JSON."""
+        header, body = response
+        if not isinstance(header, list):
+            header = header.strip().splitlines()
+
+        self.response_header_lines = header
+        self.raw_response_body = body.strip()
+
+        lines = iter(header)
+        self.response_http_status = to_native_string(next(lines, b'').strip(), 'latin-1')
+        status = self.response_http_status.split(None, 2)
+        if len(status) > 1 and status[0].startswith('HTTP/'):
+            self.response_http_status_code = status[1]
+
+        for line in lines:
+            line = to_native_string(line, 'latin-1')
+            if ':' in line:
+                name, value = line.split(':', 1)
+                self.response_headers[name.strip()] = value.strip()
+
+    def get_transport(self):
+        """Get the RublonTransport used to perform the request."""
+        return self.rublon_consumer.get_transport()
+
+    def get_policy(self):
+        """Get the RublonRequestPolicy with the timeouts and retries of the request."""
+        return self.rublon_consumer.get_policy()
+
+    def _request(self):
+        try:
+            return self.get_policy().request(self.get_transport(), self.url, self.get_request_headers(),
+                                             self.raw_post_body, self.TIMEOUT, self.IDEMPOTENT, self.transfer_info)
+        except RublonTransportError as e:
+            raise RublonClientException(self, e.message)
+
+    def _get_signer(self, secret=None):
         if secret is None:
-            secret = self.rublon_consumer.secret_key
-        if six.PY3:
-            data = data.encode('utf-8')
-            secret = bytes(secret, 'utf-8')
+            return self.rublon_consumer.get_signer(self.HASH_ALG)
+        return get_signer(secret, self.HASH_ALG)
 
-        return hmac.new(secret, data, getattr(hashlib, self.HASH_ALG)).hexdigest()
+    def _sign_message(self, data, secret=None):
+        if self.trace is not None:
+            with self.trace.phase('rublon.sign_message'):
+                return self._get_signer(secret).sign(data)
+        return self._get_signer(secret).sign(data)
 
     def _validate_signature(self, signature, data, secret=None):
-        check = self._sign_message(data, secret)
-        return check == signature
+        return self._get_signer(secret).verify(data, signature)
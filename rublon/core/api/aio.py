@@ -0,0 +1,273 @@
+"""Asyncio support for the Rublon API clients (Python 3.5+ only).
+
+The clients themselves are shared with the blocking API: requests are built, signed
+and validated by the same RublonAPIClient methods, only the HTTP transfer is done
+by a non-blocking transport running on the event loop.
+"""
+import ssl
+import time
+import asyncio
+import weakref
+
+from six.moves.urllib.parse import urlsplit
+
+from rublon.core.api import RublonAPIClient, make_http_header
+from rublon.core.api.exceptions import RublonClientException
+from rublon.core.api.tracing import RublonRequestTrace
+
+
+class _RublonAsyncHostPool(object):
+    """Keep-alive connections to a single host, bound to a single event loop."""
+
+    def __init__(self, max_connections):
+        self.semaphore = asyncio.Semaphore(max_connections)
+        self.idle = []
+
+    def pop_idle(self, idle_timeout):
+        now = time.time()
+        while self.idle:
+            reader, writer, released = self.idle.pop()
+            if now - released <= idle_timeout and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    def release(self, reader, writer):
+        self.idle.append((reader, writer, time.time()))
+
+
+class RublonAsyncTransport(object):
+    """Non-blocking HTTP/1.1 transport for asyncio applications.
+
+    Connections are kept alive and pooled per event loop and host. The number of
+    simultaneous connections to a host is limited, requests above the limit wait
+    for a free connection instead of opening new ones.
+    """
+
+    """Default maximum number of simultaneous connections per host."""
+    DEFAULT_MAX_CONNECTIONS = 100
+
+    """Default number of seconds after which an idle connection is closed."""
+    DEFAULT_IDLE_TIMEOUT = 60
+
+    def __init__(self, ca_info=None, max_connections=None, idle_timeout=None):
+        self.ca_info = ca_info
+        self.max_connections = self.DEFAULT_MAX_CONNECTIONS if max_connections is None else max_connections
+        self.idle_timeout = self.DEFAULT_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self._ssl_context = None
+        self._pools = weakref.WeakKeyDictionary()
+
+    def get_ssl_context(self):
+        """Get SSL context verifying the server with the CA bundle."""
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context(cafile=self.ca_info)
+        return self._ssl_context
+
+    async def request(self, url, headers, body, timeout):
+        """Send a POST request and return its [header lines, body] response."""
+        return await asyncio.wait_for(self._request(url, headers, body), timeout)
+
+    async def _request(self, url, headers, body):
+        parts = urlsplit(url)
+        secure = parts.scheme == 'https'
+        port = parts.port or (443 if secure else 80)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        host = parts.hostname if parts.port is None else '{0}:{1}'.format(parts.hostname, parts.port)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        lines = ['POST {0} HTTP/1.1'.format(path), make_http_header('Host', host),
+                 make_http_header('Content-Length', len(body or b''))] + list(headers)
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8') + (body or b'')
+
+        pool = self._get_pool(parts.hostname, port, secure)
+        async with pool.semaphore:
+            connection = pool.pop_idle(self.idle_timeout)
+            if connection is not None:
+                try:
+                    return await self._exchange(pool, connection, request)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # The server has closed the idle connection, retry on a new one.
+                    pass
+
+            connection = await asyncio.open_connection(
+                parts.hostname, port, ssl=self.get_ssl_context() if secure else None)
+            return await self._exchange(pool, connection, request)
+
+    async def _exchange(self, pool, connection, request):
+        reader, writer = connection
+        try:
+            writer.write(request)
+            await writer.drain()
+            header, body, keep_alive = await self._read_response(reader)
+        except BaseException:
+            writer.close()
+            raise
+
+        if keep_alive:
+            pool.release(reader, writer)
+        else:
+            writer.close()
+
+        return [header, body]
+
+    async def _read_response(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Connection closed by the server.')
+
+        header_lines = [status_line]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            header_lines.append(line)
+            if b':' in line:
+                name, value = line.split(b':', 1)
+                headers[name.strip().lower()] = value.strip().lower()
+
+        keep_alive = headers.get(b'connection') != b'close' and not status_line.startswith(b'HTTP/1.0')
+        if headers.get(b'transfer-encoding') == b'chunked':
+            body = await self._read_chunked(reader)
+        elif b'content-length' in headers:
+            body = await reader.readexactly(int(headers[b'content-length']))
+        else:
+            body = await reader.read()
+            keep_alive = False
+
+        return header_lines, body, keep_alive
+
+    async def _read_chunked(self, reader):
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                # Skip trailers
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    def _get_pool(self, host, port, secure):
+        loop = asyncio.get_event_loop()
+        pools = self._pools.get(loop)
+        if pools is None:
+            pools = self._pools[loop] = {}
+        key = (host, port, secure)
+        if key not in pools:
+            pools[key] = _RublonAsyncHostPool(self.max_connections)
+        return pools[key]
+
+
+_default_transport = None
+
+
+def get_default_async_transport():
+    """Get the asynchronous transport shared by all API clients of this process."""
+    global _default_transport
+    if _default_transport is None:
+        _default_transport = RublonAsyncTransport(RublonAPIClient.PATH_CERT)
+    return _default_transport
+
+
+class RublonAsyncSingleFlight(object):
+    """Asynchronous counterpart of RublonSingleFlight, coalescing identical concurrent
+    calls of the coroutines of each event loop."""
+
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key, function):
+        """Await function(), or its call of the same key in flight; return its result."""
+        loop = asyncio.get_event_loop()
+        calls = self._calls.get(loop)
+        if calls is None:
+            calls = self._calls[loop] = {}
+        task = calls.get(key)
+        if task is None:
+            # The call runs as its own task, so a cancelled caller, the first one included,
+            # doesn't cancel it for the others.
+            task = calls[key] = asyncio.ensure_future(function())
+
+            def done(task):
+                if calls.get(key) is task:
+                    del calls[key]
+                if not task.cancelled():
+                    # Don't warn about an exception never retrieved when all callers were cancelled.
+                    task.exception()
+            task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+
+_default_single_flight = RublonAsyncSingleFlight()
+
+
+async def perform_async(client, transport=None):
+    """Asynchronous counterpart of RublonAPIClient.perform()."""
+    if client.SINGLE_FLIGHT:
+        client._prepare_request()
+        leader = await _default_single_flight.do(client.get_request_key(),
+                                                 lambda: _perform_async(client, transport))
+        if leader is not client:
+            client.set_cache_payload(leader.get_cache_payload())
+        return client
+    return await _perform_async(client, transport)
+
+
+async def _perform_async(client, transport):
+    metrics = client.get_metrics()
+    tracer = client.get_tracer()
+    if metrics is None and tracer is None:
+        return await _perform_validated_async(client, transport)
+
+    if tracer is not None:
+        # The trace context is the task's, as in the blocking API it's the thread's.
+        client.trace = RublonRequestTrace(tracer, client.url)
+    error = None
+    start = time.time()
+    try:
+        return await _perform_validated_async(client, transport)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        if metrics is not None:
+            metrics.record(client.url, time.time() - start, len(client.raw_response_body or b''), error)
+        if client.trace is not None:
+            client.trace.finish(client, error)
+            client.trace = None
+
+
+async def _perform_validated_async(client, transport):
+    if transport is None:
+        transport = get_default_async_transport()
+
+    if client.trace is not None:
+        with client.trace.phase('rublon.build_request'):
+            client._prepare_request()
+    else:
+        client._prepare_request()
+    breaker = client._enter_circuit()
+    success = False
+    start = time.time()
+    try:
+        response = await transport.request(client.url, client.get_request_headers(), client.raw_post_body,
+                                           client.TIMEOUT)
+        client._process_response(response)
+        success = client._is_api_available()
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+        raise RublonClientException(client, str(e) or e.__class__.__name__)
+    finally:
+        if breaker is not None:
+            breaker.record(client.rublon_consumer.get_api_domain(), success, time.time() - start)
+
+    if client.trace is not None:
+        with client.trace.phase('rublon.validate_response'):
+            client._validate_response()
+    else:
+        client._validate_response()
+    return client
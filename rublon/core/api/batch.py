@@ -0,0 +1,146 @@
+import os
+
+import pycurl
+
+from rublon.exceptions import RublonException
+from rublon.core.api.exceptions import RublonClientException
+from rublon.core.api import PATH_CERT
+from rublon.core.api.curl_transport import setup_curl
+
+
+class RublonBatchResult(object):
+    """Result of a single API client performed by RublonBatchExecutor.
+
+    The error is the exception raised by the request or response validation, None on success."""
+
+    def __init__(self, client, error=None):
+        self.client = client
+        self.error = error
+
+
+class RublonBatchExecutor(object):
+    """Performs many API clients concurrently in one CurlMulti event loop.
+
+    At most `concurrency` transfers are in flight at once. Every client is validated
+    as soon as its transfer completes, and a failed client doesn't stop the batch.
+    Connections are kept between batches; an executor must not be shared between threads.
+    Pinned public keys work as in RublonCurlTransport.
+
+    The requests go straight to curl, bypassing the consumer's transport, request policy
+    (no retries nor hedging), circuit breaker, metrics and tracer: a batch is neither
+    counted nor traced, and it's sent even while the consumer's circuit is open."""
+
+    """Default maximum number of concurrent transfers."""
+    DEFAULT_CONCURRENCY = 20
+
+    """Seconds to wait for socket activity when curl has no timeout pending."""
+    SELECT_TIMEOUT = 0.1
+
+    def __init__(self, concurrency=None, ca_info=None, pinned_public_keys=None):
+        self.concurrency = self.DEFAULT_CONCURRENCY if concurrency is None else concurrency
+        self.ca_info = PATH_CERT if ca_info is None else ca_info
+        self.pinned_public_keys = pinned_public_keys
+        self._multi = None
+        self._handles = []
+        self._pid = None
+
+    def execute(self, clients):
+        """Perform the clients, return a list of RublonBatchResult in the order of the clients."""
+        clients = list(clients)
+        results = [None] * len(clients)
+        for index, result in self.execute_iter(clients):
+            results[index] = result
+        return results
+
+    def execute_iter(self, clients):
+        """Perform the clients, yield (index, RublonBatchResult) pairs as the transfers complete.
+
+        Clients are taken from the iterable only when there is a free transfer slot,
+        so it can be a generator of any length."""
+        multi = self._get_multi()
+        clients = enumerate(clients)
+        active = {}
+        exhausted = False
+        try:
+            while active or not exhausted:
+                while not exhausted and len(active) < self.concurrency:
+                    try:
+                        index, client = next(clients)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    try:
+                        curl, response = self._start(client)
+                    except RublonException as e:
+                        yield index, RublonBatchResult(client, e)
+                        continue
+                    multi.add_handle(curl)
+                    active[curl] = (index, client, response)
+
+                while multi.perform()[0] == pycurl.E_CALL_MULTI_PERFORM:
+                    pass
+
+                completed = False
+                while True:
+                    queued, succeeded, failed = multi.info_read()
+                    completed = completed or bool(succeeded or failed)
+                    for curl in succeeded:
+                        index, client, response = active.pop(curl)
+                        multi.remove_handle(curl)
+                        yield index, self._finish(client, curl, response)
+                    for curl, errno, message in failed:
+                        index, client, response = active.pop(curl)
+                        multi.remove_handle(curl)
+                        curl.close()
+                        yield index, RublonBatchResult(client, RublonClientException(client, message))
+                    if not queued:
+                        break
+
+                # Start the next clients in the freed slots at once, before waiting for sockets.
+                if active and (exhausted or not completed):
+                    timeout = multi.timeout()
+                    multi.select(self.SELECT_TIMEOUT if timeout < 0 else min(1.0, timeout / 1000.0))
+        finally:
+            # The consumer stopped iterating or an exception was raised: abort the remaining transfers.
+            for curl in active:
+                multi.remove_handle(curl)
+                curl.close()
+
+    def close(self):
+        """Close the connections kept between batches."""
+        if self._multi is not None and self._pid == os.getpid():
+            self._multi.close()
+            for curl in self._handles:
+                curl.close()
+        self._multi = None
+        self._handles = []
+
+    def _get_multi(self):
+        if self._multi is None or self._pid != os.getpid():
+            # Never use the parent's connections in a forked child.
+            self._multi = pycurl.CurlMulti()
+            self._multi.setopt(pycurl.M_PIPELINING, pycurl.PIPE_MULTIPLEX)
+            self._handles = []
+            self._pid = os.getpid()
+        return self._multi
+
+    def _start(self, client):
+        """Prepare the client's request on a curl handle."""
+        client._prepare_request()
+        curl = self._handles.pop() if self._handles else pycurl.Curl()
+        response = setup_curl(curl, client.url, client.get_request_headers(), client.raw_post_body,
+                              client.TIMEOUT, None, self.ca_info, self.pinned_public_keys)
+        return curl, response
+
+    def _finish(self, client, curl, response):
+        """Validate the response of a completed transfer."""
+        curl.reset()
+        self._handles.append(curl)
+        header_lines, body_chunks = response
+        try:
+            client._process_response([header_lines, b''.join(body_chunks)])
+            client._validate_response()
+        except Exception as e:
+            # Whatever the response, it fails only its own client, never the batch.
+            return RublonBatchResult(client, e)
+        return RublonBatchResult(client)
@@ -1,5 +1,8 @@
+from collections import deque
+
 from . import RublonAPIClient
-from rublon.exceptions import RublonConfigurationError
+from rublon.exceptions import RublonConfigurationError, RublonException
+from rublon.core.cache import get_shared_cache
 
 
 class RublonAPICheckUserDevice(RublonAPIClient):
@@ -9,6 +12,12 @@ class RublonAPICheckUserDevice(RublonAPIClient):
     FIELD_DEVICE_ID = 'deviceId'
     FIELD_DEVICE_STATUS = 'deviceActive'
 
+    """Read-only request, retried and hedged as set by the consumer's policy."""
+    IDEMPOTENT = True
+
+    """Identical requests in flight share one response."""
+    SINGLE_FLIGHT = True
+
     """URL path of the request."""
     url_path = '/api/v3/checkUserDevice'
 
@@ -25,11 +34,11 @@ class RublonAPICheckUserDevice(RublonAPIClient):
             self.FIELD_DEVICE_ID: device_id
         })
 
-    def perform(self):
+    def _prepare_request(self):
         self.add_request_params({
             self.FIELD_SYSTEM_TOKEN: self.rublon_consumer.get_system_token()
         })
-        return super(RublonAPICheckUserDevice, self).perform()
+        super(RublonAPICheckUserDevice, self)._prepare_request()
 
     def is_device_active(self):
         """Check if device is active."""
@@ -37,3 +46,111 @@ class RublonAPICheckUserDevice(RublonAPIClient):
             return self.response[self.FIELD_RESULT][self.FIELD_DEVICE_STATUS]
         except KeyError:
             pass
+
+
+class RublonDeviceStatus(object):
+    """Status of a single device checked by RublonBulkDeviceCheck.
+
+    Active is None if the check failed, the error is the raised exception then."""
+
+    def __init__(self, profile_id, device_id, active=None, error=None):
+        self.profile_id = profile_id
+        self.device_id = device_id
+        self.active = active
+        self.error = error
+
+    def is_device_active(self):
+        return self.active
+
+
+class RublonBulkDeviceCheck(object):
+    """Checks the status of many (profile id, device id) pairs.
+
+    The API checks one device per request, so the requests of all pairs are performed
+    concurrently by one RublonBatchExecutor (sequentially if pycurl is not available),
+    which takes the next pair from the input whenever a request completes. Identical
+    pairs are checked once and successful results are cached for a short time."""
+
+    """Maximum number of statuses in the default cache."""
+    CACHE_SIZE = 100000
+
+    """Time to live of a cached status in seconds."""
+    CACHE_TTL = 60
+
+    def __init__(self, rublon_consumer, executor=None, cache=None):
+        if not rublon_consumer.is_configured():
+            raise RublonConfigurationError(rublon_consumer.TEMPLATE_CONFIG_ERROR)
+
+        self.rublon_consumer = rublon_consumer
+        self.executor = executor
+        self.cache = cache
+
+    def get_executor(self):
+        if self.executor is None:
+            try:
+                from rublon.core.api.batch import RublonBatchExecutor
+            except ImportError:
+                return None
+            self.executor = RublonBatchExecutor()
+        return self.executor
+
+    def get_cache(self):
+        if self.cache is None:
+            self.cache = get_shared_cache('device_status', self.CACHE_SIZE, self.CACHE_TTL)
+        return self.cache
+
+    def get_cache_key(self, profile_id, device_id):
+        return '{0}/{1}/{2}'.format(self.rublon_consumer.get_system_token(), profile_id, device_id)
+
+    def check(self, pairs):
+        """Yield a RublonDeviceStatus for every distinct pair, in the order the checks complete.
+
+        The input is read as the requests complete, so it can be a generator of any length;
+        cached statuses are yielded along with the next completed check."""
+        cached = deque()
+        clients = self._get_clients(pairs, cached)
+        executor = self.get_executor()
+        if executor is None:
+            results = (self._perform(client) for client in clients)
+        else:
+            results = ((result.client, result.error) for _, result in executor.execute_iter(clients))
+
+        for client, error in results:
+            while cached:
+                yield cached.popleft()
+            yield self._get_status(client, error)
+        while cached:
+            yield cached.popleft()
+
+    def _get_clients(self, pairs, cached):
+        """Yield the API clients of the distinct pairs, add the cached statuses to `cached` instead."""
+        seen = set()
+        for pair in pairs:
+            pair = tuple(pair)
+            if pair in seen:
+                continue
+            seen.add(pair)
+
+            active = self.get_cache().get(self.get_cache_key(*pair))
+            if active is not None:
+                cached.append(RublonDeviceStatus(pair[0], pair[1], active))
+                continue
+            yield RublonAPICheckUserDevice(self.rublon_consumer, pair[0], pair[1])
+
+    def _get_status(self, client, error):
+        profile_id = client.request_params[client.FIELD_PROFILE_ID]
+        device_id = client.request_params[client.FIELD_DEVICE_ID]
+        if error is not None:
+            return RublonDeviceStatus(profile_id, device_id, error=error)
+
+        active = client.is_device_active()
+        if active is not None:
+            self.get_cache().set(self.get_cache_key(profile_id, device_id), active)
+        return RublonDeviceStatus(profile_id, device_id, active)
+
+    def _perform(self, client):
+        try:
+            client.perform()
+        except RublonException as e:
+            return client, e
+        return client, None
@@ -0,0 +1,104 @@
+import time
+import threading
+
+
+class _RublonCircuit(object):
+    """State of the circuit of one API domain."""
+
+    __slots__ = ('state', 'failures', 'opened', 'probes', 'successes')
+
+    def __init__(self):
+        self.state = RublonCircuitBreaker.STATE_CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.probes = 0
+        self.successes = 0
+
+
+class RublonCircuitBreaker(object):
+    """Circuit breaker of the API domains, shared by all threads and consumers it's set on.
+
+    After `failure_threshold` consecutive failed calls to a domain (transfer errors,
+    5xx responses or, with `slow_call_threshold`, calls slower than that many seconds)
+    its circuit opens and the API clients fail fast with CircuitOpen_RublonClientException.
+    After `recovery_timeout` seconds the circuit is half-open: up to `half_open_probes`
+    calls are let through, it closes when all of them succeed and opens again when one fails."""
+
+    STATE_CLOSED = 'closed'
+    STATE_OPEN = 'open'
+    STATE_HALF_OPEN = 'half-open'
+
+    """Default number of consecutive failures opening the circuit."""
+    DEFAULT_FAILURE_THRESHOLD = 5
+
+    """Default time in seconds after which an open circuit lets probe calls through."""
+    DEFAULT_RECOVERY_TIMEOUT = 30
+
+    def __init__(self, failure_threshold=None, recovery_timeout=None, slow_call_threshold=None, half_open_probes=1):
+        self.failure_threshold = self.DEFAULT_FAILURE_THRESHOLD if failure_threshold is None else failure_threshold
+        self.recovery_timeout = self.DEFAULT_RECOVERY_TIMEOUT if recovery_timeout is None else recovery_timeout
+        self.slow_call_threshold = slow_call_threshold
+        self.half_open_probes = half_open_probes
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def allow(self, domain):
+        """Check if a call to the domain can be made, claiming a probe of a half-open circuit."""
+        circuit = self._circuits.get(domain)
+        if circuit is None or circuit.state == self.STATE_CLOSED:
+            return True
+
+        with self._lock:
+            if circuit.state == self.STATE_OPEN:
+                if time.time() - circuit.opened < self.recovery_timeout:
+                    return False
+                circuit.state = self.STATE_HALF_OPEN
+                circuit.probes = circuit.successes = 0
+            if circuit.state == self.STATE_HALF_OPEN:
+                if circuit.probes >= self.half_open_probes:
+                    return False
+                circuit.probes += 1
+            return True
+
+    def record(self, domain, success, latency=None):
+        """Record the outcome of a call allowed by allow()."""
+        if success and self.slow_call_threshold is not None and latency is not None:
+            success = latency <= self.slow_call_threshold
+
+        circuit = self._circuits.get(domain)
+        if success and (circuit is None or (circuit.state == self.STATE_CLOSED and not circuit.failures)):
+            return
+
+        with self._lock:
+            circuit = self._circuits.get(domain)
+            if circuit is None:
+                circuit = self._circuits[domain] = _RublonCircuit()
+            if success:
+                circuit.failures = 0
+                if circuit.state == self.STATE_HALF_OPEN:
+                    circuit.successes += 1
+                    if circuit.successes >= self.half_open_probes:
+                        circuit.state = self.STATE_CLOSED
+                return
+
+            circuit.failures += 1
+            if circuit.state == self.STATE_HALF_OPEN or circuit.failures >= self.failure_threshold:
+                circuit.state = self.STATE_OPEN
+                circuit.opened = time.time()
+
+    def get_state(self, domain):
+        """Get the state of the domain's circuit: STATE_CLOSED, STATE_OPEN or STATE_HALF_OPEN."""
+        circuit = self._circuits.get(domain)
+        if circuit is None:
+            return self.STATE_CLOSED
+        if circuit.state == self.STATE_OPEN and time.time() - circuit.opened >= self.recovery_timeout:
+            return self.STATE_HALF_OPEN
+        return circuit.state
+
+    def reset(self, domain=None):
+        """Close the domain's circuit, all circuits if no domain is given."""
+        with self._lock:
+            if domain is None:
+                self._circuits.clear()
+            else:
+                self._circuits.pop(domain, None)
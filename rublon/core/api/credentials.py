@@ -27,6 +27,10 @@ class RublonApiCredentials(RublonAPIClient):
     """User pressed the "No" button on the additional confirmation of the transaction."""
     CONFIRM_RESULT_NO = 'false'
 
+    """The access token is one-time use, so concurrent requests with the same token
+    (e.g. a double-submitted callback) have to share one response."""
+    SINGLE_FLIGHT = True
+
     """URL path of the request."""
     url_path = '/api/v3/credentials'
 
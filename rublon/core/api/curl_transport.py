@@ -0,0 +1,349 @@
+import os
+import math
+import time
+import select
+import socket
+import threading
+
+import pycurl
+
+from six.moves.urllib.parse import urlsplit
+
+from rublon.core.api.pool import get_default_pool
+from rublon.core.api.transport import RublonTransport, RublonTransportError, RublonConnectError, PATH_CERT
+
+
+def setup_curl(curl, url, headers, body, timeout, connect_timeout, ca_info, pinned_public_keys=None,
+               read_timeout=None):
+    """Set the options of a POST transfer on a curl handle.
+
+    Timeouts are in seconds; the read timeout aborts the transfer if no data arrives
+    for that long. Returns the [header lines, body chunks] lists filled during the transfer."""
+    header_lines = []
+    body_chunks = []
+
+    def header_function(line):
+        if line.startswith(b'HTTP/'):
+            # Status line of a new response (e.g. after a redirect), forget the previous one.
+            del header_lines[:]
+        if line.strip():
+            header_lines.append(line)
+
+    curl.setopt(pycurl.URL, url)
+    curl.setopt(pycurl.HTTPHEADER, headers)
+    curl.setopt(pycurl.TIMEOUT_MS, int(timeout * 1000))
+    curl.setopt(pycurl.CONNECTTIMEOUT_MS, int(min(connect_timeout or timeout, timeout) * 1000))
+    if read_timeout:
+        # libcurl has no read timeout: abort if slower than 1 byte/s for that many (whole) seconds.
+        curl.setopt(pycurl.LOW_SPEED_LIMIT, 1)
+        curl.setopt(pycurl.LOW_SPEED_TIME, max(1, int(math.ceil(read_timeout))))
+    curl.setopt(pycurl.HEADERFUNCTION, header_function)
+    curl.setopt(pycurl.WRITEFUNCTION, body_chunks.append)
+
+    if body:
+        curl.setopt(pycurl.POST, True)
+        curl.setopt(pycurl.POSTFIELDS, body)
+
+    curl.setopt(pycurl.SSL_VERIFYPEER, True)
+    curl.setopt(pycurl.SSL_VERIFYHOST, 2)
+    curl.setopt(pycurl.CAINFO, ca_info)
+    if pinned_public_keys:
+        curl.setopt(pycurl.PINNEDPUBLICKEY, ';'.join(pinned_public_keys))
+    return [header_lines, body_chunks]
+
+
+def setup_curl_warm_up(curl, url, timeout, ca_info, pinned_public_keys=None):
+    """Set the options of a HEAD request to the URL's host, made only to open the connection."""
+    curl.setopt(pycurl.URL, get_url_domain(url) + '/')
+    curl.setopt(pycurl.NOBODY, True)
+    curl.setopt(pycurl.TIMEOUT_MS, int(timeout * 1000))
+    curl.setopt(pycurl.CONNECTTIMEOUT_MS, int(timeout * 1000))
+    curl.setopt(pycurl.HEADERFUNCTION, len)
+    curl.setopt(pycurl.WRITEFUNCTION, len)
+    curl.setopt(pycurl.SSL_VERIFYPEER, True)
+    curl.setopt(pycurl.SSL_VERIFYHOST, 2)
+    curl.setopt(pycurl.CAINFO, ca_info)
+    if pinned_public_keys:
+        curl.setopt(pycurl.PINNEDPUBLICKEY, ';'.join(pinned_public_keys))
+
+
+def get_transfer_error(curl, message, prev=None):
+    """Get the RublonTransportError of a failed transfer: RublonConnectError if the
+    transfer failed before the request was sent (DNS, TCP or TLS handshake)."""
+    if curl.getinfo(pycurl.REQUEST_SIZE) == 0:
+        return RublonConnectError(message, RublonTransportError.CODE_CURL_ERROR, prev)
+    return RublonTransportError(message, RublonTransportError.CODE_CURL_ERROR, prev)
+
+
+"""Timings of the transfer phases in the info dict of RublonTransport.request(): name -> getinfo() option."""
+TRANSFER_TIMINGS = {
+    'namelookup': pycurl.NAMELOOKUP_TIME,
+    'connect': pycurl.CONNECT_TIME,
+    'appconnect': pycurl.APPCONNECT_TIME,
+    'pretransfer': pycurl.PRETRANSFER_TIME,
+    'starttransfer': pycurl.STARTTRANSFER_TIME,
+    'total': pycurl.TOTAL_TIME,
+}
+
+
+def set_transfer_info(curl, info):
+    """Fill in the info dict of RublonTransport.request() from a finished transfer."""
+    if info is not None:
+        info['reused'] = curl.getinfo(pycurl.NUM_CONNECTS) == 0
+        info['timings'] = dict((name, curl.getinfo(option)) for name, option in TRANSFER_TIMINGS.items())
+
+
+def get_url_domain(url):
+    parts = urlsplit(url)
+    return parts.scheme + '://' + parts.netloc
+
+
+class RublonCurlTransport(RublonTransport):
+    """Transport built on pycurl, reusing keep-alive handles from a RublonCurlPool.
+
+    libcurl keeps the parsed CA bundle for the life of a handle, so with pooled handles
+    it's loaded once per handle rather than per request. Pinned public keys are
+    "sha256//<base64 digest>" strings, the connection fails unless the server's key is one of them."""
+
+    def __init__(self, ca_info=None, pool=None, pinned_public_keys=None):
+        self.ca_info = PATH_CERT if ca_info is None else ca_info
+        self.pool = pool
+        self.pinned_public_keys = pinned_public_keys
+
+    def get_pool(self):
+        """Get the pool of curl handles, the process-wide default pool if not set."""
+        return self.pool if self.pool is not None else get_default_pool()
+
+    def request(self, url, headers, body, timeout, connect_timeout=None, read_timeout=None, info=None):
+        domain = get_url_domain(url)
+        pool = self.get_pool()
+        curl = pool.acquire(domain, self.ca_info)
+        header_lines, body_chunks = setup_curl(curl, url, headers, body, timeout, connect_timeout, self.ca_info,
+                                               self.pinned_public_keys, read_timeout)
+        if info is not None:
+            info['start'] = time.time()
+        try:
+            curl.perform()
+        except pycurl.error as e:
+            error = get_transfer_error(curl, e.args[-1] if e.args else str(e), e)
+            pool.discard(curl)
+            raise error
+
+        error = curl.errstr()
+        if error:
+            error = get_transfer_error(curl, error)
+            pool.discard(curl)
+            raise error
+
+        set_transfer_info(curl, info)
+        pool.release(domain, self.ca_info, curl)
+        # A single chunk is returned as is, without copying.
+        return [header_lines, b''.join(body_chunks)]
+
+    def warm_up(self, url, timeout, connections=1):
+        domain = get_url_domain(url)
+        pool = self.get_pool()
+        # Idle handles count towards the number and get their connections refreshed.
+        handles = [pool.acquire(domain, self.ca_info) for _ in range(connections)]
+        error = None
+        for curl in handles:
+            setup_curl_warm_up(curl, url, timeout, self.ca_info, self.pinned_public_keys)
+            try:
+                curl.perform()
+            except pycurl.error as e:
+                error = get_transfer_error(curl, e.args[-1] if e.args else str(e), e)
+                pool.discard(curl)
+            else:
+                pool.release(domain, self.ca_info, curl)
+        if error is not None:
+            raise error
+
+    def close(self):
+        self.get_pool().clear()
+
+
+class _RublonTransfer(object):
+    """Request submitted to the RublonCurlHTTP2Transport driver thread."""
+
+    def __init__(self, curl, response):
+        self.curl = curl
+        self.response = response
+        self.error = None
+        self.done = threading.Event()
+
+
+class RublonCurlHTTP2Transport(RublonTransport):
+    """Transport multiplexing concurrent requests over HTTP/2 connections.
+
+    Requests from all threads are driven by one CurlMulti in a background thread,
+    so concurrent requests to the same API domain become streams of a single
+    connection instead of opening a connection each. Servers without HTTP/2
+    are talked to over HTTP/1.1, with at most `max_host_connections` connections.
+
+    Set `prior_knowledge` to speak HTTP/2 over plain http:// URLs (h2c),
+    e.g. to a local stand-in of the API. The CA bundle is loaded once, for the CurlMulti;
+    pinned public keys work as in RublonCurlTransport."""
+
+    """Default maximum number of connections per API domain."""
+    DEFAULT_MAX_HOST_CONNECTIONS = 4
+
+    def __init__(self, ca_info=None, max_host_connections=None, prior_knowledge=False, pinned_public_keys=None):
+        self.ca_info = PATH_CERT if ca_info is None else ca_info
+        self.pinned_public_keys = pinned_public_keys
+        self.max_host_connections = self.DEFAULT_MAX_HOST_CONNECTIONS if max_host_connections is None \
+            else max_host_connections
+        self.prior_knowledge = prior_knowledge
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._thread = None
+        self._pending = []
+        self._handles = []
+        self._connects = 0
+
+    def request(self, url, headers, body, timeout, connect_timeout=None, read_timeout=None, info=None):
+        curl = self._acquire_handle()
+        response = setup_curl(curl, url, headers, body, timeout, connect_timeout, self.ca_info,
+                              self.pinned_public_keys, read_timeout)
+        curl.setopt(pycurl.HTTP_VERSION, pycurl.CURL_HTTP_VERSION_2_PRIOR_KNOWLEDGE if self.prior_knowledge
+                    else pycurl.CURL_HTTP_VERSION_2TLS)
+        # Wait for the connection in progress to find out if it can multiplex, instead of opening another one.
+        curl.setopt(pycurl.PIPEWAIT, 1)
+
+        transfer = _RublonTransfer(curl, response)
+        if info is not None:
+            info['start'] = time.time()
+        self._submit(transfer)
+        transfer.done.wait()
+
+        if transfer.error is not None:
+            curl.close()
+            raise transfer.error
+
+        set_transfer_info(curl, info)
+        self._release_handle(curl)
+        header_lines, body_chunks = response
+        return [header_lines, b''.join(body_chunks)]
+
+    def warm_up(self, url, timeout, connections=1):
+        # Requests are multiplexed over one connection, more are not needed.
+        curl = self._acquire_handle()
+        setup_curl_warm_up(curl, url, timeout, self.ca_info, self.pinned_public_keys)
+        curl.setopt(pycurl.HTTP_VERSION, pycurl.CURL_HTTP_VERSION_2_PRIOR_KNOWLEDGE if self.prior_knowledge
+                    else pycurl.CURL_HTTP_VERSION_2TLS)
+        transfer = _RublonTransfer(curl, None)
+        self._submit(transfer)
+        transfer.done.wait()
+        if transfer.error is not None:
+            curl.close()
+            raise transfer.error
+        self._release_handle(curl)
+
+    def get_connections_count(self):
+        """Number of connections opened so far by this transport."""
+        return self._connects
+
+    def close(self):
+        self._check_fork()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._running = False
+            self._wake()
+            thread.join()
+            self._wake_reader.close()
+            self._wake_writer.close()
+
+    def _check_fork(self):
+        """Forget the parent's driver thread and handles in a forked child."""
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._thread = None
+            self._pending = []
+            self._handles = []
+            self._pid = os.getpid()
+
+    def _start(self):
+        self._multi = pycurl.CurlMulti()
+        self._multi.setopt(pycurl.M_PIPELINING, pycurl.PIPE_MULTIPLEX)
+        self._multi.setopt(pycurl.M_MAX_HOST_CONNECTIONS, self.max_host_connections)
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._wake_writer.setblocking(False)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='RublonCurlHTTP2Transport')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _submit(self, transfer):
+        with self._lock:
+            if self._thread is None:
+                self._start()
+            self._pending.append(transfer)
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_writer.send(b'\0')
+        except socket.error:
+            pass
+
+    def _acquire_handle(self):
+        self._check_fork()
+        with self._lock:
+            if self._handles:
+                return self._handles.pop()
+        return pycurl.Curl()
+
+    def _release_handle(self, curl):
+        curl.reset()
+        with self._lock:
+            self._handles.append(curl)
+
+    def _run(self):
+        multi = self._multi
+        transfers = {}
+        while self._running:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            for transfer in pending:
+                transfers[transfer.curl] = transfer
+                multi.add_handle(transfer.curl)
+
+            while multi.perform()[0] == pycurl.E_CALL_MULTI_PERFORM:
+                pass
+
+            while True:
+                queued, succeeded, failed = multi.info_read()
+                for curl in succeeded:
+                    self._finish(multi, transfers.pop(curl), None)
+                for curl, errno, message in failed:
+                    self._finish(multi, transfers.pop(curl), get_transfer_error(curl, message))
+                if not queued:
+                    break
+
+            read, write, error = multi.fdset()
+            timeout = multi.timeout()
+            if timeout < 0:
+                timeout = 1000
+            try:
+                ready = select.select(read + [self._wake_reader], write, error, timeout / 1000.0)[0]
+            except (select.error, ValueError):
+                continue
+            if self._wake_reader in ready:
+                try:
+                    while self._wake_reader.recv(4096):
+                        pass
+                except socket.error:
+                    pass
+
+        for curl, transfer in transfers.items():
+            multi.remove_handle(curl)
+            transfer.error = RublonTransportError('Transport closed.', RublonTransportError.CODE_CURL_ERROR)
+            transfer.done.set()
+        multi.close()
+
+    def _finish(self, multi, transfer, error):
+        self._connects += transfer.curl.getinfo(pycurl.NUM_CONNECTS)
+        multi.remove_handle(transfer.curl)
+        transfer.error = error
+        transfer.done.set()
@@ -4,6 +4,17 @@ from rublon.exceptions import RublonException
 """Client exceptions"""
 
 
+class RublonTransportError(RublonException):
+    """HTTP transfer failed: connection error, timeout, ..."""
+
+    def __init__(self, message='', code=RublonException.CODE_CONNECTION_ERROR, prev=None):
+        super(RublonTransportError, self).__init__(message, code, prev)
+
+
+class RublonConnectError(RublonTransportError):
+    """Connection to the API could not be established, so the request was not sent."""
+
+
 class RublonClientException(RublonException):
     def __init__(self, client, message=None):
         super(RublonClientException, self).__init__(message)
@@ -14,6 +25,11 @@ class RublonClientResponseException(RublonClientException):
     pass
 
 
+class CircuitOpen_RublonClientException(RublonClientException):
+    """The circuit breaker of the API domain is open, the request was not sent."""
+    pass
+
+
 class InvalidSignature_RublonClientException(RublonClientResponseException):
     pass
 
@@ -14,6 +14,12 @@ class RublonAPIGetAvailableFeatures(RublonAPIClient):
     FEATURE_IDENTITY_PROVIDING = 'accessControlManager'
     FEATURE_REMOTE_LOGOUT = 'remoteLogout'
 
+    """Read-only request, retried and hedged as set by the consumer's policy."""
+    IDEMPOTENT = True
+
+    """Identical requests in flight share one response."""
+    SINGLE_FLIGHT = True
+
     """URL path of the request."""
     url_path = '/api/v3/getAvailableFeatures'
 
@@ -25,11 +31,11 @@ class RublonAPIGetAvailableFeatures(RublonAPIClient):
 
         self.set_request_url(rublon_consumer.get_api_domain() + self.url_path)
 
-    def perform(self):
+    def _prepare_request(self):
         self.add_request_params({
             self.FIELD_SYSTEM_TOKEN: self.rublon_consumer.get_system_token()
         })
-        return super(RublonAPIGetAvailableFeatures, self).perform()
+        super(RublonAPIGetAvailableFeatures, self)._prepare_request()
 
     def get_features(self):
         try:
@@ -17,6 +17,10 @@ class RublonAPILoginCredentials(RublonAPIClient):
     """Field name for device ID."""
     FIELD_DEVICE_ID = 'deviceId'
 
+    """The access token is one-time use, so concurrent requests with the same token
+    (e.g. a double-submitted callback) have to share one response."""
+    SINGLE_FLIGHT = True
+
     """URL path of the request."""
     url_path = '/api/v3/loginCredentials'
 
@@ -0,0 +1,264 @@
+import bisect
+import threading
+
+
+def get_endpoint(url):
+    """Get the endpoint of an API request URL: its path, e.g. /api/v3/credentials."""
+    start = url.find('/', url.find('//') + 2)
+    if start < 0:
+        return '/'
+    end = len(url)
+    for separator in '?#':
+        position = url.find(separator, start)
+        if 0 <= position < end:
+            end = position
+    return url[start:end]
+
+
+class _RublonEndpointMetrics(object):
+    """Counters of the requests to one endpoint."""
+
+    __slots__ = ('requests', 'latency_buckets', 'latency_sum', 'response_size_sum', 'errors', 'reused', 'connects')
+
+    def __init__(self, buckets):
+        self.requests = 0
+        self.latency_buckets = [0] * (len(buckets) + 1)
+        self.latency_sum = 0.0
+        self.response_size_sum = 0
+        self.errors = {}
+        self.reused = 0
+        self.connects = 0
+
+
+class RublonMetrics(object):
+    """Thread-safe registry of the API request metrics, per endpoint (URL path).
+
+    Counts the requests, the errors by exception class and the requests sent on a new
+    or a reused connection (when the transport tells), and sums up the latencies, in a
+    histogram, and the response sizes. Every recorded request is passed on to the
+    exporters, e.g. RublonStatsDExporter; get_prometheus_text() returns the metrics
+    in the Prometheus text format, served by start_prometheus_server().
+
+    Metrics are off unless a registry is set on the consumer or as the process-wide
+    default, the API clients then don't measure anything."""
+
+    """Default upper bounds of the latency histogram buckets in seconds."""
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    """Prefix of the Prometheus metric names."""
+    PROMETHEUS_PREFIX = 'rublon_api_'
+
+    def __init__(self, buckets=None, exporters=None):
+        self.buckets = tuple(sorted(self.DEFAULT_BUCKETS if buckets is None else buckets))
+        self.exporters = list(exporters or [])
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def add_exporter(self, exporter):
+        """Pass the recorded requests on to the exporter: exporter.record(endpoint, latency, ...)."""
+        self.exporters.append(exporter)
+        return self
+
+    def record(self, url, latency, response_size=None, error=None, reused=None):
+        """Record a request to the URL which took `latency` seconds.
+
+        Error is the exception raised by the request, reused tells if it was sent
+        on an already open connection (None if unknown)."""
+        endpoint = get_endpoint(url)
+        error_name = None if error is None else error.__class__.__name__
+        with self._lock:
+            metrics = self._endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self._endpoints[endpoint] = _RublonEndpointMetrics(self.buckets)
+            metrics.requests += 1
+            metrics.latency_buckets[bisect.bisect_left(self.buckets, latency)] += 1
+            metrics.latency_sum += latency
+            if response_size:
+                metrics.response_size_sum += response_size
+            if error_name is not None:
+                metrics.errors[error_name] = metrics.errors.get(error_name, 0) + 1
+            if reused is not None:
+                if reused:
+                    metrics.reused += 1
+                else:
+                    metrics.connects += 1
+
+        for exporter in self.exporters:
+            exporter.record(endpoint, latency, response_size, error_name, reused)
+
+    def get_snapshot(self):
+        """Get the metrics as {endpoint: dict of the counters}, the latency buckets are cumulative."""
+        snapshot = {}
+        with self._lock:
+            for endpoint, metrics in self._endpoints.items():
+                cumulative = []
+                count = 0
+                for bucket in metrics.latency_buckets:
+                    count += bucket
+                    cumulative.append(count)
+                snapshot[endpoint] = {
+                    'requests': metrics.requests,
+                    'latency_buckets': list(zip(self.buckets + (float('inf'),), cumulative)),
+                    'latency_sum': metrics.latency_sum,
+                    'response_size_sum': metrics.response_size_sum,
+                    'errors': dict(metrics.errors),
+                    'reused': metrics.reused,
+                    'connects': metrics.connects,
+                }
+        return snapshot
+
+    def get_connection_reuse_ratio(self, endpoint=None):
+        """Get the fraction of the requests sent on a reused connection, None if unknown."""
+        reused = connects = 0
+        with self._lock:
+            for name, metrics in self._endpoints.items():
+                if endpoint is None or name == endpoint:
+                    reused += metrics.reused
+                    connects += metrics.connects
+        if not reused + connects:
+            return None
+        return float(reused) / (reused + connects)
+
+    def reset(self):
+        """Forget all recorded requests."""
+        with self._lock:
+            self._endpoints.clear()
+
+    def get_prometheus_text(self):
+        """Get the metrics in the Prometheus text exposition format (version 0.0.4)."""
+        prefix = self.PROMETHEUS_PREFIX
+        snapshot = sorted(self.get_snapshot().items())
+        lines = [
+            '# HELP {0}requests_total API requests.'.format(prefix),
+            '# TYPE {0}requests_total counter'.format(prefix),
+        ]
+        for endpoint, metrics in snapshot:
+            lines.append('{0}requests_total{{endpoint="{1}"}} {2}'.format(
+                prefix, escape_label(endpoint), metrics['requests']))
+
+        lines.append('# HELP {0}request_duration_seconds API request latency.'.format(prefix))
+        lines.append('# TYPE {0}request_duration_seconds histogram'.format(prefix))
+        for endpoint, metrics in snapshot:
+            label = escape_label(endpoint)
+            for bound, count in metrics['latency_buckets']:
+                lines.append('{0}request_duration_seconds_bucket{{endpoint="{1}",le="{2}"}} {3}'.format(
+                    prefix, label, '+Inf' if bound == float('inf') else repr(float(bound)), count))
+            lines.append('{0}request_duration_seconds_sum{{endpoint="{1}"}} {2!r}'.format(
+                prefix, label, metrics['latency_sum']))
+            lines.append('{0}request_duration_seconds_count{{endpoint="{1}"}} {2}'.format(
+                prefix, label, metrics['requests']))
+
+        lines.append('# HELP {0}response_size_bytes API response body sizes.'.format(prefix))
+        lines.append('# TYPE {0}response_size_bytes summary'.format(prefix))
+        for endpoint, metrics in snapshot:
+            label = escape_label(endpoint)
+            lines.append('{0}response_size_bytes_sum{{endpoint="{1}"}} {2}'.format(
+                prefix, label, metrics['response_size_sum']))
+            lines.append('{0}response_size_bytes_count{{endpoint="{1}"}} {2}'.format(
+                prefix, label, metrics['requests']))
+
+        lines.append('# HELP {0}errors_total Failed API requests by exception class.'.format(prefix))
+        lines.append('# TYPE {0}errors_total counter'.format(prefix))
+        for endpoint, metrics in snapshot:
+            for name, count in sorted(metrics['errors'].items()):
+                lines.append('{0}errors_total{{endpoint="{1}",exception="{2}"}} {3}'.format(
+                    prefix, escape_label(endpoint), escape_label(name), count))
+
+        lines.append('# HELP {0}connections_total API requests by new or reused connection.'.format(prefix))
+        lines.append('# TYPE {0}connections_total counter'.format(prefix))
+        for endpoint, metrics in snapshot:
+            label = escape_label(endpoint)
+            lines.append('{0}connections_total{{endpoint="{1}",reused="true"}} {2}'.format(
+                prefix, label, metrics['reused']))
+            lines.append('{0}connections_total{{endpoint="{1}",reused="false"}} {2}'.format(
+                prefix, label, metrics['connects']))
+
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    """Escape a Prometheus label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RublonStatsDExporter(object):
+    """Sends the recorded requests to a StatsD server over UDP.
+
+    Each request is sent in one datagram from a non-blocking socket, datagrams which
+    can't be sent at once are dropped, so a slow or missing server never delays the
+    API requests. Metric names are `<prefix>.<endpoint path with dots>.<metric>`, e.g.
+    rublon.api.v3.credentials.latency."""
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='rublon'):
+        import socket
+        family, _, _, _, address = socket.getaddrinfo(host, port, 0, socket.SOCK_DGRAM)[0]
+        self.address = address
+        self.prefix = prefix
+        self._names = {}
+        self._socket = socket.socket(family, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def record(self, endpoint, latency, response_size, error, reused):
+        name = self._names.get(endpoint)
+        if name is None:
+            name = self._names[endpoint] = '.'.join([self.prefix] + [part for part in endpoint.split('/') if part])
+
+        lines = ['{0}.requests:1|c'.format(name), '{0}.latency:{1:.3f}|ms'.format(name, latency * 1000)]
+        if response_size is not None:
+            lines.append('{0}.response_size:{1}|h'.format(name, response_size))
+        if error is not None:
+            lines.append('{0}.errors.{1}:1|c'.format(name, error))
+        if reused is not None:
+            lines.append('{0}.connections.{1}:1|c'.format(name, 'reused' if reused else 'new'))
+
+        try:
+            self._socket.sendto('\n'.join(lines).encode('utf-8'), self.address)
+        except (IOError, OSError):
+            # Full socket buffer or unreachable server: metrics are best effort.
+            pass
+
+    def close(self):
+        self._socket.close()
+
+
+def start_prometheus_server(metrics, port, addr=''):
+    """Serve the metrics to Prometheus over HTTP from a background thread, return the server.
+
+    Stop it with server.shutdown()."""
+    from six.moves import BaseHTTPServer, socketserver
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            body = metrics.get_prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+        daemon_threads = True
+
+    server = Server((addr, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, name='RublonPrometheusServer')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+_default_metrics = None
+
+
+def get_default_metrics():
+    """Get the metrics registry of all consumers without a configured one, None if metrics are off."""
+    return _default_metrics
+
+
+def set_default_metrics(metrics):
+    """Set the metrics registry of all consumers without a configured one, None to turn metrics off."""
+    global _default_metrics
+    _default_metrics = metrics
@@ -26,7 +26,7 @@ class RublonAPINotification(RublonAPIClient):
 
         self.set_request_url(rublon_consumer.get_api_domain() + self.url_path)
 
-    def perform(self):
+    def _prepare_request(self):
         self.add_request_params({
             self.FIELD_SYSTEM_TOKEN: self.rublon_consumer.get_system_token(),
             self.FIELD_NOTIFICATION_CHANNEL: self.notification_channel,
@@ -34,7 +34,7 @@ class RublonAPINotification(RublonAPIClient):
             self.FIELD_NOTIFICATION_URL: self.notification_url,
             self.FIELD_NOTIFICATION_TYPE: self.notification_type
         })
-        return super(RublonAPINotification, self).perform()
+        super(RublonAPINotification, self)._prepare_request()
 
     def set_notification_channel(self, channel):
         self.notification_channel = channel
@@ -0,0 +1,207 @@
+import time
+import random
+import threading
+from collections import deque
+
+from six.moves import queue
+from six.moves.urllib.parse import urlsplit
+
+from rublon.core.api.exceptions import RublonTransportError, RublonConnectError
+
+
+def get_status_code(response):
+    """Get the HTTP status code of a [header lines, body] response, None if unknown."""
+    header_lines = response[0]
+    if not header_lines:
+        return None
+    status = header_lines[0]
+    if isinstance(status, bytes):
+        status = status.decode('latin-1')
+    status = status.split(None, 2)
+    if len(status) > 1 and status[1].isdigit():
+        return int(status[1])
+    return None
+
+
+class RublonLatencyTracker(object):
+    """Thread-safe sliding window of the latest response times per URL path."""
+
+    """Default number of response times kept per URL path."""
+    DEFAULT_WINDOW = 100
+
+    def __init__(self, window=None):
+        self.window = self.DEFAULT_WINDOW if window is None else window
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, latency):
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if latencies is None:
+                latencies = self._latencies[key] = deque(maxlen=self.window)
+            latencies.append(latency)
+
+    def get_percentile(self, key, fraction, min_samples=1):
+        """Get the percentile of the key's response times, None until min_samples were collected."""
+        with self._lock:
+            latencies = sorted(self._latencies.get(key, ()))
+        if len(latencies) < min_samples or not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+class RublonRequestPolicy(object):
+    """Timeouts, retries and hedging of the API requests.
+
+    Timeouts in seconds: connect_timeout bounds the connection setup, read_timeout
+    the wait for the response data and total_timeout the whole call including
+    retries. Unset timeouts default to the client's TIMEOUT.
+
+    Requests that were not sent (the connection failed) are retried up to `retries`
+    times. Idempotent requests (RublonAPIClient.IDEMPOTENT) are also retried after
+    any transfer error or a 502/503/504 response, with a full-jitter exponential backoff.
+
+    Idempotent requests can be hedged: if there is no response after hedge_delay
+    seconds, a second request is sent and the first response wins. With
+    hedge_percentile (e.g. 0.95), the delay is that percentile of the latest response
+    times of the URL path, hedge_delay is used until enough of them were measured.
+    A hedged request runs in a background thread."""
+
+    """Default backoff before the first retry in seconds, doubled for each next one."""
+    DEFAULT_BACKOFF = 0.1
+
+    """Default maximum backoff between retries in seconds."""
+    DEFAULT_MAX_BACKOFF = 2.0
+
+    """Response times measured before the hedge delay is computed from them."""
+    HEDGE_MIN_SAMPLES = 20
+
+    """HTTP status codes of the responses to idempotent requests which are retried."""
+    RETRY_STATUS_CODES = (502, 503, 504)
+
+    def __init__(self, connect_timeout=None, read_timeout=None, total_timeout=None, retries=0, backoff=None,
+                 max_backoff=None, hedge_delay=None, hedge_percentile=None, tracker=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.retries = retries
+        self.backoff = self.DEFAULT_BACKOFF if backoff is None else backoff
+        self.max_backoff = self.DEFAULT_MAX_BACKOFF if max_backoff is None else max_backoff
+        self.hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.tracker = RublonLatencyTracker() if tracker is None and hedge_percentile is not None else tracker
+
+    def request(self, transport, url, headers, body, timeout, idempotent=False, info=None):
+        """Send the request with the transport, as RublonTransport.request().
+
+        The info dict, if given, is passed on to the transport to fill in details of the transfer.
+        Raises the RublonTransportError of the last attempt if all of them failed."""
+        deadline = time.time() + (self.total_timeout or timeout)
+        error = response = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self.get_backoff(attempt)
+                if time.time() + delay >= deadline:
+                    break
+                time.sleep(delay)
+            try:
+                response = self._send(transport, url, headers, body, timeout, deadline, idempotent, info)
+                error = None
+            except RublonTransportError as e:
+                # A sent request may have been processed, only idempotent ones are repeated.
+                if not idempotent and not isinstance(e, RublonConnectError):
+                    raise
+                error, response = e, None
+                continue
+            if not idempotent or get_status_code(response) not in self.RETRY_STATUS_CODES:
+                return response
+
+        if error is not None:
+            raise error
+        return response
+
+    def get_backoff(self, attempt):
+        """Get the random delay in seconds before the given retry (1 for the first one)."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def get_hedge_delay(self, url):
+        """Get the delay in seconds after which a second request is sent, None not to hedge."""
+        if self.tracker is not None and self.hedge_percentile is not None:
+            delay = self.tracker.get_percentile(urlsplit(url).path, self.hedge_percentile, self.HEDGE_MIN_SAMPLES)
+            if delay is not None:
+                return delay
+        return self.hedge_delay
+
+    def _send(self, transport, url, headers, body, timeout, deadline, idempotent, info=None):
+        def send(attempt_info):
+            start = time.time()
+            remaining = deadline - start
+            if remaining <= 0:
+                raise RublonTransportError('Request deadline exceeded.')
+            # Custom transports may not take the info argument, it's passed on only when needed.
+            kwargs = {} if attempt_info is None else {'info': attempt_info}
+            response = transport.request(url, headers, body, remaining,
+                                         min(self.connect_timeout or timeout, remaining),
+                                         min(self.read_timeout or timeout, remaining), **kwargs)
+            if self.tracker is not None:
+                self.tracker.add(urlsplit(url).path, time.time() - start)
+            return response
+
+        delay = self.get_hedge_delay(url) if idempotent else None
+        if delay is None:
+            return send(info)
+        return self._send_hedged(send, delay, deadline, info)
+
+    def _send_hedged(self, send, delay, deadline, info=None):
+        results = queue.Queue()
+
+        def attempt():
+            # Each attempt fills its own info, the one of the response returned is copied to the caller's.
+            attempt_info = None if info is None else {}
+            try:
+                results.put((send(attempt_info), None, attempt_info))
+            except Exception as e:
+                results.put((None, e, attempt_info))
+
+        self._start_thread(attempt)
+        try:
+            response, error, attempt_info = results.get(timeout=max(0, min(delay, deadline - time.time())))
+        except queue.Empty:
+            self._start_thread(attempt)
+            response, error, attempt_info = self._get_result(results, deadline)
+            if error is not None:
+                try:
+                    response, error, attempt_info = self._get_result(results, deadline)
+                except RublonTransportError:
+                    pass
+        if error is not None:
+            raise error
+        if info is not None:
+            info.update(attempt_info)
+        return response
+
+    def _get_result(self, results, deadline):
+        """Wait for the result of a hedged attempt until the deadline of the request."""
+        try:
+            return results.get(timeout=max(0, deadline - time.time()))
+        except queue.Empty:
+            raise RublonTransportError('Request deadline exceeded.')
+
+    def _start_thread(self, target):
+        thread = threading.Thread(target=target, name='RublonHedgedRequest')
+        thread.daemon = True
+        thread.start()
+
+
+_default_policy = RublonRequestPolicy()
+
+
+def get_default_policy():
+    """Get the policy of all consumers without a configured policy: no retries nor hedging."""
+    return _default_policy
+
+
+def set_default_policy(policy):
+    """Set the policy of all consumers without a configured policy."""
+    global _default_policy
+    _default_policy = policy
@@ -0,0 +1,161 @@
+import os
+import time
+import threading
+
+import pycurl
+
+
+class RublonCurlPool(object):
+    """Process-wide pool of reusable keep-alive curl handles.
+
+    A curl handle keeps its connection (and TLS session) cache between transfers,
+    so reusing it for the next request to the same API domain skips the TCP and TLS
+    handshakes. Handles are grouped by API domain and CA bundle path and are
+    never shared between processes: after a fork the child starts with an empty pool.
+    """
+
+    """Default maximum number of idle handles kept per API domain."""
+    DEFAULT_MAX_SIZE = 10
+
+    """Default number of seconds after which an idle handle is closed."""
+    DEFAULT_IDLE_TIMEOUT = 60
+
+    def __init__(self, max_size=None, idle_timeout=None, share_tls_sessions=True):
+        self.max_size = self.DEFAULT_MAX_SIZE if max_size is None else max_size
+        self.idle_timeout = self.DEFAULT_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self.share_tls_sessions = share_tls_sessions
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._abandoned = []
+        self._pid = os.getpid()
+
+    def acquire(self, domain, ca_info):
+        """Get a handle for given API domain: an idle one if available or a new one."""
+        self._check_fork()
+        now = time.time()
+        expired = []
+        curl = None
+        with self._lock:
+            handles = self._idle.get((domain, ca_info))
+            if handles:
+                curl, released = handles.pop()
+                if now - released > self.idle_timeout:
+                    # Handles are stored in release order, so all the older ones are stale too.
+                    expired = [curl] + [handle for handle, _ in handles]
+                    del handles[:]
+                    curl = None
+
+        for handle in expired:
+            handle.close()
+
+        return curl if curl is not None else self.create_handle()
+
+    def create_handle(self):
+        """Create a new handle, sharing TLS sessions and DNS cache with the other handles
+        of the process, so its first connection resumes a TLS session instead of a full handshake."""
+        curl = pycurl.Curl()
+        if self.share_tls_sessions:
+            curl.setopt(pycurl.SHARE, get_default_share())
+        return curl
+
+    def release(self, domain, ca_info, curl):
+        """Return a handle after a successful transfer so its connection can be reused."""
+        if self._check_fork():
+            # Handle was acquired in the parent process.
+            self._abandoned.append(curl)
+            return
+
+        curl.reset()
+        with self._lock:
+            handles = self._idle.setdefault((domain, ca_info), [])
+            if len(handles) < self.max_size:
+                handles.append((curl, time.time()))
+                return
+
+        curl.close()
+
+    def discard(self, curl):
+        """Close a handle which should not be reused, e.g. after a failed transfer."""
+        curl.close()
+
+    def clear(self):
+        """Close all idle handles."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+
+        for handles in idle.values():
+            for curl, _ in handles:
+                curl.close()
+
+    def size(self, domain=None, ca_info=None):
+        """Number of idle handles, for given API domain or in total."""
+        with self._lock:
+            if domain is not None:
+                return len(self._idle.get((domain, ca_info), []))
+            return sum(len(handles) for handles in self._idle.values())
+
+    def reset_after_fork(self):
+        """Drop all handles inherited from the parent process.
+
+        The inherited handles share their sockets with the parent, so they are not closed
+        here (closing them could shut down the parent's connections) - just never used again.
+        """
+        self._lock = threading.Lock()
+        for handles in self._idle.values():
+            self._abandoned.extend(curl for curl, _ in handles)
+        self._idle = {}
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        """Reset the pool if we are in a forked child. Returns True if so."""
+        if self._pid != os.getpid():
+            self.reset_after_fork()
+            return True
+        return False
+
+
+_default_share = None
+_default_share_pid = None
+_default_share_lock = threading.Lock()
+
+
+def get_default_share():
+    """Get the CurlShare of TLS sessions and DNS cache shared by the handles of this process."""
+    global _default_share, _default_share_pid
+    if _default_share is None or _default_share_pid != os.getpid():
+        with _default_share_lock:
+            if _default_share is None or _default_share_pid != os.getpid():
+                share = pycurl.CurlShare()
+                share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_SSL_SESSION)
+                share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_DNS)
+                _default_share = share
+                _default_share_pid = os.getpid()
+    return _default_share
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+    """Get the pool shared by all API clients of this process."""
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = RublonCurlPool()
+    return _default_pool
+
+
+def configure_default_pool(max_size=None, idle_timeout=None):
+    """Change the size and idle timeout of the default pool."""
+    pool = get_default_pool()
+    if max_size is not None:
+        pool.max_size = max_size
+    if idle_timeout is not None:
+        pool.idle_timeout = idle_timeout
+    return pool
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lambda: _default_pool is not None and _default_pool.reset_after_fork())
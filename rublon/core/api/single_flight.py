@@ -0,0 +1,67 @@
+import os
+import threading
+
+
+class _RublonCall(object):
+    """Call in flight, waited for by the callers of the same key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RublonSingleFlight(object):
+    """Coalesces identical concurrent calls of all threads.
+
+    While a call of a key is in flight, the other callers of the key wait for it
+    and get its result, or its exception raised again, instead of calling again.
+    The next call after it completes is made anew: results are not cached."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def do(self, key, function):
+        """Call the function, or wait for its call of the same key in flight; return its result."""
+        if self._pid != os.getpid():
+            # Forked child: the calls in flight belong to the parent's threads.
+            self._calls = {}
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _RublonCall()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def get_in_flight_count(self):
+        """Number of keys with a call in flight."""
+        return len(self._calls)
+
+
+_default_single_flight = RublonSingleFlight()
+
+
+def get_default_single_flight():
+    """Get the single-flight group shared by the API clients of this process."""
+    return _default_single_flight
@@ -0,0 +1,225 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from rublon.core.api.metrics import get_endpoint
+
+try:
+    from contextvars import ContextVar
+except ImportError:
+    # Python < 3.7: the current span is kept per thread.
+    ContextVar = None
+
+
+if ContextVar is not None:
+    _current_span = ContextVar('rublon_current_span', default=None)
+
+    def get_current_span():
+        """Get the span of the caller, the parent of the next API request spans."""
+        return _current_span.get()
+
+    def set_current_span(span):
+        """Set the current span, return the token to reset it with reset_current_span()."""
+        return _current_span.set(span)
+
+    def reset_current_span(token):
+        _current_span.reset(token)
+else:
+    _local = threading.local()
+
+    def get_current_span():
+        """Get the span of the caller, the parent of the next API request spans."""
+        return getattr(_local, 'span', None)
+
+    def set_current_span(span):
+        """Set the current span, return the token to reset it with reset_current_span()."""
+        token = get_current_span()
+        _local.span = span
+        return token
+
+    def reset_current_span(token):
+        _local.span = token
+
+
+@contextmanager
+def use_span(span):
+    """Make the span the parent of the API request spans started in the block, e.g. the span
+    of the web request calling auth(). The context is per thread and asyncio task."""
+    token = set_current_span(span)
+    try:
+        yield span
+    finally:
+        reset_current_span(token)
+
+
+class RublonTracer(object):
+    """Interface of the tracers receiving the spans of the API requests.
+
+    Modelled on the OpenTelemetry tracing API, see RublonOpenTelemetryTracer.
+    Times are in seconds since the epoch, as returned by time.time()."""
+
+    def start_span(self, name, parent=None, attributes=None, start_time=None):
+        """Start a span, as a child of the parent span if given; return the span.
+
+        The span has set_attribute(key, value), record_exception(exception) and end(end_time=None) methods."""
+        raise NotImplementedError
+
+
+class RublonSpan(object):
+    """Span recorded by RublonRecordingTracer."""
+
+    def __init__(self, name, parent=None, attributes=None, start_time=None):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time() if start_time is None else start_time
+        self.end_time = None
+        self.exception = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exception):
+        self.exception = exception
+
+    def end(self, end_time=None):
+        self.end_time = time.time() if end_time is None else end_time
+
+    def get_duration(self):
+        return self.end_time - self.start_time
+
+    def __repr__(self):
+        return '<RublonSpan {0} {1:.3f} ms>'.format(self.name, self.get_duration() * 1000)
+
+
+class RublonRecordingTracer(RublonTracer):
+    """Keeps the started spans in memory, e.g. for tests or to log the phases of slow logins."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def start_span(self, name, parent=None, attributes=None, start_time=None):
+        span = RublonSpan(name, parent, attributes, start_time)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def get_spans(self, name=None):
+        """Get the spans, only the ones of given name if set."""
+        with self._lock:
+            return [span for span in self.spans if name is None or span.name == name]
+
+    def clear(self):
+        with self._lock:
+            del self.spans[:]
+
+
+class _RublonOpenTelemetrySpan(object):
+
+    def __init__(self, span):
+        self.span = span
+
+    def set_attribute(self, key, value):
+        self.span.set_attribute(key, value)
+
+    def record_exception(self, exception):
+        from opentelemetry.trace import Status, StatusCode
+        self.span.record_exception(exception)
+        self.span.set_status(Status(StatusCode.ERROR, str(exception)))
+
+    def end(self, end_time=None):
+        self.span.end(end_time=None if end_time is None else int(end_time * 1e9))
+
+
+class RublonOpenTelemetryTracer(RublonTracer):
+    """Passes the spans on to OpenTelemetry (the opentelemetry-api package, imported on first use).
+
+    The request spans are children of the current OpenTelemetry span of the caller,
+    or of the span given to use_span(). The tracer defaults to trace.get_tracer('rublon')."""
+
+    def __init__(self, tracer=None):
+        self.tracer = tracer
+
+    def start_span(self, name, parent=None, attributes=None, start_time=None):
+        from opentelemetry import trace
+        if self.tracer is None:
+            self.tracer = trace.get_tracer('rublon')
+        if isinstance(parent, _RublonOpenTelemetrySpan):
+            parent = parent.span
+        context = None if parent is None else trace.set_span_in_context(parent)
+        span = self.tracer.start_span(name, context=context, attributes=attributes,
+                                      start_time=None if start_time is None else int(start_time * 1e9))
+        return _RublonOpenTelemetrySpan(span)
+
+
+class RublonRequestTrace(object):
+    """Spans of one API request: the `rublon.request` span and the spans of its phases.
+
+    The request span is the current span until finish(), so requests made meanwhile
+    (e.g. by the caller's hooks) are its children."""
+
+    """Phases of the transfer: (span name, start, end), as the curl timings of RublonTransport.request() info."""
+    TRANSFER_PHASES = (
+        ('rublon.name_lookup', None, 'namelookup'),
+        ('rublon.connect', 'namelookup', 'connect'),
+        ('rublon.tls_handshake', 'connect', 'appconnect'),
+        ('rublon.time_to_first_byte', 'pretransfer', 'starttransfer'),
+        ('rublon.receive', 'starttransfer', 'total'),
+    )
+
+    def __init__(self, tracer, url):
+        self.tracer = tracer
+        self.span = tracer.start_span('rublon.request', get_current_span(),
+                                      {'http.url': url, 'rublon.endpoint': get_endpoint(url)})
+        self._token = set_current_span(self.span)
+
+    @contextmanager
+    def phase(self, name):
+        """Trace the block as a phase of the request."""
+        span = self.tracer.start_span(name, self.span)
+        try:
+            yield span
+        except Exception as e:
+            span.record_exception(e)
+            raise
+        finally:
+            span.end()
+
+    def add_transfer(self, info):
+        """Add the spans of the transfer phases measured by the transport."""
+        if 'reused' in info:
+            self.span.set_attribute('rublon.connection_reused', info['reused'])
+        start = info.get('start')
+        timings = info.get('timings')
+        if start is None or not timings:
+            return
+        for name, begin, end in self.TRANSFER_PHASES:
+            begin = 0 if begin is None else timings.get(begin, 0)
+            end = timings.get(end)
+            # Phases of a reused connection take no time and are left out, as the ones not measured.
+            if end is not None and end > begin:
+                self.tracer.start_span(name, self.span, None, start + begin).end(start + end)
+
+    def finish(self, client, error=None):
+        """End the request span, with the response status or the error of the request."""
+        reset_current_span(self._token)
+        if str(client.response_http_status_code).isdigit():
+            self.span.set_attribute('http.status_code', int(client.response_http_status_code))
+        if error is not None:
+            self.span.record_exception(error)
+        self.span.end()
+
+
+_default_tracer = None
+
+
+def get_default_tracer():
+    """Get the tracer of all consumers without a configured one, None if tracing is off."""
+    return _default_tracer
+
+
+def set_default_tracer(tracer):
+    """Set the tracer of all consumers without a configured one, None to turn tracing off."""
+    global _default_tracer
+    _default_tracer = tracer
@@ -0,0 +1,437 @@
+import os
+import six
+import json
+import errno
+import time
+import base64
+import socket
+import hashlib
+import binascii
+import threading
+
+from six.moves import http_client
+from six.moves.urllib.parse import urlsplit
+
+from rublon.core.signer import get_signer
+from rublon.core.api import PATH_CERT
+from rublon.core.api.exceptions import RublonTransportError, RublonConnectError
+
+
+def is_connection_dropped(error, sending):
+    """Tell if the error of a request on an idle connection means the server had closed it,
+    so the request wasn't received: reset or broken pipe while sending, or no response at all."""
+    if isinstance(error, socket.timeout):
+        return False
+    if sending:
+        return getattr(error, 'errno', None) in (errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED)
+    remote_disconnected = getattr(http_client, 'RemoteDisconnected', None)
+    if remote_disconnected is not None:
+        return isinstance(error, remote_disconnected)
+    # Python < 3.5: the empty status line of a closed connection.
+    return isinstance(error, http_client.BadStatusLine) and not error.line.strip("'")
+
+
+_tls_contexts = {}
+_tls_contexts_lock = threading.Lock()
+
+
+def get_tls_context(ca_info=None):
+    """Get the client TLS context verifying certificates with given CA bundle.
+
+    Contexts are shared by the whole process, so each CA bundle is loaded and parsed once."""
+    ca_info = PATH_CERT if ca_info is None else ca_info
+    context = _tls_contexts.get(ca_info)
+    if context is None:
+        import ssl
+        if not hasattr(ssl, 'create_default_context'):
+            raise RublonTransportError('Verified HTTPS requires Python 2.7.9+ or 3.4+, use pycurl instead.')
+        with _tls_contexts_lock:
+            context = _tls_contexts.get(ca_info)
+            if context is None:
+                context = _tls_contexts[ca_info] = ssl.create_default_context(cafile=ca_info)
+    return context
+
+
+def _read_der(data, offset):
+    """Read the DER element at offset, return (tag, content start, content end)."""
+    tag = six.indexbytes(data, offset)
+    length = six.indexbytes(data, offset + 1)
+    offset += 2
+    if length & 0x80:
+        count = length & 0x7f
+        length = int(binascii.hexlify(data[offset:offset + count]), 16)
+        offset += count
+    return tag, offset, offset + length
+
+
+def get_public_key_pin(der_certificate):
+    """Get the "sha256//<base64 digest>" pin of the certificate's public key, as used by
+    libcurl's CURLOPT_PINNEDPUBLICKEY (the digest of the DER SubjectPublicKeyInfo)."""
+    _, start, _ = _read_der(der_certificate, 0)
+    _, offset, _ = _read_der(der_certificate, start)
+    if six.indexbytes(der_certificate, offset) == 0xa0:
+        # Skip the explicit version.
+        offset = _read_der(der_certificate, offset)[2]
+    # Skip serial number, signature algorithm, issuer, validity and subject.
+    for _ in range(5):
+        offset = _read_der(der_certificate, offset)[2]
+    end = _read_der(der_certificate, offset)[2]
+    digest = hashlib.sha256(der_certificate[offset:end]).digest()
+    return 'sha256//' + base64.b64encode(digest).decode('ascii')
+
+
+class _RublonHTTPSConnection(http_client.HTTPSConnection):
+    """HTTPS connection resuming the given TLS session."""
+
+    def __init__(self, host, port, timeout, context, session=None):
+        http_client.HTTPSConnection.__init__(self, host, port, timeout=timeout, context=context)
+        self.tls_session = session
+
+    def connect(self):
+        http_client.HTTPConnection.connect(self)
+        if self.tls_session is not None:
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=self.host, session=self.tls_session)
+        else:
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=self.host)
+
+
+class RublonTransport(object):
+    """Interface of the HTTP transports used by the API clients."""
+
+    def request(self, url, headers, body, timeout, connect_timeout=None, read_timeout=None, info=None):
+        """Send a POST request.
+
+        Headers is a list of "Name: value" strings. Returns the [header lines, body]
+        response, where the first header line is the status line. The timeout bounds
+        the whole transfer, connect_timeout the connection setup and read_timeout
+        the wait for the response data (both default to the timeout).
+        If an info dict is given, the transport sets what it knows of the transfer:
+        'reused' - True if the request was sent on an already open connection,
+        'start' - time.time() at the start of the transfer,
+        'timings' - dict of the times in seconds from the start to the end of the phases,
+        named as the libcurl timers: namelookup, connect, appconnect (TLS handshake),
+        pretransfer, starttransfer (first response byte) and total.
+        Raises RublonTransportError if the transfer failed, RublonConnectError if
+        the request was not sent."""
+        raise NotImplementedError
+
+    def warm_up(self, url, timeout, connections=1):
+        """Open and keep the given number of connections to the URL's host, so the
+        next requests skip the DNS lookup and the TCP and TLS handshakes.
+
+        Raises RublonTransportError if a connection could not be opened."""
+        pass
+
+    def close(self):
+        """Close all open connections."""
+        pass
+
+
+class RublonHTTPTransport(RublonTransport):
+    """Transport built on the standard library http.client, no libcurl needed.
+
+    Keep-alive connections are pooled per host and reused across threads;
+    the pool is emptied in forked children. The CA bundle is loaded once per process
+    and new connections resume the last TLS session of the host (Python 3.6+).
+    Pinned public keys are "sha256//<base64 digest>" strings, the connection fails
+    unless the server's key is one of them."""
+
+    """Default maximum number of idle connections kept per host."""
+    DEFAULT_MAX_SIZE = 10
+
+    """Default number of seconds after which an idle connection is closed."""
+    DEFAULT_IDLE_TIMEOUT = 60
+
+    def __init__(self, ca_info=None, max_size=None, idle_timeout=None, pinned_public_keys=None,
+                 share_tls_sessions=True):
+        self.ca_info = PATH_CERT if ca_info is None else ca_info
+        self.max_size = self.DEFAULT_MAX_SIZE if max_size is None else max_size
+        self.idle_timeout = self.DEFAULT_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self.pinned_public_keys = pinned_public_keys
+        self.share_tls_sessions = share_tls_sessions
+        self._tls_sessions = {}
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def request(self, url, headers, body, timeout, connect_timeout=None, read_timeout=None, info=None):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        header_dict = dict(header.split(': ', 1) for header in headers)
+
+        # Sockets time out per operation, so the total timeout caps each wait for the response data.
+        read_timeout = min(read_timeout or timeout, timeout)
+        start = time.time()
+        connection = self._acquire(key)
+        reused = connection is not None
+        if connection is None:
+            connection = self._connect(parts, min(connect_timeout or timeout, timeout))
+
+        try:
+            sending = True
+            try:
+                pretransfer = time.time()
+                connection.sock.settimeout(read_timeout)
+                connection.request('POST', path, body, header_dict)
+                sending = False
+                response = connection.getresponse()
+            except (socket.error, http_client.HTTPException) as e:
+                # Only a request which never reached the server is sent again; after a timeout
+                # or a partial response it may have been processed (see RublonRequestPolicy).
+                if not reused or not is_connection_dropped(e, sending):
+                    raise
+                # The server has closed the idle connection, retry on a new one.
+                connection.close()
+                reused = False
+                connection = self._connect(parts, min(connect_timeout or timeout, timeout))
+                pretransfer = time.time()
+                connection.sock.settimeout(read_timeout)
+                connection.request('POST', path, body, header_dict)
+                response = connection.getresponse()
+
+            starttransfer = time.time()
+            response_body = response.read()
+        except (socket.error, http_client.HTTPException) as e:
+            connection.close()
+            raise RublonTransportError(str(e) or e.__class__.__name__)
+
+        if info is not None:
+            # Connections are opened in one step: DNS, TCP and TLS handshakes count as connect.
+            info['reused'] = reused
+            info['start'] = start
+            info['timings'] = {'pretransfer': pretransfer - start, 'starttransfer': starttransfer - start,
+                               'total': time.time() - start}
+            if not reused:
+                info['timings']['connect'] = info['timings']['pretransfer']
+        header_lines = ['HTTP/{0} {1} {2}'.format('1.0' if response.version == 10 else '1.1',
+                                                   response.status, response.reason)]
+        header_lines.extend('{0}: {1}'.format(name, value) for name, value in response.getheaders())
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(key, connection)
+
+        return [header_lines, response_body]
+
+    def warm_up(self, url, timeout, connections=1):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        idle = []
+        # Idle connections count towards the number, only the missing ones are opened. Each one
+        # sends a HEAD request, so the server doesn't close it as idle, as with the curl transport.
+        try:
+            for _ in range(connections):
+                connection = self._acquire(key)
+                if connection is not None and not self._ping(connection, timeout):
+                    # Closed by the server while idle.
+                    connection.close()
+                    connection = None
+                if connection is None:
+                    connection = self._connect(parts, timeout)
+                    if not self._ping(connection, timeout):
+                        connection.close()
+                        raise RublonTransportError('HEAD request to {0} failed.'.format(parts.hostname))
+                idle.append(connection)
+        finally:
+            for connection in idle:
+                self._release(key, connection)
+
+    def _ping(self, connection, timeout):
+        """Send a HEAD / request on the connection, return False if it can't be used any more."""
+        try:
+            connection.sock.settimeout(timeout)
+            connection.request('HEAD', '/')
+            response = connection.getresponse()
+            response.read()
+        except (socket.error, http_client.HTTPException):
+            return False
+        return not response.will_close
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+    def _connect(self, parts, timeout):
+        if parts.scheme == 'https':
+            connection = _RublonHTTPSConnection(parts.hostname, parts.port, timeout, get_tls_context(self.ca_info),
+                                                self._tls_sessions.get((parts.hostname, parts.port)))
+        else:
+            connection = http_client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+        try:
+            connection.connect()
+            connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except socket.error as e:
+            raise RublonConnectError(str(e) or e.__class__.__name__)
+
+        if self.pinned_public_keys and parts.scheme == 'https':
+            pin = get_public_key_pin(connection.sock.getpeercert(True))
+            if pin not in self.pinned_public_keys:
+                connection.close()
+                raise RublonTransportError('Public key of {0} does not match the pinned keys.'.format(parts.hostname))
+        return connection
+
+    def _acquire(self, key):
+        if self._pid != os.getpid():
+            # Forked child: never touch the parent's sockets.
+            self._lock = threading.Lock()
+            self._idle = {}
+            self._pid = os.getpid()
+
+        now = time.time()
+        expired = []
+        connection = None
+        with self._lock:
+            connections = self._idle.get(key)
+            while connections:
+                candidate, released = connections.pop()
+                if now - released <= self.idle_timeout:
+                    connection = candidate
+                    break
+                expired.append(candidate)
+
+        for candidate in expired:
+            candidate.close()
+        return connection
+
+    def _release(self, key, connection):
+        session = getattr(connection.sock, 'session', None)
+        if session is not None and self.share_tls_sessions:
+            # TLS 1.3 tickets arrive after the handshake, so the session is stored once the connection was used.
+            self._tls_sessions[key[1:]] = session
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.max_size:
+                connections.append((connection, time.time()))
+                return
+        connection.close()
+
+
+class RublonMemoryTransport(RublonTransport):
+    """In-memory stand-in for the Rublon API, no sockets are used.
+
+    Answers requests to the paths set by set_result() with signed OK responses,
+    and other requests with UserNotFound errors. A custom handler can be given
+    instead: handler(url, headers, body) -> (status code, headers dict, body).
+    Useful for tests and benchmarks."""
+
+    """Response body for paths without a result."""
+    ERROR_BODY = b'{"status": "ERROR", "result": {"exception": "UserNotFound_RublonAPIException"}}'
+
+    def __init__(self, secret_key=None, handler=None):
+        self.secret_key = secret_key
+        self.handler = handler
+        self.results = {}
+        self.requests = []
+
+    def set_result(self, path, result):
+        """Answer requests to the URL path with an OK response with given result."""
+        body = json.dumps({'status': 'OK', 'result': result}).encode('utf-8')
+        self.results[path] = (body, get_signer(self.secret_key).sign(body))
+        return self
+
+    def request(self, url, headers, body, timeout, connect_timeout=None, read_timeout=None, info=None):
+        self.requests.append((url, headers, body))
+        if self.handler is not None:
+            status, response_headers, response_body = self.handler(url, headers, body)
+        else:
+            status = 200
+            path = urlsplit(url).path
+            if path in self.results:
+                response_body, signature = self.results[path]
+            else:
+                response_body = self.ERROR_BODY
+                signature = get_signer(self.secret_key).sign(response_body)
+            response_headers = {'Content-Type': 'application/json', 'X-Rublon-Signature': signature}
+
+        header_lines = ['HTTP/1.1 {0} {1}'.format(status, http_client.responses.get(status, ''))]
+        header_lines.extend('{0}: {1}'.format(name, value) for name, value in response_headers.items())
+        return [header_lines, response_body]
+
+
+class RublonKeepAlive(object):
+    """Background thread warming up a transport's connections every `interval` seconds,
+    so they are not closed as idle between requests."""
+
+    def __init__(self, transport, url, interval, timeout, connections=1):
+        self.transport = transport
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.connections = connections
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        if self._thread is None or self._pid != os.getpid():
+            # Threads don't survive a fork, start again in a child process.
+            self._stopped.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='RublonKeepAlive')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._pid == os.getpid() and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.transport.warm_up(self.url, self.timeout, self.connections)
+            except RublonTransportError:
+                # The API is not reachable at the moment, try again later.
+                pass
+
+
+_keep_alives = {}
+_keep_alives_lock = threading.Lock()
+
+
+def start_keep_alive(transport, url, interval, timeout, connections=1):
+    """Start keeping alive the transport's connections to the URL's host, once per process."""
+    parts = urlsplit(url)
+    key = (id(transport), parts.scheme, parts.netloc)
+    with _keep_alives_lock:
+        keep_alive = _keep_alives.get(key)
+        if keep_alive is None or keep_alive.transport is not transport:
+            keep_alive = _keep_alives[key] = RublonKeepAlive(transport, url, interval, timeout, connections)
+        return keep_alive.start()
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport():
+    """Get the transport shared by all consumers without a configured transport:
+    pycurl if available, http.client otherwise."""
+    global _default_transport
+    if _default_transport is None:
+        with _default_transport_lock:
+            if _default_transport is None:
+                try:
+                    from rublon.core.api.curl_transport import RublonCurlTransport
+                    _default_transport = RublonCurlTransport()
+                except ImportError:
+                    _default_transport = RublonHTTPTransport()
+    return _default_transport
+
+
+def set_default_transport(transport):
+    """Set the transport shared by all consumers without a configured transport."""
+    global _default_transport
+    _default_transport = transport
@@ -0,0 +1,205 @@
+import time
+import logging
+import threading
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = None
+
+logger = logging.getLogger('rublon')
+
+
+class _RublonOrderedDict(dict):
+    """Insertion-ordered dict for Python 2.6, with only the operations RublonMemoryCache uses.
+
+    Keys are kept in a circular doubly linked list of [previous, next, key] links."""
+
+    def __init__(self):
+        dict.__init__(self)
+        self._root = root = []
+        root[:] = [root, root, None]
+        self._links = {}
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            root = self._root
+            last = root[0]
+            last[1] = root[0] = self._links[key] = [last, root, key]
+        dict.__setitem__(self, key, value)
+
+    def pop(self, key, *default):
+        link = self._links.pop(key, None)
+        if link is not None:
+            link[0][1] = link[1]
+            link[1][0] = link[0]
+        return dict.pop(self, key, *default)
+
+    def popitem(self, last=True):
+        if not self:
+            raise KeyError('dictionary is empty')
+        key = (self._root[0] if last else self._root[1])[2]
+        return key, self.pop(key)
+
+    def clear(self):
+        dict.clear(self)
+        self._links.clear()
+        self._root[:] = [self._root, self._root, None]
+
+
+if OrderedDict is None:
+    # Python 2.6
+    OrderedDict = _RublonOrderedDict
+
+
+class RublonCache(object):
+    """Interface of the caches used by the Rublon services.
+
+    Implement it to plug your own cache into a Rublon service."""
+
+    def get(self, key, default=None):
+        """Get value stored for given key or default if missing or expired."""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """Store value for given key, for ttl seconds or the cache's default TTL if None."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove value stored for given key."""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove all values."""
+        raise NotImplementedError
+
+    def get_stats(self):
+        """Get cache statistics: hits, misses, ..."""
+        return {}
+
+
+class RublonMemoryCache(RublonCache):
+    """Thread-safe in-process cache with LRU eviction and TTL expiry."""
+
+    """Default maximum number of entries."""
+    DEFAULT_MAX_SIZE = 1000
+
+    """Default time to live of an entry in seconds."""
+    DEFAULT_TTL = 300
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = self.DEFAULT_MAX_SIZE if max_size is None else max_size
+        self.ttl = self.DEFAULT_TTL if ttl is None else ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            try:
+                value, expires = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires < now:
+                self.misses += 1
+                return default
+
+            # Re-insert as the most recently used.
+            self._data[key] = (value, expires)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'size': len(self._data),
+            }
+
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+def get_shared_cache(name, max_size=None, ttl=None):
+    """Get the process-wide memory cache of given name, create it if needed.
+
+    Size and TTL are used only when the cache is created."""
+    with _shared_caches_lock:
+        cache = _shared_caches.get(name)
+        if cache is None:
+            cache = _shared_caches[name] = RublonMemoryCache(max_size, ttl)
+        return cache
+
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def get_or_refresh(cache, key, loader, ttl, stale_ttl=0):
+    """Get a value from the cache, load it with loader() on a miss.
+
+    A value older than ttl seconds is still returned for another stale_ttl seconds,
+    while loader() refreshes it in a background thread (stale-while-revalidate).
+    A failed refresh keeps the stale value."""
+    entry = cache.get(key)
+    if entry is not None:
+        if time.time() - entry['time'] > ttl:
+            refresh_in_background(cache, key, loader, ttl, stale_ttl)
+        return entry['value']
+
+    value = loader()
+    cache.set(key, {'value': value, 'time': time.time()}, ttl + stale_ttl)
+    return value
+
+
+def refresh_in_background(cache, key, loader, ttl, stale_ttl=0):
+    """Reload the cached value in a background thread, unless it's already being reloaded."""
+    # Different caches may hold the same key, e.g. the features of consumers with their own caches.
+    refreshing = (id(cache), key)
+    with _refreshing_lock:
+        if refreshing in _refreshing:
+            return
+        _refreshing.add(refreshing)
+
+    def refresh():
+        try:
+            cache.set(key, {'value': loader(), 'time': time.time()}, ttl + stale_ttl)
+        except Exception as e:
+            logger.warning('Rublon cache refresh of %s failed: %s', key, e)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(refreshing)
+
+    thread = threading.Thread(target=refresh)
+    thread.daemon = True
+    thread.start()
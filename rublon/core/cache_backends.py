@@ -0,0 +1,238 @@
+"""Credentials cache backends shared between processes and hosts.
+
+Values are stored as JSON, so only JSON-serializable values (e.g. API client
+cache payloads) can be cached.
+"""
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+
+from rublon.core.cache import RublonCache
+
+logger = logging.getLogger('rublon')
+
+
+class RublonSQLiteCache(RublonCache):
+    """Cache stored in a SQLite database file, shared by all processes of a host.
+
+    The cache is best-effort: when the database is locked for longer than `timeout`
+    seconds or can't be read, reads are misses and writes are skipped."""
+
+    """Default time to live of an entry in seconds."""
+    DEFAULT_TTL = 300
+
+    """Expired entries are purged every that many writes."""
+    PURGE_INTERVAL = 100
+
+    def __init__(self, path, ttl=None, table='rublon_cache', timeout=5):
+        self.path = path
+        self.ttl = self.DEFAULT_TTL if ttl is None else ttl
+        self.table = table
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._writes = 0
+        self._local = threading.local()
+
+    def get(self, key, default=None):
+        try:
+            row = self._execute('SELECT value, expires FROM {0} WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            self._on_error(e)
+            row = None
+        if row is None or row[1] < time.time():
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        try:
+            self._execute('INSERT OR REPLACE INTO {0} (key, value, expires) VALUES (?, ?, ?)',
+                          (key, json.dumps(value), expires))
+            self._writes += 1
+            if self._writes % self.PURGE_INTERVAL == 0:
+                self._execute('DELETE FROM {0} WHERE expires < ?', (time.time(),))
+        except sqlite3.Error as e:
+            self._on_error(e)
+
+    def delete(self, key):
+        try:
+            self._execute('DELETE FROM {0} WHERE key = ?', (key,))
+        except sqlite3.Error as e:
+            self._on_error(e)
+
+    def clear(self):
+        try:
+            self._execute('DELETE FROM {0}', ())
+        except sqlite3.Error as e:
+            self._on_error(e)
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'errors': self.errors}
+
+    def _on_error(self, error):
+        self.errors += 1
+        # Reconnect on the next call, e.g. after the database file was replaced.
+        self._local.connection = None
+        logger.warning('Rublon SQLite cache error: %s', error)
+
+    def _execute(self, query, params):
+        return self._get_connection().execute(query.format(self.table), params)
+
+    def _get_connection(self):
+        """Get connection of the current thread; connections are never shared with forked children."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS {0} '
+                               '(key TEXT PRIMARY KEY, value TEXT, expires REAL)'.format(self.table))
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+
+class RublonRedisError(Exception):
+    pass
+
+
+class RublonRedisCache(RublonCache):
+    """Cache stored in a Redis (or any Redis protocol compatible) server, shared by all hosts.
+
+    Talks the Redis protocol directly, no client library is needed. The cache is
+    best-effort: when the server is unavailable reads are misses and writes are skipped.
+    """
+
+    """Default time to live of an entry in seconds."""
+    DEFAULT_TTL = 300
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None, prefix='rublon:', ttl=None,
+                 timeout=1.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self.ttl = self.DEFAULT_TTL if ttl is None else ttl
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._local = threading.local()
+
+    def get(self, key, default=None):
+        try:
+            value = self.execute('GET', self.prefix + key)
+        except (socket.error, RublonRedisError) as e:
+            self._on_error(e)
+            value = None
+
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(value.decode('utf-8'))
+
+    def set(self, key, value, ttl=None):
+        ttl_ms = int((self.ttl if ttl is None else ttl) * 1000)
+        try:
+            self.execute('SET', self.prefix + key, json.dumps(value), 'PX', ttl_ms)
+        except (socket.error, RublonRedisError) as e:
+            self._on_error(e)
+
+    def delete(self, key):
+        try:
+            self.execute('DEL', self.prefix + key)
+        except (socket.error, RublonRedisError) as e:
+            self._on_error(e)
+
+    def clear(self):
+        """Remove all keys with the cache's prefix."""
+        cursor = b'0'
+        try:
+            while True:
+                cursor, keys = self.execute('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', 100)
+                if keys:
+                    self.execute('DEL', *keys)
+                if cursor == b'0':
+                    break
+        except (socket.error, RublonRedisError) as e:
+            self._on_error(e)
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'errors': self.errors}
+
+    def execute(self, *args):
+        """Send a command and return its reply."""
+        connection = self._get_connection()
+        try:
+            return self._command(connection, args)
+        except socket.error:
+            self._close()
+            raise
+
+    def _on_error(self, error):
+        self.errors += 1
+        self._close()
+        logger.warning('Rublon Redis cache error: %s', error)
+
+    def _get_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            sock = socket.create_connection((self.host, self.port), self.timeout)
+            connection = (sock, sock.makefile('rb'))
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            if self.password:
+                self._command(connection, ('AUTH', self.password))
+            if self.db:
+                self._command(connection, ('SELECT', self.db))
+        return connection
+
+    def _close(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None and self._local.pid == os.getpid():
+            connection[1].close()
+            connection[0].close()
+
+    def _command(self, connection, args):
+        sock, reader = connection
+        parts = [b'*' + str(len(args)).encode('ascii') + b'\r\n']
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$' + str(len(arg)).encode('ascii') + b'\r\n' + arg + b'\r\n')
+        sock.sendall(b''.join(parts))
+        return self._read_reply(reader)
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise socket.error('Connection closed by the server.')
+
+        kind, value = line[:1], line[1:-2]
+        if kind == b'+':
+            return value
+        elif kind == b'-':
+            raise RublonRedisError(value.decode('utf-8'))
+        elif kind == b':':
+            return int(value)
+        elif kind == b'$':
+            if int(value) < 0:
+                return None
+            data = reader.read(int(value) + 2)
+            return data[:-2]
+        elif kind == b'*':
+            if int(value) < 0:
+                return None
+            return [self._read_reply(reader) for _ in range(int(value))]
+        else:
+            raise RublonRedisError('Invalid reply: {0!r}'.format(line))
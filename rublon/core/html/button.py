@@ -1,5 +1,4 @@
 from .widget import RublonWidget
-from rublon.functions import htmlspecialchars
 
 
 class RublonButton(RublonWidget):
@@ -22,6 +21,9 @@ class RublonButton(RublonWidget):
     """HTML attribute name to put the consumer params."""
     ATTR_CONSUMER_PARAMS = 'data-rublonconsumerparams'
 
+    """HTML template of the button's container, filled with the attributes string and the content."""
+    TEMPLATE = '<div {0}>{1}</div>'
+
     # Available sizes
     SIZE_MINI = 'mini'
     SIZE_SMALL = 'small'
@@ -57,14 +59,16 @@ class RublonButton(RublonWidget):
     """HTML attributes of the button's container.
 
     Any additional HTML attributes that will be added to the
-    button upon its creation, e.g. class, style, data-attributes."""
-    attributes = {}
+    button upon its creation, e.g. class, style, data-attributes.
+    Each button has its own attributes, see __init__()."""
+    attributes = None
 
     """HTML content of the button."""
     content = '<a href="https://rublon.com/">Rublon</a>'
 
     def __init__(self, rublon):
         self.rublon = rublon
+        self.attributes = {}
         self.set_size(self.SIZE_MEDIUM)
         self.set_color(self.COLOR_DARK)
 
@@ -72,7 +76,11 @@ class RublonButton(RublonWidget):
         """Convert object into string.
 
         Returns HTML container of the button that can be embedded in the website."""
-        attributes = self.attributes
+        return self.render()
+
+    def render(self):
+        """Render the button's container without changing the button's attributes."""
+        attributes = dict(self.attributes)
 
         class_parts = [self.ATTR_CLASS]
         if attributes.get('class'):
@@ -81,17 +89,12 @@ class RublonButton(RublonWidget):
         class_parts.append(self.ATTR_CLASS_SIZE_PREFIX + self.get_size())
         class_parts.append(self.ATTR_CLASS_COLOR_PREFIX + self.get_color())
 
-        attributes['class'] += ' '.join(class_parts)
+        attributes['class'] = ' '.join(class_parts)
 
         if self.get_label():
             attributes['title'] = self.get_label()
 
-        result = '<div {0}>{1}</div>'.format(
-            ' '.join(['{0}="{1}"'.format(key, htmlspecialchars(value)) for key, value in attributes]),
-            self.get_content()
-        )
-
-        return result
+        return self.TEMPLATE.format(self.create_attributes_string(attributes), self.get_content())
 
     def get_content(self):
         """Get HTML content of the button."""
@@ -1,3 +1,4 @@
+import six
 import time
 import json
 import random
@@ -32,9 +33,41 @@ class RublonConsumerScript(object):
         """PHP difference - urllib2.urlencode( ) \ """
         return self.rublon_consumer.get_api_domain() + \
             self.URL_CONSUMER_SCRIPT + '/' + \
-            b64encode(self.get_params_wrapper()) + '/' + \
+            self.get_encoded_params_wrapper() + '/' + \
             str(random.randint(1, 99999))
 
+    def get_encoded_params_wrapper(self):
+        """Get the base64-encoded signed script input parameters.
+
+        Signed parameters are reused from the consumer's script cache for repeat page
+        views of the same user, while their signature time is still fresh."""
+        if not self.rublon_consumer.is_configured():
+            return self._encode(self.get_params_wrapper())
+
+        cache = self.rublon_consumer.get_consumer_script_cache()
+        key = self.get_cache_key()
+        encoded = cache.get(key)
+        if encoded is None:
+            encoded = self._encode(self.get_params_wrapper())
+            cache.set(key, encoded, self.rublon_consumer.CONSUMER_SCRIPT_CACHE_TTL)
+        return encoded
+
+    def get_cache_key(self):
+        """Get the script cache key: the consumer and user fields of the parameters, with the email hashed.
+
+        Subclasses adding parameters in get_params() have to add them to the key too."""
+        consumer = self.rublon_consumer
+        return '\n'.join(six.text_type(part) for part in (
+            consumer.get_api_domain(),
+            consumer.system_token,
+            consumer.service_name,
+            consumer.get_current_url(),
+            self.user_id or '',
+            hash_data(self.user_email, RublonAuthParams.HASH_ALG) if self.user_email else '',
+            self.logout_listener or '',
+            consumer.get_lang() or '',
+        ))
+
     def get_params_wrapper(self):
         """Get signed script input parameters."""
         if self.rublon_consumer.is_configured():
@@ -45,6 +78,11 @@ class RublonConsumerScript(object):
         else:
             return json.dumps(self.get_params())
 
+    def _encode(self, params_wrapper):
+        if six.PY3:
+            return b64encode(params_wrapper.encode('utf-8')).decode('ascii')
+        return b64encode(params_wrapper)
+
     def get_params(self):
         params = {
             RublonAuthParams.FIELD_ORIGIN_URL : self.rublon_consumer.get_current_url(),
@@ -3,6 +3,8 @@ from .widget import RublonWidget
 
 class RublonShareAccessWidget(RublonWidget):
 
+    STATIC = True
+
     def get_widget_attributes(self):
         return {
             'id': 'RublonShareAccessWidget'
@@ -3,6 +3,8 @@ from .widget import RublonWidget
 
 class RublonSubscribeWidget(RublonWidget):
 
+    STATIC = True
+
     def get_widget_attributes(self):
         """Subscribe Widget HTML iframe attributes."""
         return {
@@ -1,9 +1,17 @@
 import six
 from rublon.functions import htmlspecialchars
 
+"""HTML of the static widgets, rendered once per process."""
+_static_html = {}
+
 
 class RublonWidget(object):
-    """Abstract base class for widgets"""
+    """Abstract base class for widgets
+
+    Rendering never changes the widget. Widgets rendering the same HTML for
+    all instances set STATIC, their HTML is rendered once per process. STATIC
+    isn't inherited: a subclass may change the attributes, it's rendered each time
+    unless it sets STATIC itself."""
 
     # Device Widget CSS attributes.
     WIDGET_CSS_FONT_COLOR = 'font-color'
@@ -11,18 +19,35 @@ class RublonWidget(object):
     WIDGET_CSS_FONT_FAMILY = 'font-family'
     WIDGET_CSS_BACKGROUND_COLOR = 'background-color'
 
+    """HTML template of the widget, filled with the attributes string."""
+    TEMPLATE = '<iframe {0}></iframe>'
+
+    """HTML template of a single attribute."""
+    TEMPLATE_ATTRIBUTE = '{0}="{1}"'
+
+    """All instances render the same HTML (the attributes don't depend on the instance)."""
+    STATIC = False
+
     def __str__(self):
         """Get iframe to load the Device Widget."""
+        if not self.STATIC or 'STATIC' not in self.__class__.__dict__:
+            return self.render()
+        html = _static_html.get(self.__class__)
+        if html is None:
+            html = _static_html[self.__class__] = self.render()
+        return html
+
+    def render(self):
+        """Render the widget's HTML."""
         merged_attrs = self.get_widget_attributes()
         merged_attrs.update(self.get_widget_css_attributes_data())
-        return '<iframe {0}></iframe>'.format(self.create_attributes_string(
-            merged_attrs
-        ))
+        return self.TEMPLATE.format(self.create_attributes_string(merged_attrs))
 
     def create_attributes_string(self, attrs):
         """Creates HTML attributes string."""
-        escaped = lambda key, value: '{0}="{1}"'.format(htmlspecialchars(key), htmlspecialchars(value))
-        return ' '.join([escaped(key, value) for key, value in six.iteritems(attrs)])
+        template = self.TEMPLATE_ATTRIBUTE
+        return ' '.join([template.format(htmlspecialchars(key), htmlspecialchars(
+            value if isinstance(value, six.string_types) else str(value))) for key, value in six.iteritems(attrs)])
 
     def get_widget_css_attributes_data(self):
         result = {}
@@ -34,4 +59,4 @@ class RublonWidget(object):
         return {}
 
     def get_widget_attributes(self):
-        pass
\ No newline at end of file
+        return {}
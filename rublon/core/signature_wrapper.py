@@ -1,13 +1,13 @@
 import json
 import random
-import hmac
 import time
-import hashlib
 import six
 import logging
 
 logger = logging.getLogger('rublon')
+from rublon.functions import json_loads
 from rublon.exceptions import RublonException
+from rublon.core.signer import get_signer
 
 
 class RublonSignatureWrapper(object):
@@ -58,6 +58,12 @@ class RublonSignatureWrapper(object):
     """Config key to skip time validation."""
     CONFIG_SKIP_TIME = 'skipTime'
 
+    """Minimum number of messages for parse_messages() to use the given executor."""
+    PARALLEL_BATCH_SIZE = 64
+
+    """Number of messages sent at once to an executor worker by parse_messages()."""
+    PARALLEL_CHUNK_SIZE = 16
+
     def __init__(self):
         self.secret_key = None
         self.body = None
@@ -73,20 +79,16 @@ class RublonSignatureWrapper(object):
     def set_input(self, input):
         """Set raw input."""
         self.raw_data = input
-        decoded = json.loads(input)
-        if self.FIELD_DATA in decoded:
-            if not isinstance(decoded[self.FIELD_DATA], dict):
-                data = json.loads(decoded[self.FIELD_DATA])
-            else:
-                data = decoded[self.FIELD_DATA]
-
-            if self.FIELD_BODY in data:
-                if not isinstance(data[self.FIELD_BODY], dict):
-                    self.body = json.loads(data[self.FIELD_BODY])
-                else:
-                    self.body = data[self.FIELD_BODY]
-            else:
-                self.body = None
+        decoded = json_loads(input)
+        data = decoded.get(self.FIELD_DATA)
+        if data is not None:
+            if not isinstance(data, dict):
+                data = json_loads(data)
+
+            body = data.get(self.FIELD_BODY)
+            if body is not None and not isinstance(body, dict):
+                body = json_loads(body)
+            self.body = body
         else:
             self.body = None
 
@@ -108,17 +110,12 @@ class RublonSignatureWrapper(object):
     @classmethod
     def verify_data(cls, data, secret_key, sign):
         """Verify data by signature and secret key."""
-        data_sign = cls.sign_data(data, secret_key)
-        return data_sign == sign
+        return get_signer(secret_key, cls.HASH_ALG).verify(data, sign)
 
     @classmethod
     def sign_data(cls, data, secret_key):
         """Sign data by secret key."""
-        if six.PY3:
-            data = data.encode('utf-8')
-            secret_key = bytes(secret_key, 'utf-8')
-
-        return hmac.new(secret_key, data, getattr(hashlib, cls.HASH_ALG.lower())).hexdigest()
+        return get_signer(secret_key, cls.HASH_ALG).sign(data)
 
     @classmethod
     def wrap(cls, secret_key, body):
@@ -147,9 +144,14 @@ class RublonSignatureWrapper(object):
     @classmethod
     def parse_message(cls, json_str, secret_key, config=None):
         """Parses signed message."""
-        if config is None:
-            config = {}
+        return cls.parse(json_str, secret_key, config).get_body()
+
+    @classmethod
+    def parse(cls, json_str, secret_key, config=None):
+        """Parses signed message into a RublonSignedMessage.
 
+        The envelope and the data field are decoded once, the signature is verified
+        before decoding the data field and the body is decoded only when accessed."""
         if not secret_key:
             raise RublonException('Empty secret')
 
@@ -158,52 +160,137 @@ class RublonSignatureWrapper(object):
 
         # Verify response json
         try:
-            response = json.loads(json_str)
+            response = json_loads(json_str)
         except ValueError:
             raise RublonException('Invalid response: {0}'.format(json_str), RublonException.CODE_INVALID_RESPONSE)
+        if not isinstance(response, dict):
+            raise RublonException('Invalid response: {0}'.format(json_str), RublonException.CODE_INVALID_RESPONSE)
 
-        if response.get(cls.FIELD_STATUS) and response[cls.FIELD_STATUS] == cls.STATUS_ERROR:
-            msg = response[cls.FIELD_STATUS] if response.get(cls.FIELD_MSG) else 'Error response: {0}'.format(json_str)
+        if response.get(cls.FIELD_STATUS) == cls.STATUS_ERROR:
+            msg = cls.STATUS_ERROR if response.get(cls.FIELD_MSG) else 'Error response: {0}'.format(json_str)
             raise RublonException(msg, RublonException.CODE_INVALID_RESPONSE)
 
-        if not response.get(cls.FIELD_SIGN):
+        sign = response.get(cls.FIELD_SIGN)
+        if not sign:
             raise RublonException('Missing sign field', RublonException.CODE_INVALID_RESPONSE)
 
-        if not response.get(cls.FIELD_DATA):
+        raw_data = response.get(cls.FIELD_DATA)
+        if not raw_data:
             raise RublonException('Missing data field', RublonException.CODE_INVALID_RESPONSE)
 
-        if not cls.verify_data(response[cls.FIELD_DATA], secret_key, response[cls.FIELD_SIGN]):
+        if not cls.verify_data(raw_data, secret_key, sign):
             raise RublonException('Invalid signature', RublonException.CODE_INVALID_RESPONSE)
 
         # Verify data field
         try:
-            data = json.loads(response[cls.FIELD_DATA])
+            data = json_loads(raw_data)
         except ValueError:
             raise RublonException('Invalid response', RublonException.CODE_INVALID_RESPONSE)
 
-        if not data.get(cls.FIELD_HEAD) or not isinstance(data[cls.FIELD_HEAD], dict):
+        head = data.get(cls.FIELD_HEAD) if isinstance(data, dict) else None
+        if not head or not isinstance(head, dict):
             raise RublonException('Invalid response data (invalid header)', RublonException.CODE_INVALID_RESPONSE)
 
         # Verify head field
-        head = data[cls.FIELD_HEAD]
-        if not config.get(cls.CONFIG_SKIP_TIME) and not (head.get(cls.FIELD_HEAD_TIME) and
-                abs(time.time() - int(head.get(cls.FIELD_HEAD_TIME))) <= cls.MESSAGE_LIFETIME):
-            raise RublonException('Invalid message time', RublonException.CODE_TIMESTAMP_ERROR)
+        if not (config and config.get(cls.CONFIG_SKIP_TIME)):
+            head_time = head.get(cls.FIELD_HEAD_TIME)
+            if not (head_time and abs(time.time() - int(head_time)) <= cls.MESSAGE_LIFETIME):
+                raise RublonException('Invalid message time', RublonException.CODE_TIMESTAMP_ERROR)
 
         # Verify body field
-        if not data.get(cls.FIELD_BODY) or not isinstance(data[cls.FIELD_BODY], six.string_types):
+        body = data.get(cls.FIELD_BODY)
+        if not body or not isinstance(body, six.string_types):
             raise RublonException('Invalid response data (no body)', RublonException.CODE_INVALID_RESPONSE)
 
-        try:
-            body = json.loads(data[cls.FIELD_BODY])
-        except ValueError:
-            body = None
-        if body and isinstance(body, dict):
-            return body
+        return RublonSignedMessage(head, body)
+
+    @classmethod
+    def parse_messages(cls, json_strs, secret_key, config=None, executor=None):
+        """Parses many signed messages, e.g. a burst of logout notifications.
+
+        Returns a list of RublonParseResult, one per message in the input order;
+        invalid messages don't stop the batch. If a concurrent.futures executor
+        (thread or process pool) is given, batches of at least PARALLEL_BATCH_SIZE
+        messages are parsed in it."""
+        json_strs = list(json_strs)
+        items = [(cls, json_str, secret_key, config) for json_str in json_strs]
+        if executor is not None and len(items) >= cls.PARALLEL_BATCH_SIZE:
+            outcomes = executor.map(_parse_message_outcome, items, chunksize=cls.PARALLEL_CHUNK_SIZE)
         else:
-            return data[cls.FIELD_BODY]
+            outcomes = map(_parse_message_outcome, items)
+
+        results = []
+        for body, error in outcomes:
+            if error is not None:
+                error = RublonException(*error)
+            results.append(RublonParseResult(body, error))
+        return results
 
     @classmethod
     def generate_random_string(self, length=100):
         alphabet = '1234567890qwertyuiopasdfghjklzxcvbnmQWERTYUIOPASDFGHJKLZXCVBNM'
-        return ''.join(random.choice(alphabet) for _ in range(length))
\ No newline at end of file
+        return ''.join(random.choice(alphabet) for _ in range(length))
+
+
+class RublonSignedMessage(object):
+    """Signed message with verified signature and header.
+
+    The body is decoded on the first access."""
+
+    _NOT_DECODED = object()
+
+    def __init__(self, head, raw_body):
+        self.head = head
+        self.raw_body = raw_body
+        self._body = self._NOT_DECODED
+
+    def get_head(self):
+        """Get message header."""
+        return self.head
+
+    def get_raw_body(self):
+        """Get message body string."""
+        return self.raw_body
+
+    def get_body(self):
+        """Get message body: decoded JSON object or the body string if it's not a JSON object."""
+        if self._body is self._NOT_DECODED:
+            try:
+                body = json_loads(self.raw_body)
+            except ValueError:
+                body = None
+            self._body = body if body and isinstance(body, dict) else self.raw_body
+        return self._body
+
+
+class RublonParseResult(object):
+    """Result of parsing a single message by RublonSignatureWrapper.parse_messages()."""
+
+    def __init__(self, body=None, error=None):
+        self.body = body
+        self.error = error
+
+    def is_valid(self):
+        return self.error is None
+
+    def get_body(self):
+        """Get message body, None if the message is invalid."""
+        return self.body
+
+    def get_error(self):
+        """Get RublonException raised by the parser, None if the message is valid."""
+        return self.error
+
+
+def _parse_message_outcome(item):
+    """Parse a single message, return (body, None) or (None, exception args).
+
+    Module-level and returning plain values, so it can be run in a process pool."""
+    cls, json_str, secret_key, config = item
+    try:
+        return cls.parse_message(json_str, secret_key, config), None
+    except RublonException as e:
+        return None, (e.message, e.code)
+    except (ValueError, TypeError, KeyError) as e:
+        # Malformed fields of a forged message, e.g. a non-string signature or a non-numeric time.
+        return None, ('Invalid message: {0}'.format(e), RublonException.CODE_INVALID_RESPONSE)
@@ -0,0 +1,72 @@
+import six
+import hmac
+import hashlib
+import threading
+
+
+def compare_digest(a, b):
+    """Compare two signatures in constant time."""
+    if isinstance(a, six.text_type):
+        a = a.encode('utf-8')
+    if isinstance(b, six.text_type):
+        b = b.encode('utf-8')
+    if hasattr(hmac, 'compare_digest'):
+        return hmac.compare_digest(a, b)
+
+    # Python < 2.7.7
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(bytearray(a), bytearray(b)):
+        result |= x ^ y
+    return result == 0
+
+
+class RublonSigner(object):
+    """HMAC signer for a single secret key.
+
+    The HMAC state is keyed once and copied for each message, so the secret key
+    is not encoded and processed again on every signature."""
+
+    """Default hash algorithm name."""
+    HASH_ALG = 'sha256'
+
+    def __init__(self, secret_key, hash_alg=None):
+        if isinstance(secret_key, six.text_type):
+            secret_key = secret_key.encode('utf-8')
+        self.hash_alg = (hash_alg or self.HASH_ALG).lower()
+        self._hmac = hmac.new(secret_key, digestmod=getattr(hashlib, self.hash_alg))
+
+    def sign(self, data):
+        """Get hex HMAC signature of the data (str or bytes)."""
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+        signature = self._hmac.copy()
+        signature.update(data)
+        return signature.hexdigest()
+
+    def verify(self, data, signature):
+        """Check the data signature in constant time, False if it's not a string (e.g. a number from JSON)."""
+        if not signature or not isinstance(signature, (six.string_types, bytes)):
+            return False
+        return compare_digest(self.sign(data), signature)
+
+
+"""Maximum number of signers kept by get_signer()."""
+SIGNERS_CACHE_SIZE = 100
+
+_signers = {}
+_signers_lock = threading.Lock()
+
+
+def get_signer(secret_key, hash_alg=None):
+    """Get a cached signer for given secret key."""
+    key = (secret_key, (hash_alg or RublonSigner.HASH_ALG).lower())
+    signer = _signers.get(key)
+    if signer is None:
+        signer = RublonSigner(secret_key, hash_alg)
+        with _signers_lock:
+            if len(_signers) >= SIGNERS_CACHE_SIZE:
+                _signers.clear()
+            _signers[key] = signer
+    return signer
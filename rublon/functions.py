@@ -1,4 +1,6 @@
+import sys
 import six
+import json
 import hashlib
 
 
@@ -18,4 +20,42 @@ def empty(var):
     if not var:
         return True
     else:
-        return False
\ No newline at end of file
+        return False
+
+
+def _decoding_json_loads(data):
+    """json.loads() for Python 3 < 3.6, which does not accept bytes."""
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+"""Names of the supported JSON decoders, the fastest first."""
+JSON_BACKENDS = ('orjson', 'ujson', 'json')
+
+_json_loads = None
+
+
+def set_json_backend(name=None):
+    """Select JSON decoder used by json_loads(): one of JSON_BACKENDS
+    or the fastest one installed if name is None."""
+    global _json_loads
+    for backend in JSON_BACKENDS if name is None else (name,):
+        if backend == 'json':
+            _json_loads = _decoding_json_loads if six.PY3 and sys.version_info < (3, 6) else json.loads
+            return backend
+        try:
+            _json_loads = __import__(backend).loads
+            return backend
+        except ImportError:
+            if name is not None:
+                raise
+
+
+def json_loads(data):
+    """Decode JSON from str or UTF-8 bytes with the selected JSON backend.
+
+    Raises ValueError on invalid input, whatever the backend."""
+    if _json_loads is None:
+        set_json_backend()
+    return _json_loads(data)
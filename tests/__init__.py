@@ -2,11 +2,26 @@ import unittest
 
 from mock import patch, Mock
 import os
+import sys
+import json
+import threading
+import subprocess
+import time
 from nose.tools import assert_raises, assert_equals
 from rublon import Rublon2Factor
 from rublon.core.api.begin_transaction import RublonAPIBeginTransaction
 from rublon.exceptions import RublonConfigurationError
 from rublon.core.api.exceptions import RublonAPIException
+from rublon.core.signature_wrapper import RublonSignatureWrapper
+from rublon.core.api import RublonAPIClient
+from rublon.core.api.pool import RublonCurlPool
+from rublon.core.api.transport import RublonMemoryTransport, RublonHTTPTransport, RublonTransportError
+from rublon.core.api.curl_transport import RublonCurlTransport
+from rublon.core.api.credentials import RublonApiCredentials
+from rublon.core.cache import RublonMemoryCache
+from rublon.core.api.circuit_breaker import RublonCircuitBreaker
+from rublon.core.api.exceptions import CircuitOpen_RublonClientException
+from .stub_server import RublonStubServer
 
 
 RESPONSE_HEADERS = '''HTTP/1.1 200 OK
@@ -93,6 +108,167 @@ class Rublon2FactorAuthTests(RublonTestBase):
         fake_class.get_web_uri.assert_called_once_with()
 
 
+class Rublon2FactorGetCredentialsTests(RublonTestBase):
+
+    def setUp(self):
+        self.access_token = 'b' * 100
+        self.server = RublonStubServer(self.secret_key, {'/api/v3/credentials': {'userId': self.own_user_id}})
+
+    def test_credentials_are_cached_across_instances_with_the_same_system_token(self):
+        with self.server:
+            first = Rublon2Factor('cache-test-token', self.secret_key, self.server.get_url())
+            second = Rublon2Factor('cache-test-token', self.secret_key, self.server.get_url())
+            assert_equals(first.get_credentials(self.access_token).get_user_id(),
+                          second.get_credentials(self.access_token).get_user_id())
+        assert_equals(1, len(self.server.requests))
+
+    def test_concurrent_requests_with_the_same_token_share_one_response(self):
+        body = json.dumps({'status': 'OK', 'result': {'userId': self.own_user_id}}).encode('utf-8')
+
+        def handler(url, headers, request_body):
+            time.sleep(0.2)
+            return 200, {'X-Rublon-Signature': RublonSignatureWrapper.sign_data(body.decode('utf-8'),
+                                                                                self.secret_key)}, body
+        transport = RublonMemoryTransport(handler=handler)
+        user_ids = []
+
+        def get_credentials():
+            rublon = Rublon2Factor(self.system_token, self.secret_key).set_transport(transport)
+            rublon.set_credentials_cache(RublonMemoryCache())
+            user_ids.append(rublon.get_credentials(self.access_token).get_user_id())
+
+        threads = [threading.Thread(target=get_credentials) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert_equals([self.own_user_id] * 3, user_ids)
+        assert_equals(1, len(transport.requests))
+
+
+class Rublon2FactorUnprotectedUsersTests(RublonTestBase):
+
+    def setUp(self):
+        self.transport = RublonMemoryTransport(self.secret_key)
+        self.rublon = self.get_rublon2factor().set_transport(self.transport)
+        self.rublon.set_unprotected_users_cache(RublonMemoryCache(max_size=10, ttl=60))
+        # Other tests replace _request of the class, make sure the transport is used.
+        request_patch = patch.object(RublonAPIBeginTransaction, '_request', RublonAPIClient._request)
+        request_patch.start()
+        self.addCleanup(request_patch.stop)
+
+    def test_unprotected_user_is_remembered(self):
+        assert_equals(None, self.rublon.auth(self.callback_url, self.own_user_id, self.invalid_email))
+        assert_equals(None, self.rublon.auth(self.callback_url, self.own_user_id, self.invalid_email))
+        assert_equals(1, len(self.transport.requests))
+        assert_equals(0.5, self.rublon.get_unprotected_users_stats()['hit_rate'])
+
+    def test_invalidated_user_is_checked_again(self):
+        self.rublon.auth(self.callback_url, self.own_user_id, self.invalid_email)
+        self.rublon.invalidate_unprotected_user(self.own_user_id, self.invalid_email)
+        self.transport.set_result('/api/v3/beginTransaction', {'webURI': 'https://code.rublon.com/api/v3/web/a'})
+        assert_equals('https://code.rublon.com/api/v3/web/a',
+                      self.rublon.auth(self.callback_url, self.own_user_id, self.invalid_email))
+
+    def test_unconfigured_consumer_raises_exception_for_remembered_user(self):
+        rublon = Rublon2Factor(system_token=None, secret_key=None)
+        rublon.set_unprotected_users_cache(RublonMemoryCache()).store_unprotected_user(
+            self.own_user_id, self.invalid_email)
+        assert_raises(RublonConfigurationError, rublon.auth, self.callback_url, self.own_user_id, self.invalid_email)
+
+    def test_unprotected_users_are_not_remembered_by_default(self):
+        rublon = self.get_rublon2factor().set_transport(self.transport)
+        rublon.auth(self.callback_url, self.own_user_id, self.invalid_email)
+        rublon.auth(self.callback_url, self.own_user_id, self.invalid_email)
+        assert_equals(2, len(self.transport.requests))
+
+
+class Rublon2FactorCircuitBreakerTests(RublonTestBase):
+
+    def setUp(self):
+        self.rublon = self.get_rublon2factor().set_transport(RublonMemoryTransport(self.secret_key))
+        self.breaker = RublonCircuitBreaker()
+        for _ in range(RublonCircuitBreaker.DEFAULT_FAILURE_THRESHOLD):
+            self.breaker.record(self.rublon.get_api_domain(), False)
+        # Undo the class-level patch of other tests, auth() has to reach the transport.
+        patcher = patch.object(RublonAPIBeginTransaction, '_request', RublonAPIClient._request)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_auth_raises_exception_while_circuit_is_open(self):
+        self.rublon.set_circuit_breaker(self.breaker)
+        assert_raises(CircuitOpen_RublonClientException, self.rublon.auth, self.callback_url, self.own_user_id,
+                      self.protected_email)
+        assert_equals([], self.rublon.get_transport().requests)
+
+    def test_auth_bypasses_rublon_while_circuit_is_open(self):
+        self.rublon.set_circuit_breaker(self.breaker, bypass=True)
+        assert_equals(None, self.rublon.auth(self.callback_url, self.own_user_id, self.protected_email))
+        assert_equals([], self.rublon.get_transport().requests)
+
+
+class RublonConsumerWarmUpTests(RublonTestBase):
+
+    def setUp(self):
+        self.server = RublonStubServer(self.secret_key, {RublonApiCredentials.url_path: {'userId': 1}})
+
+    def test_warm_up_opens_curl_connections_used_by_requests(self):
+        with self.server:
+            rublon = Rublon2Factor(self.system_token, self.secret_key, self.server.get_url())
+            rublon.set_transport(RublonCurlTransport(pool=RublonCurlPool()))
+            rublon.warm_up(connections=2)
+            assert_equals(2, self.server.connections)
+            rublon.get_credentials('c' * 100)
+        assert_equals(2, self.server.connections)
+
+    def test_curl_warm_up_accepts_fractional_timeout(self):
+        with self.server:
+            RublonCurlTransport(pool=RublonCurlPool()).warm_up(self.server.get_url(), 0.5)
+        assert_equals(1, self.server.heads)
+
+    def test_warm_up_opens_http_connections_used_by_requests(self):
+        with self.server:
+            rublon = Rublon2Factor(self.system_token, self.secret_key, self.server.get_url())
+            rublon.set_transport(RublonHTTPTransport())
+            rublon.warm_up()
+            rublon.get_credentials('d' * 100)
+        assert_equals(1, self.server.connections)
+
+    def test_keep_alive_refreshes_connections(self):
+        for transport in [RublonCurlTransport(pool=RublonCurlPool()), RublonHTTPTransport()]:
+            server = RublonStubServer(self.secret_key)
+            with server:
+                rublon = Rublon2Factor(self.system_token, self.secret_key, server.get_url())
+                rublon.set_transport(transport)
+                rublon.KEEP_ALIVE_INTERVAL = 0.01
+                keep_alive = rublon.start_keep_alive()
+                for _ in range(100):
+                    if server.heads >= 2:
+                        break
+                    time.sleep(0.01)
+                keep_alive.stop()
+            assert server.heads >= 2
+            assert_equals(1, server.connections)
+
+    def test_http_warm_up_replaces_connection_closed_by_server(self):
+        transport = RublonHTTPTransport()
+        with self.server:
+            rublon = Rublon2Factor(self.system_token, self.secret_key, self.server.get_url())
+            rublon.set_transport(transport).warm_up()
+            for connections in transport._idle.values():
+                connections[0][0].sock.close()
+            rublon.warm_up()
+            rublon.get_credentials('e' * 100)
+        assert_equals(2, self.server.heads)
+        assert_equals(2, self.server.connections)
+
+    def test_warm_up_raises_error_if_api_is_not_reachable(self):
+        with self.server:
+            url = self.server.get_url()
+        rublon = Rublon2Factor(self.system_token, self.secret_key, url).set_transport(RublonHTTPTransport())
+        assert_raises(RublonTransportError, rublon.warm_up)
+
+
 class RublonAPIBeginTransactionTests(RublonTestBase):
 
     def setUp(self):
@@ -111,3 +287,120 @@ class Rublon2FactorGuiTests(RublonTestBase):
 
     def setUp(self):
         pass
+
+
+class RublonImportTests(unittest.TestCase):
+
+    def import_rublon(self):
+        """Import rublon in a new interpreter, return the root logger's handlers and the lazy modules imported."""
+        script = ('import sys, json, logging, rublon\n'
+                  'lazy = ["http.client", "httplib", "ssl", "pycurl", "rublon.core.api.transport", "rublon.core.html"]\n'
+                  'print(json.dumps([len(logging.root.handlers), [m for m in lazy if m in sys.modules]]))')
+        output = subprocess.check_output([sys.executable, '-c', script])
+        return json.loads(output.decode('utf-8'))
+
+    def test_import_does_not_configure_logging_nor_load_transports(self):
+        assert_equals([0, []], self.import_rublon())
+
+    def test_import_without_logging_null_handler(self):
+        # Python 2.6 has no logging.NullHandler.
+        script = ('import logging\n'
+                  'del logging.NullHandler\n'
+                  'import rublon\n'
+                  'print(type(logging.getLogger("rublon").handlers[0]).__name__)')
+        output = subprocess.check_output([sys.executable, '-c', script])
+        assert_equals('_RublonNullHandler', output.decode('utf-8').strip())
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'asyncio variants require Python 3.5+')
+class AsyncRublon2FactorTests(RublonTestBase):
+
+    def setUp(self):
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        self.access_token = 'a' * 100
+        self.server = RublonStubServer(self.secret_key, {
+            '/api/v3/beginTransaction': {'webURI': 'https://code.rublon.com/api/v3/web/abc'},
+            '/api/v3/credentials': {'userId': self.own_user_id},
+        })
+
+    def tearDown(self):
+        if hasattr(self, 'loop'):
+            self.loop.close()
+
+    def run_coroutine(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def get_async_rublon2factor(self):
+        from rublon.aio import AsyncRublon2Factor
+        return AsyncRublon2Factor(self.system_token, self.secret_key, self.server.get_url())
+
+    def test_auth_of_unconfigured_consumer_raises_exception(self):
+        from rublon.aio import AsyncRublon2Factor
+        rublon = AsyncRublon2Factor(None, None).set_unprotected_users_cache(RublonMemoryCache())
+        rublon.store_unprotected_user(self.own_user_id, self.invalid_email)
+        assert_raises(RublonConfigurationError, self.run_coroutine,
+                      rublon.auth(self.callback_url, self.own_user_id, self.invalid_email))
+
+    def test_auth_returns_web_uri(self):
+        with self.server:
+            rublon = self.get_async_rublon2factor()
+            result = self.run_coroutine(rublon.auth(self.callback_url, self.own_user_id, self.protected_email))
+        assert_equals('https://code.rublon.com/api/v3/web/abc', result)
+
+    def test_confirm_sends_confirm_message(self):
+        with self.server:
+            rublon = self.get_async_rublon2factor()
+            self.run_coroutine(rublon.confirm(self.callback_url, self.own_user_id, self.protected_email, 'Sure?'))
+        assert_equals('Sure?', self.server.requests[0][1]['confirmMessage'])
+
+    def test_auth_returns_none_for_unprotected_user(self):
+        self.server.results = {}
+        with self.server:
+            rublon = self.get_async_rublon2factor()
+            result = self.run_coroutine(rublon.auth(self.callback_url, self.own_user_id, self.invalid_email))
+        assert result is None
+
+    def test_concurrent_requests_share_connections(self):
+        import asyncio
+        from rublon.core.api.aio import RublonAsyncTransport
+        from rublon.aio import AsyncRublon2Factor
+
+        with self.server:
+            transport = RublonAsyncTransport(max_connections=2)
+            rublon = AsyncRublon2Factor(self.system_token, self.secret_key, self.server.get_url(),
+                                        async_transport=transport)
+            calls = [self.loop.create_task(rublon.auth(self.callback_url, i, self.protected_email))
+                     for i in range(10)]
+            results = self.run_coroutine(asyncio.gather(*calls))
+        assert_equals(10, len([r for r in results if r]))
+        assert self.server.connections <= 2
+
+    def test_get_credentials(self):
+        with self.server:
+            rublon = self.get_async_rublon2factor()
+            credentials = self.run_coroutine(rublon.get_credentials(self.access_token))
+        assert_equals(self.own_user_id, credentials.get_user_id())
+
+    def test_concurrent_requests_with_the_same_token_share_one_response(self):
+        import asyncio
+        with self.server:
+            rublon = self.get_async_rublon2factor().set_credentials_cache(RublonMemoryCache())
+            calls = [self.loop.create_task(rublon.get_credentials(self.access_token)) for _ in range(3)]
+            results = self.run_coroutine(asyncio.gather(*calls))
+        assert_equals([self.own_user_id] * 3, [credentials.get_user_id() for credentials in results])
+        assert_equals(1, len(self.server.requests))
+
+    def test_cancelled_first_request_does_not_cancel_shared_response(self):
+        import asyncio
+        self.server.latency = 0.1
+        with self.server:
+            rublon = self.get_async_rublon2factor()
+            first = self.loop.create_task(rublon.get_credentials(self.access_token))
+            second = self.loop.create_task(rublon.get_credentials(self.access_token))
+            self.run_coroutine(asyncio.sleep(0.05))
+            first.cancel()
+            credentials = self.run_coroutine(second)
+        assert first.cancelled()
+        assert_equals(self.own_user_id, credentials.get_user_id())
+        assert_equals(1, len(self.server.requests))
@@ -1,7 +1,40 @@
-from .. import RublonTestBase
-from nose.tools import assert_raises
+import os
+import ssl
+import sys
+import socket
+import time
+import unittest
+import threading
+from .. import RublonTestBase, RublonStubServer
+from rublon import Rublon2Factor
+from mock import Mock, patch
+from six.moves.urllib.request import urlopen
+from nose.tools import assert_raises, assert_equals
+from rublon.core.api.pool import RublonCurlPool
+from rublon.core.api.transport import RublonHTTPTransport, RublonMemoryTransport, RublonTransportError, \
+    RublonConnectError, get_public_key_pin
+from rublon.core.api.policy import RublonRequestPolicy, RublonLatencyTracker
+from rublon.core.api.circuit_breaker import RublonCircuitBreaker
+from rublon.core.api.single_flight import RublonSingleFlight
+from rublon.core.api.metrics import RublonMetrics, RublonStatsDExporter, start_prometheus_server
+from rublon.core.api.tracing import RublonRecordingTracer, RublonOpenTelemetryTracer, use_span, get_current_span
+from rublon.core.api.curl_transport import RublonCurlTransport, RublonCurlHTTP2Transport
+from rublon.core.api.batch import RublonBatchExecutor
+from rublon.core.api.features import RublonAPIGetAvailableFeatures
+from rublon.core.api.check_user_device import RublonAPICheckUserDevice, RublonBulkDeviceCheck
+from rublon.core.cache import RublonMemoryCache
+from rublon.core.signature_wrapper import RublonSignatureWrapper
+from rublon.core.signer import get_signer
 from rublon.core.api.credentials import RublonApiCredentials
-from rublon.core.api.exceptions import UnknownAccessToken_RublonAPIException
+from rublon.core.api.exceptions import UnknownAccessToken_RublonAPIException, UserNotFound_RublonAPIException, \
+    RublonClientException, CircuitOpen_RublonClientException, InvalidJSON_RublonClientException
+
+try:
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+except ImportError:
+    InMemorySpanExporter = None
 
 
 class RublonApiCredentialsTests(RublonTestBase):
@@ -10,3 +43,702 @@ class RublonApiCredentialsTests(RublonTestBase):
         consumer = self.get_rublon2factor()
         credentials = RublonApiCredentials(consumer, 'a' * 100)
         assert_raises(UnknownAccessToken_RublonAPIException, credentials.perform)
+
+
+class RublonCurlPoolTests(RublonTestBase):
+
+    def setUp(self):
+        self.pool = RublonCurlPool(max_size=2, idle_timeout=60)
+
+    def test_released_handle_is_reused_for_the_same_domain(self):
+        curl = self.pool.acquire('https://code.rublon.com', 'ca.pem')
+        self.pool.release('https://code.rublon.com', 'ca.pem', curl)
+        assert self.pool.acquire('https://code.rublon.com', 'ca.pem') is curl
+
+    def test_handle_is_not_shared_between_domains(self):
+        curl = self.pool.acquire('https://code.rublon.com', 'ca.pem')
+        self.pool.release('https://code.rublon.com', 'ca.pem', curl)
+        assert self.pool.acquire('https://other.rublon.com', 'ca.pem') is not curl
+
+    def test_pool_size_is_bounded(self):
+        handles = [self.pool.acquire('https://code.rublon.com', 'ca.pem') for _ in range(3)]
+        for curl in handles:
+            self.pool.release('https://code.rublon.com', 'ca.pem', curl)
+        assert_equals(2, self.pool.size('https://code.rublon.com', 'ca.pem'))
+
+    def test_idle_handles_are_evicted(self):
+        curl = self.pool.acquire('https://code.rublon.com', 'ca.pem')
+        self.pool.release('https://code.rublon.com', 'ca.pem', curl)
+        with patch('rublon.core.api.pool.time.time', Mock(return_value=time.time() + 61)):
+            assert self.pool.acquire('https://code.rublon.com', 'ca.pem') is not curl
+        assert_equals(0, self.pool.size())
+
+    def test_pool_is_reset_in_forked_child(self):
+        curl = self.pool.acquire('https://code.rublon.com', 'ca.pem')
+        self.pool.release('https://code.rublon.com', 'ca.pem', curl)
+        self.pool._pid = -1
+        assert self.pool.acquire('https://code.rublon.com', 'ca.pem') is not curl
+        assert_equals(0, self.pool.size())
+
+
+class RublonAPIClientResponseTests(RublonTestBase):
+
+    def setUp(self):
+        self.body = b'{"status": "OK", "result": {"userId": 1}}'
+        self.header_lines = [
+            b'HTTP/1.1 200 OK\r\n',
+            b'Content-Type: application/json\r\n',
+            'X-Rublon-Signature: {0}\r\n'.format(RublonSignatureWrapper.sign_data(
+                self.body.decode('utf-8'), self.secret_key)).encode('latin-1'),
+        ]
+        self.client = RublonApiCredentials(self.get_rublon2factor(), 'a' * 100)
+
+    def test_response_with_header_lines_and_bytes_body_is_validated(self):
+        self.client._process_response([self.header_lines, self.body])
+        self.client._validate_response()
+        assert_equals('200', self.client.response_http_status_code)
+        assert_equals(1, self.client.get_user_id())
+
+    def test_response_body_which_is_not_json_object_is_invalid(self):
+        self.client._process_response([self.header_lines, b'[1, 2]'])
+        assert_raises(InvalidJSON_RublonClientException, self.client._validate_response)
+
+    def test_http2_status_line_is_parsed(self):
+        self.header_lines[0] = b'HTTP/2 200\r\n'
+        self.client._process_response([self.header_lines, self.body])
+        assert_equals('200', self.client.response_http_status_code)
+
+    def test_raw_response_is_built_on_demand(self):
+        self.client._process_response([self.header_lines, self.body])
+        assert self.client.get_raw_response().startswith('HTTP/1.1 200 OK\r\nContent-Type: application/json')
+        assert self.client.get_raw_response().endswith(self.body.decode('utf-8'))
+
+
+class RublonTransportTests(RublonTestBase):
+
+    def setUp(self):
+        self.consumer = self.get_rublon2factor()
+
+    def test_memory_transport_answers_without_sockets(self):
+        transport = RublonMemoryTransport(self.secret_key).set_result(RublonApiCredentials.url_path, {'userId': 1})
+        self.consumer.set_transport(transport)
+        assert_equals(1, RublonApiCredentials(self.consumer, 'a' * 100).perform().get_user_id())
+        url, headers, body = transport.requests[0]
+        assert url.endswith(RublonApiCredentials.url_path)
+        assert 'User-Agent: rublon-php-sdk' in headers
+
+    def test_memory_transport_answers_unknown_paths_with_error(self):
+        self.consumer.set_transport(RublonMemoryTransport(self.secret_key))
+        assert_raises(UserNotFound_RublonAPIException, RublonApiCredentials(self.consumer, 'a' * 100).perform)
+
+    def test_http_transport_reuses_connection(self):
+        with RublonStubServer(self.secret_key, {RublonApiCredentials.url_path: {'userId': 1}}) as server:
+            self.consumer.api_server = server.get_url()
+            self.consumer.set_transport(RublonHTTPTransport())
+            for _ in range(3):
+                assert_equals(1, RublonApiCredentials(self.consumer, 'a' * 100).perform().get_user_id())
+        assert_equals(1, server.connections)
+
+    def test_http_transport_resends_request_if_server_closed_idle_connection(self):
+        with RublonStubServer(self.secret_key, {RublonApiCredentials.url_path: {'userId': 1}}) as server:
+            server.httpd.RequestHandlerClass.timeout = 0.05
+            self.consumer.api_server = server.get_url()
+            self.consumer.set_transport(RublonHTTPTransport())
+            assert_equals(1, RublonApiCredentials(self.consumer, 'a' * 100).perform().get_user_id())
+            time.sleep(0.2)
+            assert_equals(1, RublonApiCredentials(self.consumer, 'b' * 100).perform().get_user_id())
+        assert_equals(2, server.connections)
+        assert_equals(2, len(server.requests))
+
+    def test_http_transport_does_not_resend_timed_out_request(self):
+        transport = RublonHTTPTransport()
+        with RublonStubServer(self.secret_key) as server:
+            url = server.get_url() + RublonApiCredentials.url_path
+            transport.request(url, [], b'{}', 5)
+            server.latency = 0.5
+            assert_raises(RublonTransportError, transport.request, url, [], b'{}', 0.2)
+            time.sleep(0.4)
+        assert_equals(2, len(server.requests))
+        assert_equals(1, server.connections)
+
+    def test_transport_error_raises_client_exception(self):
+        with RublonStubServer(self.secret_key) as server:
+            self.consumer.api_server = server.get_url()
+        self.consumer.set_transport(RublonHTTPTransport())
+        assert_raises(RublonClientException, RublonApiCredentials(self.consumer, 'a' * 100).perform)
+
+    def test_multiplexing_transport_caps_connections_of_concurrent_requests(self):
+        transport = RublonCurlHTTP2Transport(max_host_connections=2)
+        user_ids = []
+
+        def perform():
+            user_ids.append(RublonApiCredentials(self.consumer, 'a' * 100).perform().get_user_id())
+
+        with RublonStubServer(self.secret_key, {RublonApiCredentials.url_path: {'userId': 1}}) as server:
+            self.consumer.api_server = server.get_url()
+            self.consumer.set_transport(transport)
+            threads = [threading.Thread(target=perform) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            transport.close()
+        assert_equals([1] * 8, user_ids)
+        assert server.connections <= 2
+
+    def test_multiplexing_transport_error_raises_client_exception(self):
+        with RublonStubServer(self.secret_key) as server:
+            self.consumer.api_server = server.get_url()
+        self.consumer.set_transport(RublonCurlHTTP2Transport())
+        assert_raises(RublonClientException, RublonApiCredentials(self.consumer, 'a' * 100).perform)
+
+
+class RublonRequestPolicyTests(RublonTestBase):
+
+    def setUp(self):
+        self.consumer = self.get_rublon2factor()
+        self.transport = RublonMemoryTransport(self.secret_key) \
+            .set_result(RublonApiCredentials.url_path, {'userId': 1}) \
+            .set_result(RublonAPIGetAvailableFeatures.url_path, {'features': {'remoteLogout': True}})
+        self.consumer.set_transport(self.transport)
+
+    def fail_first_requests(self, *errors):
+        request = self.transport.request
+        errors = list(errors)
+
+        def side_effect(*args):
+            if errors:
+                raise errors.pop(0)
+            return request(*args)
+        self.transport.request = Mock(side_effect=side_effect)
+        return self.transport.request
+
+    def test_requests_which_were_not_sent_are_retried(self):
+        request = self.fail_first_requests(RublonConnectError('Connection refused.'))
+        self.consumer.set_policy(RublonRequestPolicy(retries=1, backoff=0))
+        assert_equals(1, RublonApiCredentials(self.consumer, 'a' * 100).perform().get_user_id())
+        assert_equals(2, request.call_count)
+
+    def test_sent_requests_are_retried_only_if_idempotent(self):
+        request = self.fail_first_requests(RublonTransportError('Timeout.'), RublonTransportError('Timeout.'))
+        self.consumer.set_policy(RublonRequestPolicy(retries=1, backoff=0))
+        assert_raises(RublonClientException, RublonApiCredentials(self.consumer, 'a' * 100).perform)
+        assert_equals(1, request.call_count)
+        assert_equals({'remoteLogout': True}, RublonAPIGetAvailableFeatures(self.consumer).perform().get_features())
+        assert_equals(3, request.call_count)
+
+    def test_unavailable_responses_to_idempotent_requests_are_retried(self):
+        body = b'{"status": "OK", "result": {"features": {}}}'
+        statuses = [503, 200]
+        self.consumer.set_transport(RublonMemoryTransport(handler=lambda url, headers, request_body: (
+            statuses.pop(0), {'X-Rublon-Signature': get_signer(self.secret_key).sign(body)}, body)))
+        self.consumer.set_policy(RublonRequestPolicy(retries=2, backoff=0))
+        assert_equals({}, RublonAPIGetAvailableFeatures(self.consumer).perform().get_features())
+        assert_equals([], statuses)
+
+    def test_slow_idempotent_request_is_hedged(self):
+        body = b'{"status": "OK", "result": {"features": {}}}'
+        delays = [2, 0]
+
+        def handler(url, headers, request_body):
+            time.sleep(delays.pop(0))
+            return 200, {'X-Rublon-Signature': get_signer(self.secret_key).sign(body)}, body
+        self.consumer.set_transport(RublonMemoryTransport(handler=handler))
+        self.consumer.set_policy(RublonRequestPolicy(hedge_delay=0.05))
+        start = time.time()
+        assert_equals({}, RublonAPIGetAvailableFeatures(self.consumer).perform().get_features())
+        assert time.time() - start < 1
+
+    def test_hedged_request_raises_unexpected_transport_errors(self):
+        def handler(url, headers, request_body):
+            time.sleep(0.1)
+            raise ValueError('Broken transport.')
+        self.consumer.set_transport(RublonMemoryTransport(handler=handler))
+        self.consumer.set_policy(RublonRequestPolicy(hedge_delay=0.05, total_timeout=5))
+        start = time.time()
+        assert_raises(ValueError, RublonAPIGetAvailableFeatures(self.consumer).perform)
+        assert time.time() - start < 1
+
+    def test_hedged_request_is_bounded_by_deadline(self):
+        self.consumer.set_transport(RublonMemoryTransport(handler=lambda *args: time.sleep(5)))
+        self.consumer.set_policy(RublonRequestPolicy(hedge_delay=0.05, total_timeout=0.3))
+        start = time.time()
+        assert_raises(RublonClientException, RublonAPIGetAvailableFeatures(self.consumer).perform)
+        assert time.time() - start < 1
+
+    def test_hedged_request_returns_info_of_winning_attempt(self):
+        attempts = [(0.5, 'slow'), (0, 'fast')]
+
+        def request(url, headers, request_body, timeout, connect_timeout=None, read_timeout=None, info=None):
+            delay, name = attempts.pop(0)
+            time.sleep(delay)
+            info['attempt'] = name
+            return ['HTTP/1.1 200 OK'], name
+        transport = Mock(request=Mock(side_effect=request))
+        info = {}
+        response = RublonRequestPolicy(hedge_delay=0.05).request(transport, 'https://x/api', {}, b'', 5, True, info)
+        assert_equals('fast', response[1])
+        assert_equals({'attempt': 'fast'}, info)
+
+    def test_hedge_delay_follows_latency_percentile(self):
+        policy = RublonRequestPolicy(hedge_delay=1, hedge_percentile=0.95)
+        url = self.consumer.get_api_domain() + RublonAPIGetAvailableFeatures.url_path
+        assert_equals(1, policy.get_hedge_delay(url))
+        for i in range(100):
+            policy.tracker.add(RublonAPIGetAvailableFeatures.url_path, i / 1000.0)
+        assert_equals(0.095, policy.get_hedge_delay(url))
+
+    def test_latency_tracker_keeps_latest_times(self):
+        tracker = RublonLatencyTracker(window=10)
+        for i in range(20):
+            tracker.add('/x', i)
+        assert_equals(19, tracker.get_percentile('/x', 1))
+        assert_equals(10, tracker.get_percentile('/x', 0))
+        assert_equals(None, tracker.get_percentile('/y', 0.5))
+
+    def test_transports_report_connection_errors(self):
+        with RublonStubServer(self.secret_key) as server:
+            url = server.get_url()
+        for transport in (RublonHTTPTransport(), RublonCurlTransport(pool=RublonCurlPool())):
+            assert_raises(RublonConnectError, transport.request, url, [], b'{}', 5)
+
+    def test_transports_time_out_waiting_for_response(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(8)
+        url = 'http://127.0.0.1:{0}/'.format(listener.getsockname()[1])
+        try:
+            for transport in (RublonHTTPTransport(), RublonCurlTransport(pool=RublonCurlPool())):
+                start = time.time()
+                with assert_raises(RublonTransportError) as context:
+                    transport.request(url, [], b'{}', 30, read_timeout=0.2)
+                assert not isinstance(context.exception, RublonConnectError)
+                assert time.time() - start < 5
+        finally:
+            listener.close()
+
+
+class RublonCircuitBreakerTests(RublonTestBase):
+
+    def setUp(self):
+        self.consumer = self.get_rublon2factor()
+        self.statuses = []
+        self.transport = RublonMemoryTransport(self.secret_key, handler=self.handle)
+        self.breaker = RublonCircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+        self.consumer.set_transport(self.transport).set_circuit_breaker(self.breaker)
+        self.domain = self.consumer.get_api_domain()
+
+    def handle(self, url, headers, body):
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status is None:
+            raise RublonTransportError('Connection refused.')
+        body = b'{"status": "OK", "result": {"features": {}}}'
+        return status, {'X-Rublon-Signature': get_signer(self.secret_key).sign(body)}, body
+
+    def perform(self):
+        return RublonAPIGetAvailableFeatures(self.consumer).perform()
+
+    def test_circuit_opens_after_consecutive_failures_and_fails_fast(self):
+        self.statuses = [None, 503]
+        for _ in range(2):
+            assert_raises(RublonClientException, self.perform)
+        assert_equals(RublonCircuitBreaker.STATE_OPEN, self.breaker.get_state(self.domain))
+        assert_raises(CircuitOpen_RublonClientException, self.perform)
+        assert_equals(2, len(self.transport.requests))
+
+    def test_api_errors_and_successes_reset_failures(self):
+        self.statuses = [None, 200, None]
+        assert_raises(RublonClientException, self.perform)
+        self.perform()
+        assert_raises(RublonClientException, self.perform)
+        self.consumer.set_transport(RublonMemoryTransport(self.secret_key))
+        assert_raises(UserNotFound_RublonAPIException, self.perform)
+        assert_equals(RublonCircuitBreaker.STATE_CLOSED, self.breaker.get_state(self.domain))
+
+    def test_half_open_probe_closes_or_opens_circuit(self):
+        self.statuses = [None, None, None]
+        for _ in range(2):
+            assert_raises(RublonClientException, self.perform)
+        time.sleep(0.05)
+        assert_equals(RublonCircuitBreaker.STATE_HALF_OPEN, self.breaker.get_state(self.domain))
+        assert_raises(RublonClientException, self.perform)
+        assert_raises(CircuitOpen_RublonClientException, self.perform)
+        time.sleep(0.05)
+        self.perform()
+        assert_equals(RublonCircuitBreaker.STATE_CLOSED, self.breaker.get_state(self.domain))
+
+    def test_half_open_circuit_lets_through_only_probes(self):
+        self.breaker.record(self.domain, False)
+        self.breaker.record(self.domain, False)
+        time.sleep(0.05)
+        assert self.breaker.allow(self.domain)
+        assert not self.breaker.allow(self.domain)
+
+    def test_slow_calls_count_as_failures(self):
+        breaker = RublonCircuitBreaker(failure_threshold=1, slow_call_threshold=0.5)
+        breaker.record(self.domain, True, 0.1)
+        assert_equals(RublonCircuitBreaker.STATE_CLOSED, breaker.get_state(self.domain))
+        breaker.record(self.domain, True, 1)
+        assert_equals(RublonCircuitBreaker.STATE_OPEN, breaker.get_state(self.domain))
+        breaker.reset()
+        assert_equals(RublonCircuitBreaker.STATE_CLOSED, breaker.get_state(self.domain))
+
+
+class RublonSingleFlightTests(RublonTestBase):
+
+    def run_concurrently(self, single_flight, keys, function):
+        results = []
+
+        def call(key):
+            try:
+                results.append(single_flight.do(key, function))
+            except Exception as e:
+                results.append(e)
+        threads = [threading.Thread(target=call, args=(key,)) for key in keys]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_calls_of_the_same_key_share_result(self):
+        calls = []
+
+        def function():
+            calls.append(1)
+            count = len(calls)
+            time.sleep(0.1)
+            return count
+        assert_equals([1, 1, 1], self.run_concurrently(RublonSingleFlight(), ['a'] * 3, function))
+        assert_equals(sorted([2, 3]), sorted(self.run_concurrently(RublonSingleFlight(), ['b', 'c'], function)))
+
+    def test_concurrent_calls_share_exception(self):
+        error = RublonTransportError('Timeout.')
+
+        def function():
+            time.sleep(0.1)
+            raise error
+        single_flight = RublonSingleFlight()
+        assert_equals([error] * 3, self.run_concurrently(single_flight, ['a'] * 3, function))
+        assert_equals(0, single_flight.get_in_flight_count())
+
+    def test_request_key_ignores_params_order(self):
+        consumer = self.get_rublon2factor()
+        first = RublonAPICheckUserDevice(consumer, 1, 2).add_request_params({'a': 1, 'b': 2})
+        second = RublonAPICheckUserDevice(consumer, 1, 2).add_request_params({'b': 2, 'a': 1})
+        assert_equals(first.get_request_key(), second.get_request_key())
+        assert first.get_request_key() != RublonAPICheckUserDevice(consumer, 1, 3).get_request_key()
+
+
+class RublonMetricsTests(RublonTestBase):
+
+    def setUp(self):
+        self.metrics = RublonMetrics(buckets=(0.1, 1))
+        self.transport = RublonMemoryTransport(self.secret_key).set_result(
+            RublonAPIGetAvailableFeatures.url_path, {'features': {}})
+        self.consumer = self.get_rublon2factor().set_transport(self.transport).set_metrics(self.metrics)
+
+    def test_records_requests_errors_and_response_sizes_per_endpoint(self):
+        RublonAPIGetAvailableFeatures(self.consumer).perform()
+        RublonAPIGetAvailableFeatures(self.consumer).perform()
+        assert_raises(UserNotFound_RublonAPIException, RublonApiCredentials(self.consumer, 'a' * 100).perform)
+
+        snapshot = self.metrics.get_snapshot()
+        features = snapshot[RublonAPIGetAvailableFeatures.url_path]
+        assert_equals(2, features['requests'])
+        assert_equals({}, features['errors'])
+        assert_equals((float('inf'), 2), features['latency_buckets'][-1])
+        assert features['response_size_sum'] > 0
+        credentials = snapshot[RublonApiCredentials.url_path]
+        assert_equals({'UserNotFound_RublonAPIException': 1}, credentials['errors'])
+
+        text = self.metrics.get_prometheus_text()
+        assert 'rublon_api_requests_total{endpoint="/api/v3/getAvailableFeatures"} 2\n' in text
+        assert 'rublon_api_request_duration_seconds_bucket{endpoint="/api/v3/getAvailableFeatures",le="+Inf"} 2\n' \
+               in text
+        assert 'rublon_api_errors_total{endpoint="/api/v3/credentials",exception="UserNotFound_RublonAPIException"} 1\n' \
+               in text
+
+    def test_disabled_metrics_measure_nothing(self):
+        client = RublonAPIGetAvailableFeatures(self.consumer.set_metrics(None)).perform()
+        assert client.get_metrics() is None
+        assert client.transfer_info is None
+        assert_equals({}, self.metrics.get_snapshot())
+
+    def test_records_connection_reuse(self):
+        for transport in [RublonHTTPTransport(), RublonCurlTransport(pool=RublonCurlPool())]:
+            self.metrics.reset()
+            with RublonStubServer(self.secret_key, {RublonAPIGetAvailableFeatures.url_path: {'features': {}}}) \
+                    as server:
+                self.consumer.api_server = server.get_url()
+                self.consumer.set_transport(transport)
+                for _ in range(4):
+                    RublonAPIGetAvailableFeatures(self.consumer).perform()
+            transport.close()
+            assert_equals(0.75, self.metrics.get_connection_reuse_ratio())
+
+    def test_statsd_exporter_sends_datagrams(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0))
+        receiver.settimeout(5)
+        exporter = RublonStatsDExporter('127.0.0.1', receiver.getsockname()[1])
+        self.metrics.add_exporter(exporter)
+        try:
+            assert_raises(UserNotFound_RublonAPIException, RublonApiCredentials(self.consumer, 'a' * 100).perform)
+            lines = receiver.recv(4096).decode('utf-8').split('\n')
+        finally:
+            exporter.close()
+            receiver.close()
+        assert_equals('rublon.api.v3.credentials.requests:1|c', lines[0])
+        assert lines[1].startswith('rublon.api.v3.credentials.latency:')
+        assert 'rublon.api.v3.credentials.errors.UserNotFound_RublonAPIException:1|c' in lines
+
+    def test_prometheus_server_serves_metrics(self):
+        RublonAPIGetAvailableFeatures(self.consumer).perform()
+        server = start_prometheus_server(self.metrics, 0, '127.0.0.1')
+        try:
+            response = urlopen('http://127.0.0.1:{0}/metrics'.format(server.server_address[1]), timeout=5)
+            text = response.read().decode('utf-8')
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert_equals(self.metrics.get_prometheus_text(), text)
+
+
+class RublonTracingTests(RublonTestBase):
+
+    def setUp(self):
+        self.tracer = RublonRecordingTracer()
+        self.transport = RublonMemoryTransport(self.secret_key).set_result(
+            RublonAPIGetAvailableFeatures.url_path, {'features': {}})
+        self.consumer = self.get_rublon2factor().set_transport(self.transport).set_tracer(self.tracer)
+
+    def get_phases(self, request_span):
+        return [span.name for span in self.tracer.get_spans() if span.parent is request_span]
+
+    def test_request_span_has_phases_of_the_sdk_work(self):
+        RublonAPIGetAvailableFeatures(self.consumer).perform()
+        request_span, = self.tracer.get_spans('rublon.request')
+        assert_equals(['rublon.build_request', 'rublon.sign_message', 'rublon.validate_response'],
+                      self.get_phases(request_span))
+        assert_equals(200, request_span.attributes['http.status_code'])
+        assert_equals(RublonAPIGetAvailableFeatures.url_path, request_span.attributes['rublon.endpoint'])
+        assert all(span.end_time is not None for span in self.tracer.get_spans())
+
+    def test_error_is_recorded_on_request_span(self):
+        assert_raises(UserNotFound_RublonAPIException, RublonApiCredentials(self.consumer, 'a' * 100).perform)
+        request_span, = self.tracer.get_spans('rublon.request')
+        validate_span, = self.tracer.get_spans('rublon.validate_response')
+        assert isinstance(request_span.exception, UserNotFound_RublonAPIException)
+        assert validate_span.exception is request_span.exception
+
+    def test_request_span_is_child_of_current_span(self):
+        parent = self.tracer.start_span('login')
+        with use_span(parent):
+            RublonAPIGetAvailableFeatures(self.consumer).perform()
+            assert get_current_span() is parent
+        assert get_current_span() is None
+        assert self.tracer.get_spans('rublon.request')[0].parent is parent
+
+    def test_transfer_phases_are_measured_by_transport(self):
+        for transport in [RublonCurlTransport(pool=RublonCurlPool()), RublonHTTPTransport()]:
+            self.tracer.clear()
+            with RublonStubServer(self.secret_key, {RublonAPIGetAvailableFeatures.url_path: {'features': {}}}) \
+                    as server:
+                self.consumer.api_server = server.get_url()
+                self.consumer.set_transport(transport)
+                for _ in range(2):
+                    RublonAPIGetAvailableFeatures(self.consumer).perform()
+            transport.close()
+
+            first, second = self.tracer.get_spans('rublon.request')
+            assert_equals(False, first.attributes['rublon.connection_reused'])
+            assert_equals(True, second.attributes['rublon.connection_reused'])
+            assert 'rublon.connect' in self.get_phases(first)
+            assert 'rublon.connect' not in self.get_phases(second)
+            assert 'rublon.time_to_first_byte' in self.get_phases(second)
+            for span in self.tracer.get_spans():
+                if span.parent is not None:
+                    assert span.parent.start_time <= span.start_time <= span.end_time <= span.parent.end_time
+
+    @unittest.skipIf(InMemorySpanExporter is None, 'opentelemetry-sdk is not installed')
+    def test_opentelemetry_spans_are_children_of_callers_span(self):
+        exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+        tracer = provider.get_tracer('test')
+        self.consumer.set_tracer(RublonOpenTelemetryTracer(tracer))
+        with tracer.start_as_current_span('login') as parent:
+            assert_raises(UserNotFound_RublonAPIException, RublonApiCredentials(self.consumer, 'a' * 100).perform)
+
+        spans = dict((span.name, span) for span in exporter.get_finished_spans())
+        request_span = spans['rublon.request']
+        assert_equals(parent.get_span_context().trace_id, request_span.context.trace_id)
+        assert_equals(parent.get_span_context().span_id, request_span.parent.span_id)
+        assert_equals(request_span.context.span_id, spans['rublon.sign_message'].parent.span_id)
+        assert not request_span.status.is_ok
+
+
+class RublonTLSTests(RublonTestBase):
+
+    certfile = os.path.join(os.path.dirname(__file__), 'stub_cert.pem')
+    keyfile = os.path.join(os.path.dirname(__file__), 'stub_key.pem')
+
+    def setUp(self):
+        self.server = RublonStubServer(self.secret_key, {RublonApiCredentials.url_path: {'userId': 1}},
+                                       certfile=self.certfile, keyfile=self.keyfile)
+        with open(self.certfile) as f:
+            self.pin = get_public_key_pin(ssl.PEM_cert_to_DER_cert(f.read()))
+
+    def perform(self, transport, requests=1):
+        consumer = Rublon2Factor(self.system_token, self.secret_key, self.server.get_url()).set_transport(transport)
+        for _ in range(requests):
+            assert_equals(1, RublonApiCredentials(consumer, 'a' * 100).perform().get_user_id())
+
+    def test_new_curl_handles_resume_shared_tls_session(self):
+        with self.server:
+            self.perform(RublonCurlTransport(self.certfile, RublonCurlPool(max_size=0)), 3)
+        assert_equals(3, self.server.connections)
+        assert_equals(2, self.server.resumed)
+
+    @unittest.skipIf(sys.version_info < (3, 6), 'TLS session resumption requires Python 3.6+')
+    def test_new_http_connections_resume_tls_session(self):
+        with self.server:
+            self.perform(RublonHTTPTransport(self.certfile, max_size=0), 3)
+        assert_equals(3, self.server.connections)
+        assert_equals(2, self.server.resumed)
+
+    def test_pinned_public_key_is_accepted(self):
+        with self.server:
+            self.perform(RublonCurlTransport(self.certfile, RublonCurlPool(), [self.pin]))
+            self.perform(RublonHTTPTransport(self.certfile, pinned_public_keys=[self.pin]))
+
+    def test_other_public_key_is_rejected(self):
+        pins = ['sha256//' + 'A' * 43 + '=']
+        with self.server:
+            assert_raises(RublonClientException, self.perform,
+                          RublonCurlTransport(self.certfile, RublonCurlPool(), pins))
+            assert_raises(RublonClientException, self.perform,
+                          RublonHTTPTransport(self.certfile, pinned_public_keys=pins))
+
+
+class RublonBatchExecutorTests(RublonTestBase):
+
+    def setUp(self):
+        self.server = RublonStubServer(self.secret_key, {
+            RublonApiCredentials.url_path: {'userId': 1},
+            RublonAPIGetAvailableFeatures.url_path: {'features': {'remoteLogout': True}},
+        })
+
+    def test_results_and_errors_are_returned_per_client(self):
+        with self.server:
+            consumer = Rublon2Factor(self.system_token, self.secret_key, self.server.get_url())
+            clients = [RublonApiCredentials(consumer, 'a' * 100) for _ in range(5)]
+            clients.insert(2, RublonAPIGetAvailableFeatures(consumer))
+            clients.append(RublonApiCredentials(consumer, 'a' * 100).set_request_url(self.server.get_url() + '/x'))
+            results = RublonBatchExecutor(concurrency=3).execute(clients)
+
+        assert_equals(clients, [result.client for result in results])
+        assert_equals([None] * 6, [result.error for result in results[:-1]])
+        assert_equals({'remoteLogout': True}, results[2].client.get_features())
+        assert_equals(1, results[0].client.get_user_id())
+        assert isinstance(results[-1].error, UserNotFound_RublonAPIException)
+        assert self.server.connections <= 3
+
+    def test_transfer_error_is_returned_as_client_exception(self):
+        with self.server:
+            url = self.server.get_url()
+        consumer = Rublon2Factor(self.system_token, self.secret_key, url)
+        results = RublonBatchExecutor().execute([RublonAPIGetAvailableFeatures(consumer)])
+        assert isinstance(results[0].error, RublonClientException)
+
+
+    def test_waits_for_sockets_when_curl_has_no_timeout(self):
+        class Multi(object):
+            def __init__(self, multi):
+                self.multi = multi
+                self.selects = []
+
+            def __getattr__(self, name):
+                return getattr(self.multi, name)
+
+            def timeout(self):
+                return -1
+
+            def select(self, timeout):
+                self.selects.append(timeout)
+                return self.multi.select(timeout)
+
+        executor = RublonBatchExecutor()
+        multi = Multi(executor._get_multi())
+        executor._get_multi = lambda: multi
+        self.server.latency = 0.1
+        with self.server:
+            consumer = Rublon2Factor(self.system_token, self.secret_key, self.server.get_url())
+            results = executor.execute([RublonApiCredentials(consumer, 'a' * 100)])
+        assert_equals(None, results[0].error)
+        assert 0 < len(multi.selects) < 10
+        assert_equals(set([RublonBatchExecutor.SELECT_TIMEOUT]), set(multi.selects))
+
+
+    def test_unexpected_validation_error_fails_only_its_client(self):
+        with self.server:
+            consumer = Rublon2Factor(self.system_token, self.secret_key, self.server.get_url())
+            clients = [RublonApiCredentials(consumer, 'a' * 100) for _ in range(3)]
+            clients[1]._validate_response = Mock(side_effect=AttributeError('get'))
+            results = RublonBatchExecutor().execute(clients)
+        assert_equals([None, AttributeError, None],
+                      [None if result.error is None else result.error.__class__ for result in results])
+
+
+class RublonBulkDeviceCheckTests(RublonTestBase):
+
+    def setUp(self):
+        self.server = RublonStubServer(self.secret_key, {RublonAPICheckUserDevice.url_path: {'deviceActive': True}})
+        self.pairs = [(1, 10), (2, 20), (1, 10), (3, 30), (2, 20)]
+
+    def test_distinct_pairs_are_checked_once(self):
+        with self.server:
+            consumer = Rublon2Factor(self.system_token, self.secret_key, self.server.get_url())
+            check = RublonBulkDeviceCheck(consumer, RublonBatchExecutor(concurrency=2), RublonMemoryCache())
+            statuses = list(check.check(self.pairs))
+        assert_equals([(1, 10), (2, 20), (3, 30)],
+                      sorted((status.profile_id, status.device_id) for status in statuses))
+        assert all(status.is_device_active() for status in statuses)
+        assert_equals(3, len(self.server.requests))
+
+    def test_all_pairs_are_checked_concurrently(self):
+        self.server.latency = 0.2
+        read = []
+
+        def pairs():
+            for i in range(8):
+                read.append(i)
+                yield i, i
+        with self.server:
+            consumer = Rublon2Factor(self.system_token, self.secret_key, self.server.get_url())
+            check = RublonBulkDeviceCheck(consumer, RublonBatchExecutor(concurrency=4), RublonMemoryCache())
+            start = time.time()
+            statuses = check.check(pairs())
+            next(statuses)
+            assert_equals(4, len(read))
+            assert_equals(7, len(list(statuses)))
+            assert time.time() - start < 0.6
+        assert_equals(8, len(self.server.requests))
+
+    def test_statuses_are_cached(self):
+        with self.server:
+            consumer = Rublon2Factor(self.system_token, self.secret_key, self.server.get_url())
+            check = RublonBulkDeviceCheck(consumer, cache=RublonMemoryCache())
+            list(check.check(self.pairs))
+            statuses = list(check.check(self.pairs))
+        assert_equals(3, len(statuses))
+        assert_equals(3, len(self.server.requests))
+
+    def test_failed_checks_are_returned_with_error(self):
+        with self.server:
+            url = self.server.get_url()
+        consumer = Rublon2Factor(self.system_token, self.secret_key, url)
+        statuses = list(RublonBulkDeviceCheck(consumer, cache=RublonMemoryCache()).check(self.pairs))
+        assert_equals(3, len(statuses))
+        assert all(status.active is None and isinstance(status.error, RublonClientException) for status in statuses)
@@ -1,10 +1,27 @@
 from ..import RublonTestBase
 from nose.tools import assert_not_equals, assert_equals, assert_raises
 from mock import Mock, patch
+import os
+import sys
+import hmac
 import json
+import unittest
+import hashlib
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
+from six.moves import socketserver
 
 from rublon.exceptions import RublonException
+from rublon.functions import set_json_backend, JSON_BACKENDS
 from rublon.core.signature_wrapper import RublonSignatureWrapper
+from rublon import Rublon2Factor
+from rublon.core.api.credentials import RublonApiCredentials
+from rublon.core.signer import RublonSigner, get_signer
+from rublon.core.cache import RublonMemoryCache, get_shared_cache, _RublonOrderedDict
+from rublon.core.cache_backends import RublonSQLiteCache, RublonRedisCache
 
 
 class RublonSignatureWrapperTests(RublonTestBase):
@@ -60,6 +77,13 @@ class RublonSignatureWrapperTests(RublonTestBase):
         sign2 = self.signature_wrapper.sign_data(data, 'secret')
         assert_equals(sign1, sign2)
 
+    def test_verify_data_rejects_non_string_signature(self):
+        data = json.dumps({'bodyfield': 1})
+        for signature in [123, ['a'], {'a': 1}]:
+            assert not self.signature_wrapper.verify_data(data, 'secret', signature)
+        message = json.dumps({'data': data, 'sign': 123})
+        assert_raises(RublonException, self.signature_wrapper.parse_message, message, 'secret')
+
     def test_parse_message_raises_exceptions_when_given_empty_secret_key(self):
         assert_raises(RublonException, self.signature_wrapper.parse_message, '{}', '')
 
@@ -168,7 +192,346 @@ class RublonSignatureWrapperTests(RublonTestBase):
         assert isinstance(result, dict)
         assert_equals(result['key'], 'value')
 
+    def test_parse_message_returns_body_of_wrapped_message(self):
+        json_str = json.dumps(RublonSignatureWrapper.wrap('secret', {'key': 'value'}))
+        assert_equals({'key': 'value'}, self.signature_wrapper.parse_message(json_str, 'secret'))
+
+    def test_parse_decodes_body_on_first_access(self):
+        json_str = json.dumps(RublonSignatureWrapper.wrap('secret', {'key': 'value'}))
+        message = RublonSignatureWrapper.parse(json_str, 'secret')
+        assert_equals('{"key": "value"}', message.get_raw_body())
+        with patch('rublon.core.signature_wrapper.json_loads', Mock(return_value={'key': 'value'})) as loads:
+            message.get_body()
+            message.get_body()
+        assert_equals(1, loads.call_count)
+
+    def test_parse_message_with_every_json_backend(self):
+        json_str = json.dumps(RublonSignatureWrapper.wrap('secret', {'key': 'value'}))
+        for backend in JSON_BACKENDS:
+            try:
+                set_json_backend(backend)
+            except ImportError:
+                continue
+            try:
+                assert_equals({'key': 'value'}, self.signature_wrapper.parse_message(json_str, 'secret'))
+                assert_raises(RublonException, self.signature_wrapper.parse_message, 'lalal', 'secret')
+            finally:
+                set_json_backend()
+
+    def test_parse_messages_returns_result_per_message(self):
+        valid = json.dumps(RublonSignatureWrapper.wrap('secret', {'key': 'value'}))
+        forged = json.dumps(RublonSignatureWrapper.wrap('other', {'key': 'value'}))
+        results = RublonSignatureWrapper.parse_messages([valid, forged, '', valid], 'secret')
+        assert_equals([True, False, False, True], [result.is_valid() for result in results])
+        assert_equals({'key': 'value'}, results[0].get_body())
+        assert_equals('Invalid signature', results[1].get_error().message)
+        assert_equals(RublonException.CODE_INVALID_RESPONSE, results[2].get_error().code)
+
+    def test_parse_messages_isolates_malformed_messages(self):
+        valid = json.dumps(RublonSignatureWrapper.wrap('secret', {'key': 'value'}))
+        data = json.dumps({'head': {'size': 5, 'time': 'now'}, 'body': 'hello'})
+        bad_time = json.dumps({'data': data, 'sign': RublonSignatureWrapper.sign_data(data, 'secret')})
+        bad_sign = json.dumps({'data': 'x', 'sign': 123})
+        bad_data = json.dumps({'data': {'head': {}}, 'sign': 'abc'})
+        results = RublonSignatureWrapper.parse_messages([valid, bad_sign, bad_data, bad_time, valid], 'secret')
+        assert_equals([True, False, False, False, True], [result.is_valid() for result in results])
+        for result in results[1:4]:
+            assert_equals(RublonException.CODE_INVALID_RESPONSE, result.get_error().code)
+        assert_equals({'key': 'value'}, results[4].get_body())
+
+    @unittest.skipIf(sys.version_info < (3, 2), 'concurrent.futures requires Python 3.2+')
+    def test_parse_messages_in_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        messages = [json.dumps(RublonSignatureWrapper.wrap('secret', {'i': i})) for i in range(100)] + ['x']
+        with ThreadPoolExecutor(4) as executor:
+            results = RublonSignatureWrapper.parse_messages(iter(messages), 'secret', executor=executor)
+        assert_equals(list(range(100)), [result.get_body()['i'] for result in results[:-1]])
+        assert not results[-1].is_valid()
+
     def test_generating_random_string(self):
         str1 = RublonSignatureWrapper.generate_random_string()
         str2 = RublonSignatureWrapper.generate_random_string()
-        assert_not_equals(str1, str2)
\ No newline at end of file
+        assert_not_equals(str1, str2)
+
+
+class RublonMemoryCacheTests(RublonTestBase):
+
+    def setUp(self):
+        self.cache = RublonMemoryCache(max_size=2, ttl=60)
+
+    def test_get_returns_stored_value(self):
+        self.cache.set('key', 'value')
+        assert_equals('value', self.cache.get('key'))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        assert_equals(1, self.cache.get('a'))
+        assert_equals(None, self.cache.get('b'))
+        assert_equals(2, len(self.cache))
+
+    def test_expired_entry_is_not_returned(self):
+        self.cache.set('key', 'value')
+        with patch('rublon.core.cache.time.time', Mock(return_value=time.time() + 61)):
+            assert_equals(None, self.cache.get('key'))
+
+    def test_stats_count_hits_and_misses(self):
+        self.cache.set('key', 'value')
+        self.cache.get('key')
+        self.cache.get('other')
+        stats = self.cache.get_stats()
+        assert_equals(1, stats['hits'])
+        assert_equals(1, stats['misses'])
+
+    def test_lru_works_without_collections_ordered_dict(self):
+        self.cache._data = _RublonOrderedDict()
+        self.test_least_recently_used_entry_is_evicted()
+        self.cache.delete('a')
+        assert_equals(['c'], list(self.cache._data))
+        assert_equals(('c', self.cache._data['c']), self.cache._data.popitem())
+        self.cache.clear()
+        assert_equals(0, len(self.cache))
+
+    def test_shared_cache_is_returned_by_name(self):
+        assert get_shared_cache('test/shared') is get_shared_cache('test/shared')
+        assert get_shared_cache('test/shared') is not get_shared_cache('test/other')
+
+
+class RublonFeaturesCacheTests(RublonTestBase):
+
+    def setUp(self):
+        self.consumer = Rublon2Factor(self.system_token, self.secret_key).set_features_cache(RublonMemoryCache())
+        self.consumer.fetch_features = Mock(return_value={'remoteLogout': True})
+
+    def test_features_are_fetched_once(self):
+        assert_equals({'remoteLogout': True}, self.consumer.get_features())
+        assert_equals({'remoteLogout': True}, self.consumer.get_features())
+        assert_equals(1, self.consumer.fetch_features.call_count)
+
+    def refresh_expired_features(self, *consumers):
+        """Get the features of the consumers once after they expired, wait for their refresh."""
+        later = time.time() + Rublon2Factor.FEATURES_CACHE_TTL + 1
+        with patch('rublon.core.cache.time.time', Mock(return_value=later)):
+            stale = [consumer.get_features() for consumer in consumers]
+        for _ in range(100):
+            if all(consumer.get_features() != features for consumer, features in zip(consumers, stale)):
+                break
+            time.sleep(0.01)
+        return stale
+
+    def test_expired_features_are_served_while_refreshed(self):
+        self.consumer.get_features()
+        self.consumer.fetch_features.return_value = {'remoteLogout': False}
+        assert_equals([{'remoteLogout': True}], self.refresh_expired_features(self.consumer))
+        assert_equals({'remoteLogout': False}, self.consumer.get_features())
+
+    def test_invalidated_features_are_fetched_again(self):
+        self.consumer.get_features()
+        self.consumer.invalidate_features()
+        self.consumer.get_features()
+        assert_equals(2, self.consumer.fetch_features.call_count)
+
+    def test_features_are_cached_per_api_domain(self):
+        other = Rublon2Factor(self.system_token, self.secret_key, 'https://rublon.example.com')
+        other.set_features_cache(self.consumer.get_features_cache())
+        other.fetch_features = Mock(return_value={'remoteLogout': False})
+        assert_not_equals(self.consumer.get_features_cache_key(), other.get_features_cache_key())
+        assert_equals({'remoteLogout': True}, self.consumer.get_features())
+        assert_equals({'remoteLogout': False}, other.get_features())
+
+        self.consumer.fetch_features.return_value = {'remoteLogout': 1}
+        other.fetch_features.return_value = {'remoteLogout': 2}
+        self.refresh_expired_features(self.consumer, other)
+        assert_equals({'remoteLogout': 1}, self.consumer.get_features())
+        assert_equals({'remoteLogout': 2}, other.get_features())
+
+    def test_same_key_of_other_cache_is_refreshed_concurrently(self):
+        other = Rublon2Factor(self.system_token, self.secret_key).set_features_cache(RublonMemoryCache())
+        other.fetch_features = Mock(return_value={'remoteLogout': True})
+        self.consumer.get_features()
+        other.get_features()
+        assert_equals(self.consumer.get_features_cache_key(), other.get_features_cache_key())
+
+        def fetch_features():
+            time.sleep(0.1)
+            return {'remoteLogout': False}
+        self.consumer.fetch_features.side_effect = other.fetch_features.side_effect = fetch_features
+        # The second refresh starts while the first one is still running.
+        self.refresh_expired_features(self.consumer, other)
+        assert_equals({'remoteLogout': False}, self.consumer.get_features())
+        assert_equals({'remoteLogout': False}, other.get_features())
+
+
+class RedisStandIn(object):
+    """Minimal in-memory Redis protocol server: GET, SET [PX], DEL, SCAN."""
+
+    def __init__(self):
+        self.data = {}
+        stand_in = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    args = []
+                    for _ in range(int(line[1:])):
+                        size = int(self.rfile.readline()[1:])
+                        args.append(self.rfile.read(size + 2)[:-2])
+                    self.wfile.write(stand_in.execute(args))
+
+        class Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+            daemon_threads = True
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.port = self.server.server_address[1]
+
+    def execute(self, args):
+        command = args[0].upper()
+        if command == b'GET':
+            value = self.data.get(args[1])
+            return b'$-1\r\n' if value is None else b'$' + str(len(value)).encode() + b'\r\n' + value + b'\r\n'
+        elif command == b'SET':
+            self.data[args[1]] = args[2]
+            return b'+OK\r\n'
+        elif command == b'DEL':
+            removed = [self.data.pop(key) for key in args[1:] if key in self.data]
+            return b':' + str(len(removed)).encode() + b'\r\n'
+        elif command == b'SCAN':
+            prefix = args[3][:-1]
+            keys = [key for key in self.data if key.startswith(prefix)]
+            return b'*2\r\n$1\r\n0\r\n*' + str(len(keys)).encode() + b'\r\n' + b''.join(
+                b'$' + str(len(key)).encode() + b'\r\n' + key + b'\r\n' for key in keys)
+        return b'-ERR unknown command\r\n'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, args=(0.01,)).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class RublonSharedCacheBackendsTests(RublonTestBase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.payload = {'status': 'HTTP/1.1 200 OK', 'code': '200', 'headers': {}, 'body': '{}',
+                        'response': {'status': 'OK', 'result': {'userId': 1}}}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sqlite_cache_is_shared_between_instances(self):
+        path = os.path.join(self.directory, 'cache.sqlite')
+        RublonSQLiteCache(path).set('key', self.payload)
+        assert_equals(self.payload, RublonSQLiteCache(path).get('key'))
+
+    def test_sqlite_cache_expires_entries(self):
+        cache = RublonSQLiteCache(os.path.join(self.directory, 'cache.sqlite'), ttl=60)
+        cache.set('key', self.payload)
+        with patch('rublon.core.cache_backends.time.time', Mock(return_value=time.time() + 61)):
+            assert_equals(None, cache.get('key'))
+
+    def test_sqlite_cache_is_a_miss_when_database_is_locked(self):
+        path = os.path.join(self.directory, 'cache.sqlite')
+        lock = sqlite3.connect(path, isolation_level=None)
+        lock.execute('PRAGMA locking_mode=EXCLUSIVE')
+        lock.execute('BEGIN EXCLUSIVE')
+        lock.execute('CREATE TABLE other (id INTEGER)')
+        try:
+            locked = RublonSQLiteCache(path, timeout=0.01)
+            assert_equals(None, locked.get('key'))
+            locked.set('other', self.payload)
+            locked.delete('key')
+            locked.clear()
+            assert_equals(4, locked.get_stats()['errors'])
+        finally:
+            lock.rollback()
+            lock.close()
+        cache = RublonSQLiteCache(path)
+        cache.set('key', self.payload)
+        assert_equals(self.payload, cache.get('key'))
+
+    def test_sqlite_cache_is_a_miss_when_database_is_corrupt(self):
+        path = os.path.join(self.directory, 'cache.sqlite')
+        with open(path, 'wb') as f:
+            f.write(b'not a database' * 100)
+        cache = RublonSQLiteCache(path)
+        assert_equals(None, cache.get('key'))
+        cache.set('key', self.payload)
+        assert_equals(2, cache.get_stats()['errors'])
+
+    def test_redis_cache_clear_is_a_no_op_when_server_is_down(self):
+        with RedisStandIn() as server:
+            port = server.port
+        cache = RublonRedisCache(port=port)
+        cache.clear()
+        assert_equals(1, cache.get_stats()['errors'])
+
+    def test_redis_cache_round_trip(self):
+        with RedisStandIn() as server:
+            cache = RublonRedisCache(port=server.port)
+            cache.set('key', self.payload)
+            assert_equals(self.payload, RublonRedisCache(port=server.port).get('key'))
+            cache.delete('key')
+            assert_equals(None, cache.get('key'))
+
+    def test_redis_cache_clear_removes_prefixed_keys_only(self):
+        with RedisStandIn() as server:
+            server.data[b'other:key'] = b'1'
+            cache = RublonRedisCache(port=server.port)
+            cache.set('a', 1)
+            cache.set('b', 2)
+            cache.clear()
+            assert_equals([b'other:key'], list(server.data))
+
+    def test_redis_cache_is_a_miss_when_server_is_down(self):
+        with RedisStandIn() as server:
+            port = server.port
+        cache = RublonRedisCache(port=port)
+        assert_equals(None, cache.get('key'))
+        assert_equals(1, cache.get_stats()['errors'])
+
+    def test_credentials_are_restored_from_shared_cache_without_api_call(self):
+        cache = RublonSQLiteCache(os.path.join(self.directory, 'cache.sqlite'))
+        first = Rublon2Factor(self.system_token, self.secret_key).set_credentials_cache(cache)
+        credentials = RublonApiCredentials(first, 'c' * 100)
+        credentials.set_cache_payload(self.payload)
+        first.store_cached_credentials(credentials, 'c' * 100)
+
+        second = Rublon2Factor(self.system_token, self.secret_key).set_credentials_cache(
+            RublonSQLiteCache(cache.path))
+        with patch.object(RublonApiCredentials, 'perform', Mock(side_effect=AssertionError)):
+            assert_equals(1, second.get_credentials('c' * 100).get_user_id())
+
+
+class RublonSignerTests(RublonTestBase):
+
+    def test_signature_equals_plain_hmac(self):
+        expected = hmac.new(b'secret', b'data', hashlib.sha256).hexdigest()
+        assert_equals(expected, RublonSigner('secret').sign('data'))
+        assert_equals(expected, RublonSigner('secret').sign(b'data'))
+
+    def test_signer_can_be_reused(self):
+        signer = RublonSigner('secret')
+        assert_equals(signer.sign('data'), signer.sign('data'))
+        assert_not_equals(signer.sign('data'), signer.sign('other'))
+
+    def test_verify(self):
+        signer = RublonSigner('secret')
+        assert signer.verify('data', signer.sign('data'))
+        assert not signer.verify('data', signer.sign('other'))
+        assert not signer.verify('data', None)
+
+    def test_get_signer_returns_cached_signer(self):
+        assert get_signer('secret') is get_signer('secret')
+        assert get_signer('secret') is not get_signer('other')
+
+    def test_consumer_signs_with_its_secret_key(self):
+        consumer = Rublon2Factor(self.system_token, 'secret')
+        assert_equals(RublonSigner('secret').sign('data'), consumer.get_signer().sign('data'))
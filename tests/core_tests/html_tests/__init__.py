@@ -1,5 +1,15 @@
+from base64 import b64decode
+from mock import patch
+from nose.tools import assert_equals
 from ..import RublonTestBase
+from rublon.core.auth_params import RublonAuthParams
+from rublon.core.cache import RublonMemoryCache
 from rublon.core.html.widget import RublonWidget
+from rublon.core.html.button import RublonButton
+from rublon.core.html.login_box import RublonLoginBox
+from rublon.core.html.device_widget import RublonDeviceWidget
+from rublon.core.html.consumer_script import RublonConsumerScript
+from rublon.core.signature_wrapper import RublonSignatureWrapper
 
 
 class RublonAbstractWidgetTests(RublonTestBase):
@@ -10,4 +20,69 @@ class RublonAbstractWidgetTests(RublonTestBase):
     def test_create_attributes_string(self):
         result = self.widget.create_attributes_string({'key': 'value', 'zone': 'area'})
         assert 'key="value"' in result
-        assert 'zone="area"' in result
\ No newline at end of file
+        assert 'zone="area"' in result
+
+
+class RublonConsumerScriptCacheTests(RublonTestBase):
+
+    def setUp(self):
+        self.consumer = self.get_rublon2factor().set_consumer_script_cache(RublonMemoryCache())
+
+    def get_wrapper(self, user_id, user_email):
+        return RublonConsumerScript(self.consumer, user_id, user_email).get_encoded_params_wrapper()
+
+    def test_signed_params_are_reused_for_the_same_user(self):
+        wrapper = self.get_wrapper(1, 'john.doe@example.com')
+        assert_equals(wrapper, self.get_wrapper(1, 'john.doe@example.com'))
+        assert wrapper != self.get_wrapper(1, 'jane.doe@example.com')
+        assert wrapper != self.get_wrapper(2, 'john.doe@example.com')
+        message = RublonSignatureWrapper.parse(b64decode(wrapper).decode('utf-8'), self.secret_key)
+        assert_equals(1, message.get_body()[RublonAuthParams.FIELD_USER_ID])
+
+    def test_signed_params_are_not_reused_after_ttl(self):
+        self.consumer.CONSUMER_SCRIPT_CACHE_TTL = -1
+        self.get_wrapper(1, 'john.doe@example.com')
+        self.get_wrapper(1, 'john.doe@example.com')
+        assert_equals(0, self.consumer.get_consumer_script_cache().hits)
+
+
+class RublonWidgetRenderTests(RublonTestBase):
+
+    def test_static_widgets_are_rendered_once(self):
+        assert_equals('<iframe id="RublonDeviceWidget"></iframe>', str(RublonDeviceWidget()))
+        with patch.object(RublonDeviceWidget, 'render') as render:
+            assert_equals('<iframe id="RublonDeviceWidget"></iframe>', str(RublonDeviceWidget()))
+        assert not render.called
+
+    def test_subclasses_of_static_widgets_are_not_cached(self):
+        class ColoredDeviceWidget(RublonDeviceWidget):
+            def get_widget_css_attributes(self):
+                return {RublonWidget.WIDGET_CSS_FONT_COLOR: self.color}
+
+        str(RublonDeviceWidget())
+        for color in ('red', 'blue'):
+            widget = ColoredDeviceWidget()
+            widget.color = color
+            assert_equals('<iframe id="RublonDeviceWidget" data-font-color="{0}"></iframe>'.format(color), str(widget))
+
+    def test_dynamic_widget_attributes_are_escaped(self):
+        assert 'data-login-url="https://example.com/?a=1&amp;b=&quot;2&quot;"' in \
+            str(RublonLoginBox('https://example.com/?a=1&b="2"'))
+
+
+class RublonButtonTests(RublonTestBase):
+
+    def setUp(self):
+        self.button = RublonButton(self.get_rublon2factor())
+
+    def test_render_does_not_change_button(self):
+        self.button.set_attribute('class', 'custom').set_label('Log in')
+        html = str(self.button)
+        assert_equals(html, str(self.button))
+        assert_equals('custom', self.button.get_attribute('class'))
+        assert 'class="rublon-button custom rublon-button-size-medium rublon-button-color-dark"' in html
+        assert 'title="Log in"' in html
+
+    def test_buttons_have_own_attributes(self):
+        self.button.set_attribute('style', 'color: red')
+        assert_equals(None, RublonButton(self.get_rublon2factor()).get_attribute('style'))
@@ -0,0 +1,106 @@
+"""Local stand-in for the Rublon API, so full perform() round trips can be tested (and benchmarked) offline."""
+import json
+import time
+import threading
+
+from six.moves import BaseHTTPServer, socketserver
+
+from rublon.core.signature_wrapper import RublonSignatureWrapper
+
+
+class RublonStubServer(object):
+    """Keep-alive HTTP server answering API requests with signed responses.
+
+    `results` maps URL paths to the `result` field of the response, unknown paths
+    get a UserNotFound error. Responses are sent after `latency` seconds.
+    HTTPS is served if a certificate file (and its key file) is given.
+
+    The received requests are kept in `requests` as (path, message) pairs.
+    Run it with start() and stop() or as a context manager."""
+
+    def __init__(self, secret_key, results=None, latency=0, certfile=None, keyfile=None):
+        self.secret_key = secret_key
+        self.results = results or {}
+        self.latency = latency
+        self.requests = []
+        self.connections = 0
+        self.heads = 0
+        self.resumed = 0
+        self.certfile = certfile
+        server = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+                server.connections += 1
+                if getattr(self.connection, 'session_reused', False):
+                    server.resumed += 1
+
+            def do_POST(self):
+                message = self.rfile.read(int(self.headers['Content-Length']))
+                server.requests.append((self.path, json.loads(message.decode('utf-8'))))
+                body = server.get_body(self.path)
+                if server.latency:
+                    time.sleep(server.latency)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('X-Rublon-Signature', server.get_signature(self.path))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_HEAD(self):
+                server.heads += 1
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        Server.request_queue_size = 128
+        self.httpd = Server(('127.0.0.1', 0), Handler)
+        if certfile:
+            import ssl
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+        self._bodies = {}
+
+    def get_body(self, path):
+        body = self._bodies.get(path)
+        if body is None:
+            if path in self.results:
+                response = {'status': 'OK', 'result': self.results[path]}
+            else:
+                response = {'status': 'ERROR', 'result': {'exception': 'UserNotFound_RublonAPIException'}}
+            body = self._bodies[path] = json.dumps(response).encode('utf-8')
+        return body
+
+    def get_signature(self, path):
+        return RublonSignatureWrapper.sign_data(self.get_body(path), self.secret_key)
+
+    def get_url(self):
+        return '{0}://127.0.0.1:{1}'.format('https' if self.certfile else 'http', self.httpd.server_address[1])
+
+    def start(self):
+        thread = threading.Thread(target=self.httpd.serve_forever, args=(0.01,))
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()